@@ -0,0 +1,235 @@
+import asyncio
+import contextvars
+import itertools
+import logging
+
+import asyncpg
+from starlette.datastructures import Headers
+
+from config_db import settings
+
+
+_pool = None
+_loop = None
+
+# read-only pools by their database.ini section, plus the state of the lag monitor
+_replicas = {}
+_healthy_replicas = []
+_replica_turn = itertools.count()
+_lag_task = None
+# held by the lag check and by whatever opens or closes the replica pools, so a check that started
+# before a reload can't put a closed pool back among the healthy ones
+_replicas_lock = asyncio.Lock()
+# pool every checked-out connection has to go back to
+_owners = {}
+
+# set per request when the caller needs to read its own writes
+read_primary = contextvars.ContextVar('read_primary', default=False)
+
+# seconds the replica is behind, 0 when it has replayed everything it received, null when its wal receiver
+# is not running: it may have replayed all it got but hears nothing new from the primary
+REPLICA_LAG_SQL = "select case when not pg_is_in_recovery() then 0\
+                               when not exists (select 1 from pg_stat_wal_receiver) then null\
+                               when pg_last_wal_replay_lsn() >= pg_last_wal_receive_lsn() then 0\
+                               else extract(epoch from now() - pg_last_xact_replay_timestamp()) end;"
+
+def _connect_kwargs(params):
+    # database.ini holds libpq keywords for psycopg2, asyncpg names some of them differently
+    kwargs = {}
+    server_settings = {}
+
+    for key, value in params.items():
+        if key in ('host', 'user', 'password'):
+            kwargs[key] = value
+        elif key in ('database', 'dbname'):
+            kwargs['database'] = value
+        elif key == 'port':
+            kwargs['port'] = int(value)
+        elif key == 'sslmode':
+            kwargs['ssl'] = value
+        elif key == 'connect_timeout':
+            kwargs['timeout'] = float(value)
+        elif key == 'application_name':
+            server_settings[key] = value
+        else:
+            logging.warning(f"Async pool ignores database setting '{key}'")
+
+    if server_settings:
+        kwargs['server_settings'] = server_settings
+
+    return kwargs
+
+
+async def _init_connection(conn):
+    # real columns are decoded from text, so values match psycopg2 (3.3 and not 3.299999952316284)
+    await conn.set_type_codec('float4', schema='pg_catalog', encoder=str, decoder=float, format='text')
+
+
+async def _create_pool(params, pool_settings=None):
+    pool_settings = settings.pool() if pool_settings is None else pool_settings
+
+    return await asyncpg.create_pool(min_size=pool_settings['min_size'],
+                                      max_size=pool_settings['max_size'],
+                                      max_inactive_connection_lifetime=pool_settings['max_lifetime'],
+                                      init=_init_connection,
+                                      # only a bigger per-connection statement cache than asyncpg's default of 100, without
+                                      # time-based eviction: it fills as queries run, drops the least recently used statement
+                                      # when full, and Postgres may still plan a cached statement again for each execution
+                                      statement_cache_size=int(settings.get('query', 'statement_cache_size', fallback='256')),
+                                      max_cached_statement_lifetime=0,
+                                      **_connect_kwargs(params))
+
+
+async def connect_primary():
+    # a connection of its own outside the pools, e.g. for LISTEN which has to stay on one session
+    return await asyncpg.connect(**_connect_kwargs(settings.database()))
+
+
+async def open_async_pool():
+    global _pool, _loop, _lag_task
+
+    _loop = asyncio.get_running_loop()
+    _pool = await _create_pool(settings.database())
+
+    await _reopen_replica_pools(settings.replicas())
+    _lag_task = _loop.create_task(_watch_replica_lag())
+
+
+async def close_async_pool():
+    global _pool, _lag_task
+    if _lag_task is not None:
+        _lag_task.cancel()
+        _lag_task = None
+
+    async with _replicas_lock:
+        await _close_replica_pools()
+
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+async def _reopen_replica_pools(replicas, pool_settings=None):
+    async with _replicas_lock:
+        await _close_replica_pools()
+
+        for name, params in replicas.items():
+            try:
+                _replicas[name] = await _create_pool(params, pool_settings)
+            except (OSError, asyncpg.PostgresError):
+                logging.exception(f"Replica {name} is unreachable, its reads go to the primary")
+
+        await _check_replica_lag()
+
+
+async def _close_replica_pools():
+    _healthy_replicas.clear()
+    for name in list(_replicas):
+        await _replicas.pop(name).close()
+
+
+async def _check_replica_lag():
+    # callers hold _replicas_lock
+    max_lag = float(settings.get('replication', 'max_lag', fallback='10'))
+
+    healthy = []
+    for name, pool in list(_replicas.items()):
+        try:
+            async with pool.acquire(timeout=settings.pool()['checkout_timeout']) as conn:
+                lag = await conn.fetchval(REPLICA_LAG_SQL)
+        except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError):
+            logging.warning(f"Replica {name} failed lag check, its reads go to the primary")
+            continue
+
+        if lag is None or lag > max_lag:
+            logging.warning(f"Replica {name} is {lag} seconds behind, its reads go to the primary")
+            continue
+
+        healthy.append(pool)
+
+    _healthy_replicas[:] = healthy
+
+
+async def _watch_replica_lag():
+    while True:
+        await asyncio.sleep(float(settings.get('replication', 'check_interval', fallback='5')))
+        async with _replicas_lock:
+            await _check_replica_lag()
+
+
+async def get_async_connection(read_only=False):
+    settings.maybe_reload()
+
+    pool = _pool
+    # read-only work goes round-robin over replicas that keep up, and to the primary when none does
+    if read_only and _healthy_replicas and not read_primary.get():
+        pool = _healthy_replicas[next(_replica_turn) % len(_healthy_replicas)]
+
+    conn = await pool.acquire(timeout=settings.pool()['checkout_timeout'])
+    _owners[id(conn)] = pool
+    return conn
+
+
+async def release_async_connection(conn):
+    await _owners.pop(id(conn), _pool).release(conn)
+
+
+def wants_primary(read_from):
+    # "primary", " Primary " -> True
+    return read_from is not None and read_from.strip().lower() == "primary"
+
+
+class ReadRoutingMiddleware:
+    # "X-Read-From: primary" sends the request's reads to the primary, e.g. right after a create_sale
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not wants_primary(Headers(scope=scope).get("x-read-from")):
+            await self.app(scope, receive, send)
+            return
+
+        token = read_primary.set(True)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            read_primary.reset(token)
+
+
+def fetch_size():
+    return int(settings.get('query', 'fetch_size', fallback='200'))
+
+
+async def iterate_rows(conn, sql, *args):
+    # server-side cursor, rows come over fetch_size at a time instead of the whole result at once
+    async with conn.transaction(readonly=True):
+        async for row in conn.cursor(sql, *args, prefetch=fetch_size()):
+            yield row
+
+
+def _reconfigure_async_pool(new_settings):
+    # reload may fire from a threadpool thread, the pool belongs to the event loop
+    if _pool is None or _loop is None:
+        return
+
+    async def rebuild_pool():
+        global _pool
+        # asyncpg can't resize a pool, new sizes take a new one, the old one closes once its connections are back
+        old_pool = _pool
+        _pool = await _create_pool(new_settings.database(), new_settings.pool())
+        await old_pool.close()
+
+    def reconfigure():
+        pool_settings = new_settings.pool()
+        if (pool_settings['min_size'], pool_settings['max_size']) != (_pool.get_min_size(), _pool.get_max_size()):
+            _loop.create_task(rebuild_pool())
+        else:
+            _pool.set_connect_args(**_connect_kwargs(new_settings.database()))
+            # in-use connections are replaced once they are released
+            _loop.create_task(_pool.expire_connections())
+        _loop.create_task(_reopen_replica_pools(new_settings.replicas(), new_settings.pool()))
+
+    _loop.call_soon_threadsafe(reconfigure)
+
+
+settings.on_reload(_reconfigure_async_pool)
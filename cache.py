@@ -0,0 +1,98 @@
+import functools
+import threading
+import time
+
+from async_db import read_primary
+from config_db import settings
+
+
+class ReferenceCache:
+    # per worker, responses of the reference endpoints keyed by endpoint, each entry lists the tables it was read from
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        # bumped by invalidate(), a read that started before the bump must not store its result
+        self._generations = {}
+        self._stats = {}
+
+    def ttl(self):
+        return float(settings.get("cache", "ttl", fallback="60"))
+
+    def get(self, key):
+        with self._lock:
+            stats = self._stats.setdefault(key, {"hits": 0, "misses": 0})
+            entry = self._entries.get(key)
+
+            if entry is not None and entry[0] > time.monotonic():
+                stats["hits"] += 1
+                return True, entry[1]
+
+            stats["misses"] += 1
+            return False, None
+
+    def generation(self, tables):
+        with self._lock:
+            return tuple(self._generations.get(table, 0) for table in tables)
+
+    def set(self, key, tables, generation, value):
+        with self._lock:
+            if generation != tuple(self._generations.get(table, 0) for table in tables):
+                return
+            self._entries[key] = (time.monotonic() + self.ttl(), value, tables)
+
+    def invalidate(self, *tables):
+        with self._lock:
+            for table in tables:
+                self._generations[table] = self._generations.get(table, 0) + 1
+            self._entries = {key: entry for key, entry in self._entries.items()
+                             if not set(entry[2]) & set(tables)}
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            for table in self._generations:
+                self._generations[table] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": sum(stats["hits"] for stats in self._stats.values()),
+                "misses": sum(stats["misses"] for stats in self._stats.values()),
+                "entries": len(self._entries),
+                "endpoints": {key: dict(stats) for key, stats in self._stats.items()}
+            }
+
+
+reference_cache = ReferenceCache()
+
+
+def cached(*tables):
+    # for async endpoints without parameters, error responses (plain {"error": ...} dicts) are not kept,
+    # a kept FastJSONResponse is already rendered, a hit sends the same bytes again
+    def decorator(endpoint):
+        key = endpoint.__name__
+
+        @functools.wraps(endpoint)
+        async def wrapper():
+            hit, response = reference_cache.get(key)
+            if hit:
+                return response
+
+            generation = reference_cache.generation(tables)
+
+            # refilled from the primary, a replica may not have replayed the write that emptied the entry yet
+            # and its old rows would then be kept for the whole ttl
+            token = read_primary.set(True)
+            try:
+                response = await endpoint()
+            finally:
+                read_primary.reset(token)
+
+            if not isinstance(response, dict):
+                reference_cache.set(key, tables, generation, response)
+
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,33 @@
+from pagination import next_page_cursor_from_row
+
+
+COLUMNS_FORMAT = "columns"
+
+# more positions than any row mapper reads
+_PROBE_ROW = range(256)
+
+
+def column_names(row_to_json):
+    # "client.work_hours.monday" etc. for every row position, read off the row mapper itself
+    # (it only indexes the row), so the header and the nested format can't disagree
+    names = {0: "id"}
+
+    def walk(value, path):
+        if isinstance(value, dict):
+            for key, nested in value.items():
+                walk(nested, path + [key])
+        else:
+            names[value] = ".".join(path)
+
+    walk(row_to_json(_PROBE_ROW), [])
+    return [names[position] for position in range(max(names) + 1)]
+
+
+def check_format(format, *formats):
+    if format is not None and format not in formats:
+        raise Exception(f"Unknown format '{format}', expected one of: {', '.join(formats)}")
+
+
+def next_page_cursor_from_rows(rows, limit, *positions):
+    # same cursor as next_page_cursor, taken from the last row tuple
+    return next_page_cursor_from_row(len(rows), rows[-1] if rows else None, limit, *positions)
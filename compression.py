@@ -0,0 +1,145 @@
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from config_db import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# json and ndjson, not the event stream, a compressor would hold events back until its block is full
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/plain", "text/html", "text/csv")
+
+
+def _gzip_encoder():
+    compressor = zlib.compressobj(int(settings.get("compression", "gzip_level", fallback="6")), zlib.DEFLATED, 31)
+    return (lambda data: compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)), compressor.flush
+
+
+def _brotli_encoder():
+    compressor = brotli.Compressor(quality=int(settings.get("compression", "brotli_level", fallback="4")))
+    return (lambda data: compressor.process(data) + compressor.flush()), compressor.finish
+
+
+def _zstd_encoder():
+    compressor = zstandard.ZstdCompressor(level=int(settings.get("compression", "zstd_level", fallback="3"))).compressobj()
+    return (lambda data: compressor.compress(data) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)), compressor.flush
+
+
+# content-coding -> encoder factory, in the order we prefer them, each encoder is
+# (compress(chunk) flushed so the client can decode what it got so far, finish())
+ENCODERS = {name: encoder for name, encoder, library in (("zstd", _zstd_encoder, zstandard),
+                                                         ("br", _brotli_encoder, brotli),
+                                                         ("gzip", _gzip_encoder, zlib)) if library is not None}
+
+
+def choose_encoding(accept_encoding):
+    # "gzip, deflate, br;q=0.5" -> "br", our preference among the ones the client accepts with q > 0
+    qualities = {}
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.partition(";")
+        params = params.replace(" ", "")
+        try:
+            qualities[name.strip().lower()] = float(params[2:]) if params.startswith("q=") else 1.0
+        except ValueError:
+            qualities[name.strip().lower()] = 0.0
+
+    for name in ENCODERS:
+        if qualities.get(name, qualities.get("*", 0.0)) > 0:
+            return name
+    return None
+
+
+class CompressionMiddleware:
+    # compresses json and ndjson responses of min_size bytes and up, a streamed body chunk by chunk as it is sent
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+
+        min_size = int(settings.get("compression", "min_size", fallback="1024"))
+
+        start_message = None
+        passthrough = False
+        pending = []
+        pending_size = 0
+        compress = None
+        finish = None
+
+        async def send_compressed(message):
+            nonlocal start_message, passthrough, pending, pending_size, compress, finish
+
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                content_type = headers.get("content-type", "").split(";")[0].strip()
+                if content_type in COMPRESSIBLE_TYPES:
+                    # also when it goes out uncompressed, a shared cache must not hand it to a client
+                    # that sent a different Accept-Encoding
+                    headers.add_vary_header("Accept-Encoding")
+
+                if (encoding is None or content_type not in COMPRESSIBLE_TYPES or "content-encoding" in headers
+                        or message["status"] < 200 or message["status"] in (204, 304)):
+                    passthrough = True
+                    await send(message)
+                    return
+
+                # held back until the size is known
+                start_message = message
+                return
+
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            more_body = message.get("more_body", False)
+
+            if compress is None:
+                pending.append(message.get("body", b""))
+                pending_size += len(pending[-1])
+
+                if more_body and pending_size < min_size:
+                    return
+
+                if pending_size < min_size:
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": b"".join(pending), "more_body": False})
+                    return
+
+                compress, finish = ENCODERS[encoding]()
+                body = compress(b"".join(pending))
+                pending = []
+
+                headers = MutableHeaders(scope=start_message)
+                headers["Content-Encoding"] = encoding
+                if more_body:
+                    if "content-length" in headers:
+                        del headers["Content-Length"]
+                else:
+                    body += finish()
+                    headers["Content-Length"] = str(len(body))
+
+                await send(start_message)
+                await send({"type": "http.response.body", "body": body, "more_body": more_body})
+                return
+
+            body = compress(message["body"]) if message.get("body") else b""
+            if not more_body:
+                body += finish()
+
+            if body or not more_body:
+                await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
@@ -1,6 +1,6 @@
-from configparser import ConfigParser
+from config_db import settings
 
-config = ConfigParser()
-config.read("config.ini")
+# config.ini is parsed together with database.ini by the shared settings object
+config = settings
 
-# curl -X GET "http://127.0.0.1:8000/items/6?q=hello_world"
\ No newline at end of file
+# curl -X GET "http://127.0.0.1:8000/items/6?q=hello_world"
@@ -1,11 +1,17 @@
+import logging
+import os
+import signal
+import threading
+import time
 from configparser import ConfigParser
 
 
-def config_database(filename='database.ini', section='postgresql'):
-    # create a parser
-    parser = ConfigParser()
-    # read config file
-    parser.read(filename)
+def config_database(filename='database.ini', section='postgresql', parser=None):
+    if parser is None:
+        # create a parser
+        parser = ConfigParser()
+        # read config file
+        parser.read(filename)
 
     # get section, default to postgresql
     db = {}
@@ -16,4 +22,132 @@ def config_database(filename='database.ini', section='postgresql'):
     else:
         raise Exception('Section {0} not found in the {1} file'.format(section, filename))
 
-    return db
\ No newline at end of file
+    return db
+
+
+def config_pool(filename='database.ini', section='pool', parser=None):
+    # pool settings are optional, every key falls back to its default
+    pool = {
+        'min_size': 1,
+        'max_size': 10,
+        'max_lifetime': 3600.0,
+        'checkout_timeout': 5.0,
+        'health_check_interval': 30.0
+    }
+
+    if parser is None:
+        parser = ConfigParser()
+        parser.read(filename)
+
+    if parser.has_section(section):
+        for key, value in parser.items(section):
+            if key in pool:
+                pool[key] = type(pool[key])(value)
+
+    return pool
+
+
+class Settings:
+    # parsed once per worker, re-read on SIGHUP or when one of the files changes on disk
+    def __init__(self, filenames, check_interval=1.0):
+        self.filenames = filenames
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._reload_requested = False
+        self._checked_at = time.monotonic()
+        self._parser, self._mtimes = self._load()
+
+    def database(self, section='postgresql'):
+        return config_database(self.filenames[0], section, parser=self._parser)
+
+    def pool(self, section='pool'):
+        return config_pool(self.filenames[0], section, parser=self._parser)
+
+    def replicas(self, prefix='postgresql_replica'):
+        # every [postgresql_replica...] section is one read-only server
+        return {section: config_database(self.filenames[0], section, parser=self._parser)
+                for section in self._parser.sections() if section.startswith(prefix)}
+
+    def get(self, section, option, fallback=None):
+        return self._parser.get(section, option, fallback=fallback)
+
+    def has_section(self, section):
+        return self._parser.has_section(section)
+
+    def on_reload(self, callback):
+        self._callbacks.append(callback)
+
+    def request_reload(self):
+        # only sets a flag, so it is safe to call from a signal handler
+        self._reload_requested = True
+
+    def maybe_reload(self):
+        if not self._reload_requested and time.monotonic() - self._checked_at < self.check_interval:
+            return
+
+        # one thread checks the files, the rest keep going with the current settings
+        if not self._lock.acquire(blocking=False):
+            return
+
+        try:
+            self._checked_at = time.monotonic()
+            if self._reload_requested or self._read_mtimes() != self._mtimes:
+                self._reload_requested = False
+                self._reload()
+        finally:
+            self._lock.release()
+
+    def reload(self):
+        with self._lock:
+            self._reload()
+
+    def _reload(self):
+        try:
+            parser, mtimes = self._load()
+            # a half-written or broken file must not replace working settings
+            config_database(self.filenames[0], parser=parser)
+            config_pool(self.filenames[0], parser=parser)
+        except Exception:
+            logging.exception("Settings reload failed, keeping the previous settings")
+            return
+
+        self._mtimes = mtimes
+        self._parser = parser
+
+        current_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+        logging.info(f"{current_time}---SETTINGS reloaded from {', '.join(self.filenames)}")
+
+        for callback in self._callbacks:
+            try:
+                callback(self)
+            except Exception:
+                logging.exception("Settings reload callback failed")
+
+    def _load(self):
+        mtimes = self._read_mtimes()
+        parser = ConfigParser()
+        parser.read(self.filenames)
+        return parser, mtimes
+
+    def _read_mtimes(self):
+        mtimes = []
+        for filename in self.filenames:
+            try:
+                mtimes.append(os.stat(filename).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return mtimes
+
+
+settings = Settings(['database.ini', 'config.ini'])
+
+
+def install_reload_signal(signum=signal.SIGHUP):
+    # signal handlers can only be set from the main thread (not the case under TestClient)
+    if threading.current_thread() is not threading.main_thread():
+        logging.warning("Settings reload signal is not installed outside the main thread")
+        return
+
+    signal.signal(signum, lambda signum, frame: settings.request_reload())
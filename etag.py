@@ -0,0 +1,22 @@
+import hashlib
+
+
+TABLE_VERSIONS_SQL = "select array_agg(table_name || ':' || version order by table_name)\
+                          from (select table_name, sum(changes) as version from table_changes\
+                                    where table_name = any($1::text[]) group by table_name) versions;"
+
+
+async def table_etag(conn, tables, sql, args):
+    # versions of every table the query reads (migrations/0008) plus the query itself, so filters and pages differ
+    versions = (await conn.fetchrow(TABLE_VERSIONS_SQL, list(tables)))[0]
+    digest = hashlib.sha1(repr((versions, sql, list(args))).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+
+    # weak comparison, W/"x" and "x" are the same tag
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
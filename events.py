@@ -0,0 +1,87 @@
+import asyncio
+import json
+import logging
+
+from fastapi.responses import StreamingResponse
+
+from config_db import settings
+
+
+# payload is a json event from the triggers in migrations/0007, with old_status since migrations/0012
+SALE_EVENTS_CHANNEL = "sale_events"
+
+EVENT_STREAM_MEDIA_TYPE = "text/event-stream"
+
+# events waiting for one slow client, past that it is told to reload instead
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+RESYNC_EVENT = {"kind": "resync"}
+
+
+def event_matches(event, filters):
+    # status=delivered also passes the change that moves a sale out of delivered
+    return all(event.get(field) == value or (field == "status" and event.get("old_status") == value)
+               for field, value in filters.items())
+
+
+class EventHub:
+    # fans the notifications of this worker's listener out to its connected clients
+    def __init__(self):
+        self._subscribers = {}
+
+    def subscribe(self, filters):
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers[queue] = filters
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.pop(queue, None)
+
+    def publish(self, payload):
+        event = json.loads(payload)
+        for queue, filters in list(self._subscribers.items()):
+            if event_matches(event, filters):
+                self._put(queue, event)
+
+    def resync(self):
+        # events sent while the listener was reconnecting are lost, clients have to reload
+        for queue in list(self._subscribers):
+            self._put(queue, RESYNC_EVENT)
+
+    def _put(self, queue, event):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            logging.warning("Event subscriber is too slow, it is asked to reload")
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(RESYNC_EVENT)
+
+
+sale_events = EventHub()
+
+
+def event_stream_response(hub, filters):
+    # server-sent events, a comment line now and then keeps proxies from closing an idle stream
+    async def events():
+        queue = hub.subscribe(filters)
+        try:
+            yield ": connected\n\n"
+
+            keepalive = float(settings.get("events", "keepalive_interval", fallback="15"))
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+
+                yield f"event: {event['kind']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+
+                if event is RESYNC_EVENT:
+                    return
+        finally:
+            hub.unsubscribe(queue)
+
+    return StreamingResponse(events(), media_type=EVENT_STREAM_MEDIA_TYPE,
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
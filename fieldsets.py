@@ -0,0 +1,134 @@
+# ?fields=delivery_time,status,debt,client.name&expand=driver on a list endpoint:
+# only the listed columns are selected and only the joins they need are added
+
+SALE_FIELDSET = {
+    "from": "clients_sales cs",
+    # always selected first, the row key and the pagination cursor are read from them
+    "keys": ["cs.id", "cs.delivery_time"],
+    "fields": {
+        "delivery_time": "cs.delivery_time",
+        "client_id": "cs.client",
+        "provider_id": "cs.provider",
+        "driver_id": "cs.driver",
+        "paid": "cs.paid",
+        "debt": "cs.debt",
+        "comments": "cs.comments",
+        "status": "cs.status"
+    },
+    # expansion -> (join, parent expansion, fields), nested under the parent as the last part of its name
+    "expansions": {
+        "client": ("left join clients s_client on cs.client = s_client.id", None, {
+            "id": "s_client.id",
+            "name": "s_client.name",
+            "entity": "s_client.entity",
+            "address": "s_client.address",
+            "address_comments": "s_client.address_comments",
+            "network": "s_client.network",
+            "payment": "s_client.payment",
+            "default_provider_id": "s_client.default_provider",
+            "recoil": "s_client.recoil",
+            "comments": "s_client.comments"
+        }),
+        "client.default_provider": ("left join providers def_prov on s_client.default_provider = def_prov.id", "client", {
+            "id": "def_prov.id",
+            "name": "def_prov.name",
+            "contacts": "def_prov.contacts",
+            "comments": "def_prov.comments"
+        }),
+        "client.work_hours": ("left join clients_work_hours cwh on cs.client = cwh.client_id", "client", {
+            "monday": "cwh.monday",
+            "tuesday": "cwh.tuesday",
+            "wednesday": "cwh.wednesday",
+            "thursday": "cwh.thursday",
+            "friday": "cwh.friday",
+            "saturday": "cwh.saturday",
+            "sunday": "cwh.sunday"
+        }),
+        "provider": ("left join providers s_provider on cs.provider = s_provider.id", None, {
+            "id": "s_provider.id",
+            "name": "s_provider.name",
+            "contacts": "s_provider.contacts",
+            "comments": "s_provider.comments"
+        }),
+        "driver": ("left join users s_driver on cs.driver = s_driver.id", None, {
+            "id": "s_driver.id",
+            "name": "s_driver.name",
+            "contacts": "s_driver.contacts"
+        })
+    }
+}
+
+
+def split_names(names):
+    # "a, b,,c" -> ["a", "b", "c"]
+    return [name.strip() for name in names.split(",") if name.strip()] if names else []
+
+
+def _add_expansion(fieldset, expansions, name):
+    if name not in fieldset["expansions"]:
+        raise Exception(f"Unknown expansion '{name}', expected one of: {', '.join(fieldset['expansions'])}")
+
+    parent = fieldset["expansions"][name][1]
+    if parent is not None:
+        _add_expansion(fieldset, expansions, parent)
+
+    if name not in expansions:
+        expansions.append(name)
+
+
+def select_fields(fieldset, fields=None, expand=None):
+    # -> ("select ... from ... joins", row mapper), the caller adds where, order by and limit
+    # without fields every column of the table and of the expanded objects, with fields only the listed ones,
+    # a field of an expansion ("client.name") brings in its join without the rest of the object
+    field_names = split_names(fields)
+    expand_names = split_names(expand)
+
+    expansions = []
+    for name in expand_names:
+        _add_expansion(fieldset, expansions, name)
+
+    paths = []
+    columns = []
+
+    def select(path, column):
+        if path not in paths:
+            paths.append(path)
+            columns.append(column)
+
+    if not field_names:
+        for name, column in fieldset["fields"].items():
+            select((name,), column)
+
+    for name in field_names:
+        if name in fieldset["fields"]:
+            select((name,), fieldset["fields"][name])
+            continue
+
+        expansion, _, field = name.rpartition(".")
+        if expansion not in fieldset["expansions"] or field not in fieldset["expansions"][expansion][2]:
+            raise Exception(f"Unknown field '{name}'")
+
+        _add_expansion(fieldset, expansions, expansion)
+        select((*expansion.split("."), field), fieldset["expansions"][expansion][2][field])
+
+    for expansion in expansions:
+        if expansion in expand_names or any(name.startswith(expansion + ".") for name in expand_names):
+            for field, column in fieldset["expansions"][expansion][2].items():
+                select((*expansion.split("."), field), column)
+
+    # in the fieldset's order, a join may use the alias of its parent's
+    joins = "".join(" " + join for name, (join, _, _) in fieldset["expansions"].items() if name in expansions)
+
+    keys = fieldset["keys"]
+    select_sql = f"select {', '.join(keys + columns)} from {fieldset['from']}{joins}"
+
+    def row_to_json(row):
+        row_json = {}
+        for position, path in enumerate(paths, len(keys)):
+            node = row_json
+            for key in path[:-1]:
+                node = node.setdefault(key, {})
+            node[path[-1]] = row[position]
+        return row_json
+
+    return select_sql, row_to_json
@@ -0,0 +1,47 @@
+import argparse
+import logging
+import sys
+
+import psycopg2
+
+from config_db import settings
+from import_db import IMPORTS, IMPORT_FORMATS, import_file, ImportValidationError
+
+
+# python import_data.py purchases purchases_2019.csv
+# python import_data.py history history.ndjson --format ndjson
+def main():
+    parser = argparse.ArgumentParser(description="Load purchases, sales, shares or history from a CSV or NDJSON file")
+    parser.add_argument("kind", choices=list(IMPORTS))
+    parser.add_argument("file")
+    parser.add_argument("--format", choices=IMPORT_FORMATS, default=None,
+                        help="defaults to the file extension, csv otherwise")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
+
+    import_format = args.format or ("ndjson" if args.file.endswith((".ndjson", ".jsonl")) else "csv")
+
+    conn = None
+    try:
+        conn = psycopg2.connect(**settings.database())
+        with open(args.file, "rb") as file:
+            imported_count = import_file(conn, args.kind, file, import_format)
+        print(f"{imported_count} {args.kind} rows imported")
+        return 0
+
+    except ImportValidationError as error:
+        print(error, file=sys.stderr)
+        for line in error.lines:
+            print(f"line {line['line']}: {line['error']}", file=sys.stderr)
+        return 1
+    except (Exception, psycopg2.DatabaseError) as error:
+        print(error, file=sys.stderr)
+        return 1
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
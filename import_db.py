@@ -0,0 +1,197 @@
+import csv
+import logging
+from time import localtime, strftime
+
+from psycopg2.sql import SQL, Identifier, Literal
+
+
+# what each import kind loads, "defaults" are sql expressions over the staged row for columns left empty
+IMPORTS = {
+    "purchases": {
+        "table": "providers_purchases",
+        "columns": ("delivery_time", "provider", "product", "amount", "weight", "price_per_kilo",
+                    "total_price", "paid", "debt", "comments", "status"),
+        "defaults": {
+            "total_price": "weight * price_per_kilo",
+            "paid": "0",
+            "debt": "coalesce(total_price, weight * price_per_kilo)",
+            "comments": "''"
+        },
+        "references": {"provider": ("providers", "id"), "product": ("products", "product_name")}
+    },
+    "sales": {
+        "table": "clients_sales",
+        "columns": ("delivery_time", "client", "provider", "driver", "paid", "debt", "comments", "status"),
+        "defaults": {"comments": "''"},
+        "references": {"client": ("clients", "id"), "provider": ("providers", "id"), "driver": ("users", "id")}
+    },
+    "shares": {
+        "table": "drivers_share",
+        "columns": ("driver_id", "purchase_id", "amount", "weight", "price_per_kilo", "status"),
+        "defaults": {},
+        "references": {"driver_id": ("users", "id"), "purchase_id": ("providers_purchases", "id")}
+    },
+    "history": {
+        "table": "history",
+        "columns": ("sale_id", "share_id", "amount", "weight", "price_per_kilo", "total_price"),
+        "defaults": {"total_price": "weight * price_per_kilo"},
+        "references": {"sale_id": ("clients_sales", "id"), "share_id": ("drivers_share", "id")}
+    }
+}
+
+IMPORT_FORMATS = ("csv", "ndjson")
+
+# bad lines reported per check, the rest of the file is not listed
+MAX_REPORTED_LINES = 20
+
+
+class ImportValidationError(Exception):
+    def __init__(self, message, lines):
+        super().__init__(message)
+        self.lines = lines
+
+
+def _check_columns(columns, spec):
+    # "id" keeps the old ids, the other columns are the spec's, in any order
+    allowed = ("id",) + spec["columns"]
+    unknown = [column for column in columns if column not in allowed]
+    if unknown:
+        raise ImportValidationError(f"Unknown columns {', '.join(unknown)}, allowed are {', '.join(allowed)}", [])
+
+    duplicated = sorted({column for column in columns if columns.count(column) > 1})
+    if duplicated:
+        raise ImportValidationError(f"Duplicated columns {', '.join(duplicated)}", [])
+
+    missing = [column for column in spec["columns"] if column not in columns and column not in spec["defaults"]]
+    if missing:
+        raise ImportValidationError(f"Missing columns {', '.join(missing)}", [])
+
+    return columns
+
+
+def _header_columns(file, spec):
+    # the csv header in its own order, COPY's "header true" only skips the line, the column list maps the values
+    first_line = file.readline()
+    file.seek(0)
+
+    if isinstance(first_line, bytes):
+        first_line = first_line.decode("utf-8-sig")
+    first_line = first_line.lstrip("\ufeff").strip()
+
+    if not first_line:
+        raise ImportValidationError("Import file is empty", [])
+
+    return _check_columns(next(csv.reader([first_line])), spec)
+
+
+def _check(cur, message, query):
+    cur.execute(query)
+    bad_lines = [line for (line,) in cur.fetchall()]
+    if bad_lines:
+        return [{"line": line, "error": message} for line in bad_lines]
+    return []
+
+
+def import_file(conn, kind, file, import_format="csv"):
+    # file -> COPY into a temp staging table -> set-based checks -> one insert into the real table
+    if kind not in IMPORTS:
+        raise Exception(f"Unknown import '{kind}', expected one of {', '.join(IMPORTS)}")
+    if import_format not in IMPORT_FORMATS:
+        raise Exception(f"Unknown import format '{import_format}', expected one of {', '.join(IMPORT_FORMATS)}")
+
+    spec = IMPORTS[kind]
+    table = spec["table"]
+
+    cur = conn.cursor()
+
+    if import_format == "csv":
+        columns = _header_columns(file, spec)
+    else:
+        # one json document per line, control characters as quote and delimiter keep COPY from touching it,
+        # the line numbers are taken here, while the file order is still known, blank lines count too
+        cur.execute("create temp table import_staging_json (doc text, line bigserial) on commit drop;")
+        cur.copy_expert("copy import_staging_json (doc) from stdin with (format csv, quote e'\\x01', delimiter e'\\x02');", file)
+
+        # every key of every line, a key first used halfway through the file is not dropped
+        cur.execute("select distinct jsonb_object_keys(doc::jsonb) from import_staging_json where doc <> '';")
+        keys = {key for (key,) in cur.fetchall()}
+        if not keys:
+            cur.close()
+            conn.rollback()
+            raise ImportValidationError("Import file is empty", [])
+        columns = _check_columns([column for column in ("id",) + spec["columns"] if column in keys]
+                                 + sorted(keys - set(("id",) + spec["columns"])), spec)
+
+    staged_columns = ("id",) + spec["columns"] if "id" in columns else spec["columns"]
+
+    # same column types as the real table, but no not-null or foreign keys, those are checked below
+    cur.execute(SQL("create temp table import_staging on commit drop as select {} from {} with no data;").format(
+        SQL(", ").join(map(Identifier, staged_columns)), Identifier(table)))
+    cur.execute("alter table import_staging add column import_line bigserial;")
+
+    if import_format == "csv":
+        cur.copy_expert(SQL("copy import_staging ({}) from stdin with (format csv, header true);").format(
+            SQL(", ").join(map(Identifier, columns))).as_string(conn), file)
+        # the header is line 1
+        line_offset = 1
+    else:
+        cur.execute(SQL("insert into import_staging ({columns}, import_line) \
+                         select {populated}, j.line from import_staging_json j, \
+                                jsonb_populate_record(null::import_staging, j.doc::jsonb) r \
+                         where j.doc <> '';").format(columns=SQL(", ").join(map(Identifier, staged_columns)),
+                                                     populated=SQL(", ").join(SQL("r.{}").format(Identifier(column))
+                                                                              for column in staged_columns)))
+        line_offset = 0
+
+    cur.execute("select count(*) from import_staging;")
+    staged_count = cur.fetchone()[0]
+
+    errors = []
+    for column in staged_columns:
+        if column in spec["defaults"]:
+            continue
+        errors += _check(cur, f"{column} is empty", SQL(
+            "select import_line + {offset} from import_staging where {column} is null order by import_line limit {limit};"
+        ).format(offset=Literal(line_offset), column=Identifier(column), limit=Literal(MAX_REPORTED_LINES)))
+
+    for column, (ref_table, ref_column) in spec["references"].items():
+        errors += _check(cur, f"{column} has no matching {ref_table}.{ref_column}", SQL(
+            "select s.import_line + {offset} from import_staging s \
+                 where s.{column} is not null \
+                 and not exists (select 1 from {ref_table} r where r.{ref_column} = s.{column}) \
+                 order by s.import_line limit {limit};"
+        ).format(offset=Literal(line_offset), column=Identifier(column), ref_table=Identifier(ref_table),
+                 ref_column=Identifier(ref_column), limit=Literal(MAX_REPORTED_LINES)))
+
+    if "id" in staged_columns:
+        errors += _check(cur, "id already exists", SQL(
+            "select s.import_line + {offset} from import_staging s join {table} t on t.id = s.id \
+                 order by s.import_line limit {limit};"
+        ).format(offset=Literal(line_offset), table=Identifier(table), limit=Literal(MAX_REPORTED_LINES)))
+
+    if errors:
+        cur.close()
+        conn.rollback()
+        raise ImportValidationError(f"{kind} import has invalid lines, nothing was imported", errors)
+
+    values = [SQL("coalesce({}, {})").format(Identifier(column), SQL(spec["defaults"][column]))
+              if column in spec["defaults"] else Identifier(column) for column in staged_columns]
+
+    cur.execute(SQL("insert into {table} ({columns}) select {values} from import_staging order by import_line;").format(
+        table=Identifier(table), columns=SQL(", ").join(map(Identifier, staged_columns)), values=SQL(", ").join(values)))
+    imported_count = cur.rowcount
+
+    if "id" in staged_columns:
+        # rows created later must not collide with the imported ids
+        cur.execute(SQL("select setval(pg_get_serial_sequence({table}, 'id'), \
+                                       (select coalesce(max(id), 1) from {ident}));").format(
+            table=Literal(table), ident=Identifier(table)))
+
+    cur.close()
+
+    conn.commit()
+
+    current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
+    logging.info(f"{current_time}---IMPORTED {kind.upper()} | {imported_count} of {staged_count} rows")
+
+    return imported_count
@@ -0,0 +1,136 @@
+NORMALIZED_FORMAT = "normalized"
+
+
+def normalized_sale_to_json(sale):
+    return {
+        "delivery_time": sale[1],
+        "client_id": sale[2],
+        "provider_id": sale[3],
+        "driver_id": sale[4],
+        "paid": sale[5],
+        "debt": sale[6],
+        "comments": sale[7],
+        "status": sale[8]
+    }
+
+
+def normalized_story_to_json(story):
+    return {
+        "sale_id": story[1],
+        "share_id": story[2],
+        "amount": story[3],
+        "weight": story[4],
+        "price_per_kilo": story[5],
+        "total_price": story[6]
+    }
+
+
+def normalized_share_to_json(share):
+    return {
+        "driver_id": share[1],
+        "purchase_id": share[2],
+        "amount": share[3],
+        "weight": share[4],
+        "price_per_kilo": share[5],
+        "status": share[6]
+    }
+
+
+def normalized_purchase_to_json(purchase):
+    return {
+        "delivery_time": purchase[1],
+        "provider_id": purchase[2],
+        "product": purchase[3],
+        "amount": purchase[4],
+        "weight": purchase[5],
+        "price_per_kilo": purchase[6],
+        "total_price": purchase[7],
+        "paid": purchase[8],
+        "debt": purchase[9],
+        "comments": purchase[10],
+        "status": purchase[11]
+    }
+
+
+def normalized_client_to_json(client):
+    return {
+        "name": client[1],
+        "entity": client[2],
+        "address": client[3],
+        "address_comments": client[4],
+        "network": client[5],
+        "payment": client[6],
+        "default_provider_id": client[7],
+        "recoil": client[8],
+        "comments": client[9],
+        "work_hours": {
+            "monday": client[10],
+            "tuesday": client[11],
+            "wednesday": client[12],
+            "thursday": client[13],
+            "friday": client[14],
+            "saturday": client[15],
+            "sunday": client[16]
+        }
+    }
+
+
+def normalized_provider_to_json(provider):
+    return {
+        "name": provider[1],
+        "contacts": provider[2],
+        "comments": provider[3]
+    }
+
+
+def normalized_user_to_json(user):
+    return {
+        "name": user[1],
+        "contacts": user[2]
+    }
+
+
+# kind -> (sql by a list of ids, row mapper, {referenced kind: field holding its id})
+INCLUDED = {
+    "sales": ("select id, delivery_time, client, provider, driver, paid, debt, comments, status \
+                   from clients_sales where id = any($1::integer[]);",
+              normalized_sale_to_json, {"clients": "client_id", "providers": "provider_id", "users": "driver_id"}),
+    "shares": ("select id, driver_id, purchase_id, amount, weight, price_per_kilo, status \
+                    from drivers_share where id = any($1::integer[]);",
+               normalized_share_to_json, {"users": "driver_id", "purchases": "purchase_id"}),
+    "purchases": ("select id, delivery_time, provider, product, amount, weight, price_per_kilo, total_price, paid, debt, comments, status \
+                       from providers_purchases where id = any($1::integer[]);",
+                  normalized_purchase_to_json, {"providers": "provider_id"}),
+    "clients": ("select c.id, c.name, c.entity, c.address, c.address_comments, c.network, c.payment, c.default_provider, c.recoil, c.comments,\
+                        cwh.monday, cwh.tuesday, cwh.wednesday, cwh.thursday, cwh.friday, cwh.saturday, cwh.sunday \
+                     from clients c left join clients_work_hours cwh on c.id = cwh.client_id where c.id = any($1::integer[]);",
+                normalized_client_to_json, {"providers": "default_provider_id"}),
+    "users": ("select id, name, contacts from users where id = any($1::integer[]);",
+              normalized_user_to_json, {}),
+    "providers": ("select id, name, contacts, comments from providers where id = any($1::integer[]);",
+                  normalized_provider_to_json, {})
+}
+
+# a kind is loaded after every kind that references it, e.g. providers after clients and purchases
+INCLUDED_ORDER = ("sales", "shares", "purchases", "clients", "users", "providers")
+
+
+async def load_included(conn, **ids):
+    # load_included(conn, clients=[...], users=[...]) -> {"clients": {id: ...}, "users": {id: ...}, "providers": {id: ...}},
+    # one "id = any(...)" query per kind, each entity once however many rows point at it
+    wanted = {kind: set(ids.get(kind, ())) for kind in INCLUDED_ORDER}
+    included = {}
+
+    for kind in INCLUDED_ORDER:
+        kind_ids = sorted(kind_id for kind_id in wanted[kind] if kind_id is not None)
+        if not kind_ids:
+            continue
+
+        sql, row_to_json, references = INCLUDED[kind]
+        included[kind] = {row[0]: row_to_json(row) for row in await conn.fetch(sql, kind_ids)}
+
+        for entity in included[kind].values():
+            for referenced_kind, field in references.items():
+                wanted[referenced_kind].add(entity[field])
+
+    return included
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+from time import localtime, strftime
+
+import asyncpg
+
+from async_db import connect_primary
+from config_db import settings
+
+
+# payload is the table name, sent on commit for the tables behind the reference cache (migrations/0009)
+TABLE_CHANGED_CHANNEL = "table_changed"
+
+# channel -> callbacks taking the payload
+_subscribers = {}
+# called after a reconnect, whatever was notified while the connection was down is lost
+_reconnect_callbacks = []
+_task = None
+
+
+def subscribe(channel, callback):
+    callbacks = _subscribers.setdefault(channel, [])
+    if callback not in callbacks:
+        callbacks.append(callback)
+
+
+def on_reconnect(callback):
+    if callback not in _reconnect_callbacks:
+        _reconnect_callbacks.append(callback)
+
+
+def _dispatch(conn, pid, channel, payload):
+    for callback in _subscribers.get(channel, []):
+        try:
+            callback(payload)
+        except Exception:
+            logging.exception(f"Notification callback for {channel} failed")
+
+
+async def _listen():
+    connected_before = False
+
+    while True:
+        conn = None
+        try:
+            conn = await connect_primary()
+
+            lost = asyncio.Event()
+            conn.add_termination_listener(lambda conn: lost.set())
+
+            for channel in _subscribers:
+                await conn.add_listener(channel, _dispatch)
+
+            if connected_before:
+                for callback in _reconnect_callbacks:
+                    callback()
+            connected_before = True
+
+            current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
+            logging.info(f"{current_time}---LISTENING on {', '.join(_subscribers)}")
+
+            # an idle connection can die without anyone noticing, so it is pinged now and then
+            keepalive = float(settings.get("listener", "keepalive_interval", fallback="30"))
+            while not lost.is_set():
+                try:
+                    await asyncio.wait_for(lost.wait(), timeout=keepalive)
+                except asyncio.TimeoutError:
+                    await conn.execute("select 1;")
+
+            logging.warning("Notification listener lost its connection, reconnecting")
+
+        except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError):
+            logging.exception("Notification listener failed, reconnecting")
+        finally:
+            if conn is not None and not conn.is_closed():
+                conn.terminate()
+
+        await asyncio.sleep(float(settings.get("listener", "retry_delay", fallback="1")))
+
+
+def start_listener():
+    global _task
+    if _subscribers and _task is None:
+        _task = asyncio.get_running_loop().create_task(_listen())
+
+
+async def stop_listener():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
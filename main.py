@@ -1,14 +1,38 @@
 import logging
+from tempfile import SpooledTemporaryFile
 from time import gmtime, localtime, strftime
 from typing import Dict, List, Optional, Any
 
+import asyncpg
 import psycopg2
+from psycopg2.errors import LockNotAvailable
+from psycopg2.extras import execute_values
 from psycopg2.sql import SQL, Identifier
-from config_db import config_database
-from fastapi import FastAPI
-
-
-app = FastAPI() # uvicorn main:app --host 195.2.76.198 --port 80
+from async_db import (get_async_connection, release_async_connection, open_async_pool, close_async_pool,
+                      iterate_rows, ReadRoutingMiddleware)
+from cache import cached, reference_cache
+from columns import COLUMNS_FORMAT, column_names, check_format, next_page_cursor_from_rows
+from compression import CompressionMiddleware
+from config_db import install_reload_signal, settings
+from etag import table_etag, etag_matches
+from events import SALE_EVENTS_CHANNEL, sale_events, event_stream_response
+from fieldsets import SALE_FIELDSET, select_fields
+from import_db import import_file, ImportValidationError
+from included import NORMALIZED_FORMAT, load_included, normalized_sale_to_json, normalized_story_to_json
+from listener import TABLE_CHANGED_CHANNEL, subscribe, on_reconnect, start_listener, stop_listener
+from migrate import check_schema
+from models import NewPurchase, NewSale, NewShare, NewStory, NewDelivery
+from pagination import page_filter, page_order, next_page_cursor
+from pool_db import get_connection, release_connection, open_pool, close_pool
+from responses import FastJSONResponse
+from streaming import wants_ndjson, ndjson_response
+from fastapi import FastAPI, Body, Header, Request, Response
+from fastapi.concurrency import run_in_threadpool
+
+
+app = FastAPI(default_response_class=FastJSONResponse) # uvicorn main:app --host 195.2.76.198 --port 80
+app.add_middleware(ReadRoutingMiddleware)
+app.add_middleware(CompressionMiddleware)
 
 root_logger= logging.getLogger()
 root_logger.setLevel(logging.INFO)
@@ -17,12 +41,74 @@ formatter = logging.Formatter('%(levelname)s - %(message)s')
 handler.setFormatter(formatter)
 root_logger.addHandler(handler)
 
+# keyset pagination order of the list endpoints, backed by indexes in migrations/
+PURCHASES_PAGE_KEY = ("providers_purchases.delivery_time", "providers_purchases.id")
+SALES_PAGE_KEY = ("cs.delivery_time", "cs.id")
+SHARES_PAGE_KEY = ("ds.id",)
+HISTORY_PAGE_KEY = ("h.id",)
+FUTURE_SALES_PAGE_KEY = ("cfs.delivery_time", "cfs.id")
+
+# tables behind the polled endpoints, their versions make the ETag
+SALES_TABLES = ("clients_sales", "clients", "providers", "users", "clients_work_hours")
+FUTURE_SALES_TABLES = ("clients_future_sales", "clients", "providers", "clients_work_hours")
+WAREHOUSE_TABLES = ("purchases_stock", "providers_purchases", "providers")
+
+# /sync/ names of the change-tracked tables (migrations/0006)
+SYNC_TABLES = {"sales": "clients_sales", "purchases": "providers_purchases", "shares": "drivers_share",
+               "history": "history", "future_sales": "clients_future_sales", "clients_prices": "clients_prices"}
+
+# create_share?allocate=true, how to take the purchase's stock row: wait for it, fail at once, or skip it
+ALLOCATION_LOCKS = {"wait": "for update;", "nowait": "for update nowait;", "skip_locked": "for update skip locked;"}
+
+# import bodies above this size are spooled to disk
+IMPORT_SPOOL_SIZE = 8 * 1024 * 1024
+
+
+@app.on_event("startup")
+async def startup():
+    install_reload_signal()
+    open_pool()
+    await open_async_pool()
+
+    # writes made by the other workers reach this worker's cache through postgres
+    subscribe(TABLE_CHANGED_CHANNEL, reference_cache.invalidate)
+    on_reconnect(reference_cache.clear)
+    subscribe(SALE_EVENTS_CHANNEL, sale_events.publish)
+    on_reconnect(sale_events.resync)
+    start_listener()
+
+    # missing indexes are only reported, "python migrate.py" creates them
+    conn = None
+    try:
+        conn = get_connection()
+        check_schema(conn)
+    except (Exception, psycopg2.DatabaseError):
+        logging.exception("Schema check failed")
+    finally:
+        if conn is not None:
+            release_connection(conn)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await stop_listener()
+    close_pool()
+    await close_async_pool()
+
 
 @app.get("/")
 def hello_world():
     return {"hello": "world"}
 
 
+@app.get("/get_cache_stats/")
+def get_cache_stats():
+    # hits and misses of this worker's reference cache, each gunicorn worker has its own
+    return {
+        "cache": reference_cache.stats()
+    }
+
+
 # ========================================================================== CREATE
 @app.post("/create_user/")
 def create_new_user(name: str, 
@@ -36,9 +122,7 @@ def create_new_user(name: str,
                     comments: Optional[str] = ""):
     conn = None
     try:
-        params = config_database()
-        
-        conn = psycopg2.connect(**params)
+        conn = get_connection()
         cur = conn.cursor()
         
         create_user_sql = "insert into users ( name,\
@@ -54,6 +138,7 @@ def create_new_user(name: str,
         cur.close()
         
         conn.commit()
+        reference_cache.invalidate("users", "users_roles")
         
         current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
         logging.info(f"{current_time}---NEW USER | {name} | created successfully")
@@ -81,7 +166,7 @@ def create_new_user(name: str,
         }
     finally:
         if conn is not None:
-            conn.close()
+            release_connection(conn)
 
 
 @app.post("/create_provider/")
@@ -90,9 +175,7 @@ def create_new_provider(name: str,
                         comments: Optional[str] = ""):
     conn = None
     try:
-        params = config_database()
-        
-        conn = psycopg2.connect(**params)
+        conn = get_connection()
         cur = conn.cursor()
         
         create_provider_sql = "insert into providers ( name,\
@@ -108,6 +191,7 @@ def create_new_provider(name: str,
         cur.close()
         
         conn.commit()
+        reference_cache.invalidate("providers")
 
         current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
         logging.info(f"{current_time}---NEW PROVIDER | {name} | created successfully")
@@ -126,7 +210,7 @@ def create_new_provider(name: str,
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
+            release_connection(conn)
 
 
 
@@ -149,9 +233,7 @@ def create_new_client(name: str,
                       comments: Optional[str] = ""):
     conn = None
     try:
-        params = config_database()
-        
-        conn = psycopg2.connect(**params)
+        conn = get_connection()
         cur = conn.cursor()
 
         create_client_sql = "insert into clients ( name,\
@@ -196,6 +278,7 @@ def create_new_client(name: str,
         cur.close()
         
         conn.commit()
+        reference_cache.invalidate("clients")
 
         current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
         logging.info(f"{current_time}---NEW CLIENT | {name} | created successfully")
@@ -229,7 +312,7 @@ def create_new_client(name: str,
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
+            release_connection(conn)
 
 
 @app.post("/create_purchase/")
@@ -247,9 +330,7 @@ def create_new_purchase( delivery_time: str,
                          ):
     conn = None
     try:
-        params = config_database()
-        
-        conn = psycopg2.connect(**params)
+        conn = get_connection()
         cur = conn.cursor()
         
         total_price = weight * price_per_kilo if not total_price else total_price
@@ -312,7 +393,7 @@ def create_new_purchase( delivery_time: str,
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
+            release_connection(conn)
 
 
 @app.post("/create_sale/")
@@ -327,9 +408,7 @@ def create_new_sale( delivery_time: str,
                      ):
     conn = None
     try:
-        params = config_database()
-        
-        conn = psycopg2.connect(**params)
+        conn = get_connection()
         cur = conn.cursor()
 
         create_sale_sql = "insert into clients_sales ( delivery_time,\
@@ -378,7 +457,7 @@ def create_new_sale( delivery_time: str,
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
+            release_connection(conn)
 
 
 @app.post("/create_share/")
@@ -387,15 +466,57 @@ def create_new_share(driver_id: int,
                      amount: int,
                      weight: float,
                      price_per_kilo: float,
-                     status: str
+                     status: str,
+                     allocate: Optional[bool] = False,
+                     lock: Optional[str] = "wait"
                     ):
     conn = None
     try:
-        params = config_database()
-        
-        conn = psycopg2.connect(**params)
+        if allocate and lock not in ALLOCATION_LOCKS:
+            return {
+                "error": f"Unknown lock '{lock}', expected one of {', '.join(ALLOCATION_LOCKS)}"
+            }
+
+        conn = get_connection()
         cur = conn.cursor()
 
+        if allocate:
+            # the stock row stays locked until the commit below, so no one else can take the same remainder
+            if lock == "wait":
+                cur.execute("select set_config('lock_timeout', %s, true);",
+                            (settings.get("allocation", "lock_timeout", fallback="2s"),))
+
+            lock_stock_sql = "select remaining_amount,\
+                                     remaining_weight from purchases_stock where purchase_id = %s " + ALLOCATION_LOCKS[lock]
+
+            try:
+                cur.execute(lock_stock_sql, (purchase_id,))
+            except LockNotAvailable:
+                return {
+                    "error": f"Purchase {purchase_id} is being allocated by someone else, try again"
+                }
+
+            stock = cur.fetchone()
+
+            if stock is None and lock == "skip_locked":
+                # skip locked also skips nothing at all, a missing purchase must not be retried forever
+                cur.execute("select 1 from providers_purchases where id = %s;", (purchase_id,))
+                if cur.fetchone() is None:
+                    return {
+                        "error": f"There is no purchase {purchase_id}"
+                    }
+                return {
+                    "error": f"Purchase {purchase_id} is being allocated by someone else, try again"
+                }
+            if stock is None:
+                return {
+                    "error": f"There is no purchase {purchase_id}"
+                }
+            if amount > stock[0] or round(weight, 3) > round(stock[1], 3):
+                return {
+                    "error": f"Not enough left of purchase {purchase_id}: amount {stock[0]}, weight {stock[1]}"
+                }
+
         create_share_sql = "insert into drivers_share ( driver_id,\
                                                         purchase_id,\
                                                         amount,\
@@ -437,7 +558,7 @@ def create_new_share(driver_id: int,
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
+            release_connection(conn)
 
 
 @app.post("/create_story/")
@@ -450,9 +571,7 @@ def create_new_story(sale_id: int,
                     ):
     conn = None
     try:
-        params = config_database()
-        
-        conn = psycopg2.connect(**params)
+        conn = get_connection()
         cur = conn.cursor()
 
         total_price = weight * price_per_kilo if not total_price else total_price
@@ -497,7 +616,7 @@ def create_new_story(sale_id: int,
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
+            release_connection(conn)
 
 
 @app.post("/create_clients_future_sale/")
@@ -511,9 +630,7 @@ def create_clients_future_sale(client_id: int,
                                ):
     conn = None
     try:
-        params = config_database()
-        
-        conn = psycopg2.connect(**params)
+        conn = get_connection()
         cur = conn.cursor()
 
         create_future_sale_sql = "insert into clients_future_sales ( client,\
@@ -559,15 +676,13 @@ def create_clients_future_sale(client_id: int,
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
+            release_connection(conn)
 
 @app.post("/create_product/")
 def create_new_product(product_name: str):
     conn = None
     try:
-        params = config_database()
-        
-        conn = psycopg2.connect(**params)
+        conn = get_connection()
         cur = conn.cursor()
         
         create_product_sql = "insert into products (product_name) values (%s) returning id;"
@@ -579,6 +694,7 @@ def create_new_product(product_name: str):
         cur.close()
         
         conn.commit()
+        reference_cache.invalidate("products")
 
         current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
         logging.info(f"{current_time}---NEW PRODUCT | {product_name} | created successfully")
@@ -595,7 +711,7 @@ def create_new_product(product_name: str):
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
+            release_connection(conn)
 
 
 @app.post("/create_client_price/")
@@ -604,9 +720,7 @@ def create_new_client_price( product_name: str,
                              price: float ):
     conn = None
     try:
-        params = config_database()
-        
-        conn = psycopg2.connect(**params)
+        conn = get_connection()
         cur = conn.cursor()
         
         create_client_price_sql = "insert into clients_prices (product_name, client_id, price) values (%s, %s, %s) returning id;"
@@ -636,17 +750,419 @@ def create_new_client_price( product_name: str,
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
+            release_connection(conn)
+
+# ========================================================================== BULK CREATE
+@app.post("/create_purchases/")
+def create_new_purchases(purchases: List[NewPurchase]):
+    conn = None
+    try:
+        if not purchases:
+            return {"new_purchases": []}
+
+        conn = get_connection()
+        cur = conn.cursor()
+
+        rows = []
+        for purchase in purchases:
+            total_price = purchase.weight * purchase.price_per_kilo if not purchase.total_price else purchase.total_price
+            paid = 0 if not purchase.paid else purchase.paid
+            debt = total_price if not purchase.debt else purchase.debt
+
+            rows.append(( purchase.delivery_time,
+                          purchase.provider_id,
+                          purchase.product,
+                          purchase.amount,
+                          purchase.weight,
+                          purchase.price_per_kilo,
+                          total_price,
+                          paid,
+                          debt,
+                          purchase.comments,
+                          purchase.status ))
+
+        create_purchases_sql = "insert into providers_purchases ( delivery_time,\
+                                                                  provider,\
+                                                                  product,\
+                                                                  amount,\
+                                                                  weight,\
+                                                                  price_per_kilo,\
+                                                                  total_price,\
+                                                                  paid,\
+                                                                  debt,\
+                                                                  comments,\
+                                                                  status ) values %s returning id;"
+
+        # one multi-row insert, ids come back in the order of the rows
+        new_purchases_ids = execute_values(cur, create_purchases_sql, rows, page_size=len(rows), fetch=True)
+
+        cur.close()
+
+        conn.commit()
+
+        current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
+        logging.info(f"{current_time}---NEW PURCHASES | {len(rows)} created successfully")
+
+        return {
+            "new_purchases": [
+                {
+                    "id": new_purchase_id[0],
+                    "delivery_time": row[0],
+                    "provider": row[1],
+                    "product": row[2],
+                    "amount": row[3],
+                    "weight": row[4],
+                    "price_per_kilo": row[5],
+                    "total_price": row[6],
+                    "paid": row[7],
+                    "debt": row[8],
+                    "comments": row[9],
+                    "status": row[10]
+                } for new_purchase_id, row in zip(new_purchases_ids, rows)
+            ]
+        }
+
+    except (Exception, psycopg2.DatabaseError) as error:
+        logging.exception("Exception occurred")
+        return {"error": str(error)}
+    finally:
+        if conn is not None:
+            release_connection(conn)
+
+
+@app.post("/create_sales/")
+def create_new_sales(sales: List[NewSale]):
+    conn = None
+    try:
+        if not sales:
+            return {"new_sales": []}
+
+        conn = get_connection()
+        cur = conn.cursor()
+
+        rows = [( sale.delivery_time,
+                  sale.client_id,
+                  sale.provider_id,
+                  sale.driver_id,
+                  sale.paid,
+                  sale.debt,
+                  sale.comments,
+                  sale.status ) for sale in sales]
+
+        create_sales_sql = "insert into clients_sales ( delivery_time,\
+                                                        client,\
+                                                        provider,\
+                                                        driver,\
+                                                        paid,\
+                                                        debt,\
+                                                        comments,\
+                                                        status ) values %s returning id;"
+
+        new_sales_ids = execute_values(cur, create_sales_sql, rows, page_size=len(rows), fetch=True)
+
+        cur.close()
+
+        conn.commit()
+
+        current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
+        logging.info(f"{current_time}---NEW SALES | {len(rows)} created successfully")
+
+        return {
+            "new_sales": [
+                {
+                    "id": new_sale_id[0],
+                    "delivery_time": row[0],
+                    "client": row[1],
+                    "provider": row[2],
+                    "driver": row[3],
+                    "paid": row[4],
+                    "debt": row[5],
+                    "comments": row[6],
+                    "status": row[7]
+                } for new_sale_id, row in zip(new_sales_ids, rows)
+            ]
+        }
+
+    except (Exception, psycopg2.DatabaseError) as error:
+        logging.exception("Exception occurred")
+        return {"error": str(error)}
+    finally:
+        if conn is not None:
+            release_connection(conn)
+
+
+@app.post("/create_shares/")
+def create_new_shares(shares: List[NewShare]):
+    conn = None
+    try:
+        if not shares:
+            return {"new_shares": []}
+
+        conn = get_connection()
+        cur = conn.cursor()
+
+        rows = [( share.driver_id,
+                  share.purchase_id,
+                  share.amount,
+                  share.weight,
+                  share.price_per_kilo,
+                  share.status ) for share in shares]
+
+        create_shares_sql = "insert into drivers_share ( driver_id,\
+                                                         purchase_id,\
+                                                         amount,\
+                                                         weight,\
+                                                         price_per_kilo,\
+                                                         status ) values %s returning id;"
+
+        new_shares_ids = execute_values(cur, create_shares_sql, rows, page_size=len(rows), fetch=True)
+
+        cur.close()
+
+        conn.commit()
+
+        current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
+        logging.info(f"{current_time}---NEW SHARES | {len(rows)} created successfully")
+
+        return {
+            "new_shares": [
+                {
+                    "id": new_share_id[0],
+                    "driver_id": row[0],
+                    "purchase_id": row[1],
+                    "amount": row[2],
+                    "weight": row[3],
+                    "price_per_kilo": row[4],
+                    "status": row[5]
+                } for new_share_id, row in zip(new_shares_ids, rows)
+            ]
+        }
+
+    except (Exception, psycopg2.DatabaseError) as error:
+        logging.exception("Exception occurred")
+        return {"error": str(error)}
+    finally:
+        if conn is not None:
+            release_connection(conn)
+
+
+@app.post("/create_stories/")
+def create_new_stories(stories: List[NewStory]):
+    conn = None
+    try:
+        if not stories:
+            return {"new_stories": []}
+
+        conn = get_connection()
+        cur = conn.cursor()
+
+        rows = [( story.sale_id,
+                  story.share_id,
+                  story.amount,
+                  story.weight,
+                  story.price_per_kilo,
+                  story.weight * story.price_per_kilo if not story.total_price else story.total_price )
+                for story in stories]
+
+        create_stories_sql = "insert into history ( sale_id,\
+                                                    share_id,\
+                                                    amount,\
+                                                    weight,\
+                                                    price_per_kilo,\
+                                                    total_price ) values %s returning id;"
+
+        new_stories_ids = execute_values(cur, create_stories_sql, rows, page_size=len(rows), fetch=True)
+
+        cur.close()
+
+        conn.commit()
+
+        current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
+        logging.info(f"{current_time}---NEW STORIES | {len(rows)} created successfully")
+
+        return {
+            "new_stories": [
+                {
+                    "id": new_story_id[0],
+                    "sale_id": row[0],
+                    "share_id": row[1],
+                    "amount": row[2],
+                    "weight": row[3],
+                    "price_per_kilo": row[4],
+                    "total_price": row[5]
+                } for new_story_id, row in zip(new_stories_ids, rows)
+            ]
+        }
+
+    except (Exception, psycopg2.DatabaseError) as error:
+        logging.exception("Exception occurred")
+        return {"error": str(error)}
+    finally:
+        if conn is not None:
+            release_connection(conn)
+
+
+# ========================================================================== DELIVERY
+@app.post("/create_delivery/")
+def create_new_delivery(delivery: NewDelivery):
+    # the sale, the new shares and the history lines of one delivery, committed together or not at all
+    conn = None
+    try:
+        for line in delivery.lines:
+            if (line.share_id is None) == (line.purchase_id is None):
+                return {
+                    "error": "Every delivery line needs either 'share_id' or 'purchase_id'"
+                }
+
+        conn = get_connection()
+        cur = conn.cursor()
+
+        create_sale_sql = "insert into clients_sales ( delivery_time,\
+                                                       client,\
+                                                       provider,\
+                                                       driver,\
+                                                       paid,\
+                                                       debt,\
+                                                       comments,\
+                                                       status ) values (%s, %s, %s, %s, %s, %s, %s, %s) returning id;"
+
+        cur.execute(create_sale_sql, ( delivery.delivery_time,
+                                       delivery.client_id,
+                                       delivery.provider_id,
+                                       delivery.driver_id,
+                                       delivery.paid,
+                                       delivery.debt,
+                                       delivery.comments,
+                                       delivery.status ))
+
+        new_sale_id = cur.fetchone()[0]
+
+        share_rows = [( delivery.driver_id,
+                        line.purchase_id,
+                        line.amount,
+                        line.weight,
+                        line.price_per_kilo,
+                        line.share_status or delivery.status )
+                      for line in delivery.lines if line.share_id is None]
+
+        new_shares_ids = []
+        if share_rows:
+            create_shares_sql = "insert into drivers_share ( driver_id,\
+                                                             purchase_id,\
+                                                             amount,\
+                                                             weight,\
+                                                             price_per_kilo,\
+                                                             status ) values %s returning id;"
+
+            new_shares_ids = execute_values(cur, create_shares_sql, share_rows, page_size=len(share_rows), fetch=True)
+
+        new_share_id = iter(new_shares_ids)
+        story_rows = [( new_sale_id,
+                        line.share_id if line.share_id is not None else next(new_share_id)[0],
+                        line.amount,
+                        line.weight,
+                        line.price_per_kilo,
+                        line.weight * line.price_per_kilo if not line.total_price else line.total_price )
+                      for line in delivery.lines]
+
+        new_stories_ids = []
+        if story_rows:
+            create_stories_sql = "insert into history ( sale_id,\
+                                                        share_id,\
+                                                        amount,\
+                                                        weight,\
+                                                        price_per_kilo,\
+                                                        total_price ) values %s returning id;"
+
+            new_stories_ids = execute_values(cur, create_stories_sql, story_rows, page_size=len(story_rows), fetch=True)
+
+        cur.close()
+
+        conn.commit()
+
+        current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
+        logging.info(f"{current_time}---NEW DELIVERY | sale {new_sale_id} | c: {delivery.client_id} | d: {delivery.driver_id} | "
+                     f"{len(share_rows)} shares | {len(story_rows)} stories created successfully")
+
+        return {
+            "new_sale": {
+                "id": new_sale_id,
+                "delivery_time": delivery.delivery_time,
+                "client": delivery.client_id,
+                "provider": delivery.provider_id,
+                "driver": delivery.driver_id,
+                "paid": delivery.paid,
+                "debt": delivery.debt,
+                "comments": delivery.comments,
+                "status": delivery.status
+            },
+            "new_shares": [
+                {
+                    "id": new_share_id[0],
+                    "driver_id": row[0],
+                    "purchase_id": row[1],
+                    "amount": row[2],
+                    "weight": row[3],
+                    "price_per_kilo": row[4],
+                    "status": row[5]
+                } for new_share_id, row in zip(new_shares_ids, share_rows)
+            ],
+            "new_stories": [
+                {
+                    "id": new_story_id[0],
+                    "sale_id": row[0],
+                    "share_id": row[1],
+                    "amount": row[2],
+                    "weight": row[3],
+                    "price_per_kilo": row[4],
+                    "total_price": row[5]
+                } for new_story_id, row in zip(new_stories_ids, story_rows)
+            ]
+        }
+
+    except (Exception, psycopg2.DatabaseError) as error:
+        logging.exception("Exception occurred")
+        return {"error": str(error)}
+    finally:
+        if conn is not None:
+            release_connection(conn)
+
+
+# ========================================================================== IMPORT
+# curl -X POST --data-binary @purchases.csv "http://127.0.0.1:8000/import/purchases/?format=csv"
+@app.post("/import/{kind}/")
+async def import_data(kind: str, request: Request, format: Optional[str] = "csv"):
+    conn = None
+    # the body goes to memory first and to a temp file once it is big, never whole into a bytes object
+    body = SpooledTemporaryFile(max_size=IMPORT_SPOOL_SIZE)
+    try:
+        # past max_size the writes go to disk, off the event loop like the rest of the import
+        async for chunk in request.stream():
+            await run_in_threadpool(body.write, chunk)
+        await run_in_threadpool(body.seek, 0)
+
+        conn = await run_in_threadpool(get_connection)
+        imported_count = await run_in_threadpool(import_file, conn, kind, body, format)
+
+        return {"kind": kind, "imported": imported_count}
+
+    except ImportValidationError as error:
+        return {"error": str(error), "lines": error.lines}
+    except (Exception, psycopg2.DatabaseError) as error:
+        logging.exception("Exception occurred")
+        return {"error": str(error)}
+    finally:
+        await run_in_threadpool(body.close)
+        if conn is not None:
+            await run_in_threadpool(release_connection, conn)
+
 
 # ========================================================================================= GET
 @app.get("/get_all_users/")
-def get_all_users():
+async def get_all_users():
     conn = None
     try:
-        params = config_database()
-        
-        conn = psycopg2.connect(**params)
-        cur = conn.cursor()
+        conn = await get_async_connection(read_only=True)
         
         get_all_users_sql = "select id,\
                                     name,\
@@ -654,83 +1170,66 @@ def get_all_users():
                                     login,\
                                     password from users;"
 
-        cur.itersize = 200
-                                                
-        cur.execute(get_all_users_sql)
+        rows = await conn.fetch(get_all_users_sql)
 
         users_json = {user[0]: { "name": user[1],
                                  "contacts": user[2],
                                  "login": user[3],
-                                 "password": user[4] } for user in cur}
-        
-        cur.close()
-        
-        conn.commit()
+                                 "password": user[4] } for user in rows}
 
         current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
         logging.info(f"{current_time}---GOT ALL USERS successfully")
         
-        return {
+        return FastJSONResponse({
             "users": users_json
-        }
+        })
 
-    except (Exception, psycopg2.DatabaseError) as error:
+    except (Exception, asyncpg.PostgresError) as error:
         logging.exception("Exception occurred")
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
+            await release_async_connection(conn)
 
 
 @app.get("/get_all_providers/")
-def get_all_providers():
+@cached("providers")
+async def get_all_providers():
     conn = None
     try:
-        params = config_database()
-        
-        conn = psycopg2.connect(**params)
-        cur = conn.cursor()
+        conn = await get_async_connection(read_only=True)
         
         get_all_providers_sql = "select id,\
                                         name,\
                                         contacts,\
                                         comments from providers;"
 
-        cur.itersize = 200
-                                                
-        cur.execute(get_all_providers_sql)
+        rows = await conn.fetch(get_all_providers_sql)
 
         providers_json = {provider[0]: { "name": provider[1],
                                          "contacts": provider[2],
-                                         "comments": provider[3] } for provider in cur}
-        
-        cur.close()
-        
-        conn.commit()
+                                         "comments": provider[3] } for provider in rows}
 
         current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
         logging.info(f"{current_time}---GOT ALL PROVIDERS successfully")
         
-        return {
+        return FastJSONResponse({
             "providers": providers_json
-        }
+        })
 
-    except (Exception, psycopg2.DatabaseError) as error:
+    except (Exception, asyncpg.PostgresError) as error:
         logging.exception("Exception occurred")
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
+            await release_async_connection(conn)
 
 
 @app.get("/get_all_clients/")
-def get_all_clients():
+async def get_all_clients():
     conn = None
     try:
-        params = config_database()
-
-        conn = psycopg2.connect(**params)
-        cur = conn.cursor()
+        conn = await get_async_connection(read_only=True)
 
         get_all_clients_sql = "select clients.id,\
                                       name,\
@@ -751,9 +1250,7 @@ def get_all_clients():
                                       sunday from clients \
                                         left join clients_work_hours on clients.id = clients_work_hours.client_id;"
 
-        cur.itersize = 200
-                                                
-        cur.execute(get_all_clients_sql)
+        rows = await conn.fetch(get_all_clients_sql)
 
         clients_json = {client[0]: { "name": client[1],
                                      "entity": client[2],
@@ -771,164 +1268,207 @@ def get_all_clients():
                                          "thursday": client[13],
                                          "friday": client[14],
                                          "saturday": client[15],
-                                         "sunday": client[16] } } for client in cur}
-
-        cur.close()
-
-        conn.commit()
+                                         "sunday": client[16] } } for client in rows}
 
         current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
         logging.info(f"{current_time}---GOT ALL CLIENTS successfully")
 
-        return {
+        return FastJSONResponse({
             "clients": clients_json
-        }
+        })
 
-    except (Exception, psycopg2.DatabaseError) as error:
+    except (Exception, asyncpg.PostgresError) as error:
         logging.exception("Exception occurred")
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
+            await release_async_connection(conn)
+
+
+def purchase_to_json(purchase):
+    return { "delivery_time": purchase[1],
+             "provider": {
+                 "id": purchase[2],
+                 "name": purchase[3],
+                 "contacts": purchase[4],
+                 "comments": purchase[5]
+             },
+             "product": purchase[6],
+             "amount": purchase[7],
+             "weight": purchase[8],
+             "price_per_kilo": purchase[9],
+             "total_price": purchase[10],
+             "paid": purchase[11],
+             "debt": purchase[12],
+             "comments": purchase[13],
+             "status": purchase[14] }
+
+
+# header of format=columns, row position -> dotted path of the same value in purchase_to_json
+PURCHASE_COLUMNS = column_names(purchase_to_json)
+
+# the rows purchase_to_json reads, the list endpoint adds its filters and pages, PATCH the updated id
+PURCHASES_SELECT_SQL = "select providers_purchases.id,\
+                                      delivery_time,\
+                                      providers.id,\
+                                      providers.name,\
+                                      providers.contacts,\
+                                      providers.comments,\
+                                      product,\
+                                      amount,\
+                                      weight,\
+                                      price_per_kilo,\
+                                      total_price,\
+                                      paid,\
+                                      debt,\
+                                      providers_purchases.comments,\
+                                      status from providers_purchases \
+                                        left join providers on providers_purchases.provider = providers.id"
 
 
 @app.get("/get_all_purchases/")
-def get_all_purchases(provider_id: Optional[int] = None, product_name: Optional[str] = None, status: Optional[str] = None):
+async def get_all_purchases(provider_id: Optional[int] = None, product_name: Optional[str] = None, status: Optional[str] = None,
+                            limit: Optional[int] = None, cursor: Optional[str] = None,
+                            stream: Optional[str] = None, accept: Optional[str] = Header(None),
+                            format: Optional[str] = None):
     conn = None
     try:
-        params = config_database()
-
-        conn = psycopg2.connect(**params)
-        cur = conn.cursor()
+        check_format(format, COLUMNS_FORMAT)
 
         filter_str = ""
 
         is_already_one_filter = False
 
+        parametrs_to_cur = []
+
         if (provider_id is not None) or (product_name is not None) or (status is not None):
             filter_str = " where "
         
             if provider_id is not None:
                 is_already_one_filter = True
-                filter_str += r"providers.id = %s"
+                parametrs_to_cur.append(provider_id)
+                filter_str += f"providers.id = ${len(parametrs_to_cur)}"
             
             if product_name is not None:
                 if is_already_one_filter:
                     filter_str += " and "
                 
                 is_already_one_filter = True
-                filter_str += r"product = %s"
+                parametrs_to_cur.append(product_name)
+                filter_str += f"product = ${len(parametrs_to_cur)}"
             
             if status is not None:
                 if is_already_one_filter:
                     filter_str += " and "
                 
                 is_already_one_filter = True
-                filter_str += r"status = %s"
+                parametrs_to_cur.append(status)
+                filter_str += f"status = ${len(parametrs_to_cur)}"
 
-        get_all_purchases_sql = "select providers_purchases.id,\
-                                      delivery_time,\
-                                      providers.id,\
-                                      providers.name,\
-                                      providers.contacts,\
-                                      providers.comments,\
-                                      product,\
-                                      amount,\
-                                      weight,\
-                                      price_per_kilo,\
-                                      total_price,\
-                                      paid,\
-                                      debt,\
-                                      providers_purchases.comments,\
-                                      status from providers_purchases \
-                                        left join providers on providers_purchases.provider = providers.id" + filter_str + ";"
+        is_paginated = (limit is not None) or (cursor is not None)
 
-        cur.itersize = 200
+        page_str = ""
 
-        parametrs_to_cur = []
+        if cursor is not None:
+            filter_str += page_filter(PURCHASES_PAGE_KEY, cursor, parametrs_to_cur, is_already_one_filter)
 
-        if provider_id is not None:
-            parametrs_to_cur.append(provider_id)
-        
-        if product_name is not None:
-            parametrs_to_cur.append(product_name)
-        
-        if status is not None:
-            parametrs_to_cur.append(status)
-
-        cur.execute(get_all_purchases_sql, tuple(parametrs_to_cur))           
-
-        purchases_json = {purchase[0]: { "delivery_time": purchase[1],
-                                         "provider": {
-                                             "id": purchase[2],
-                                             "name": purchase[3],
-                                             "contacts": purchase[4],
-                                             "comments": purchase[5]
-                                         },
-                                         "product": purchase[6],
-                                         "amount": purchase[7],
-                                         "weight": purchase[8],
-                                         "price_per_kilo": purchase[9],
-                                         "total_price": purchase[10],
-                                         "paid": purchase[11],
-                                         "debt": purchase[12],
-                                         "comments": purchase[13],
-                                         "status": purchase[14] } for purchase in cur}
+        if is_paginated:
+            page_str = page_order(PURCHASES_PAGE_KEY, limit, parametrs_to_cur)
 
-        cur.close()
+        get_all_purchases_sql = PURCHASES_SELECT_SQL + filter_str + page_str + ";"
 
-        conn.commit()
+        if format is None and wants_ndjson(stream, accept):
+            return ndjson_response(get_all_purchases_sql, parametrs_to_cur, purchase_to_json, "PURCHASES",
+                                   limit=limit, cursor_positions=(1, 0) if is_paginated else None)
 
-        current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
-        logging.info(f"{current_time}---GOT PURCHASES successfully")
+        conn = await get_async_connection(read_only=True)
 
-        return {
-            "purchases": purchases_json
-        }
-
-    except (Exception, psycopg2.DatabaseError) as error:
-        logging.exception("Exception occurred")
-        return {"error": str(error)}
-    finally:
-        if conn is not None:
-            conn.close()
+        if format == COLUMNS_FORMAT:
+            rows = [tuple(purchase) async for purchase in iterate_rows(conn, get_all_purchases_sql, *parametrs_to_cur)]
 
+            response = {
+                "columns": PURCHASE_COLUMNS,
+                "rows": rows
+            }
 
-@app.get("/get_all_sales/")
-def get_all_sales(driver_id: Optional[int] = None, client_id: Optional[int] = None, status: Optional[str] = None):
-    conn = None
-    try:
-        params = config_database()
+            if is_paginated:
+                response["next_cursor"] = next_page_cursor_from_rows(rows, limit, 1, 0)
+        else:
+            purchases_json = {purchase[0]: purchase_to_json(purchase) async for purchase in iterate_rows(conn, get_all_purchases_sql, *parametrs_to_cur)}
 
-        conn = psycopg2.connect(**params)
-        cur = conn.cursor()
+            response = {
+                "purchases": purchases_json
+            }
 
-        filter_str = ""
+            if is_paginated:
+                response["next_cursor"] = next_page_cursor(purchases_json, limit, "delivery_time")
 
-        is_already_one_filter = False
+        current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
+        logging.info(f"{current_time}---GOT PURCHASES successfully")
 
-        if (driver_id is not None) or (client_id is not None) or (status is not None):
-            filter_str = " where "
-        
-            if driver_id is not None:
-                is_already_one_filter = True
-                filter_str += r"s_driver.id = %s"
-            
-            if client_id is not None:
-                if is_already_one_filter:
-                    filter_str += " and "
-                
-                is_already_one_filter = True
-                filter_str += r"s_client.id = %s"
-            
-            if status is not None:
-                if is_already_one_filter:
-                    filter_str += " and "
-                
-                is_already_one_filter = True
-                filter_str += r"cs.status = %s"
+        return FastJSONResponse(response)
 
-        get_all_sales_sql = "select cs.id,\
+    except (Exception, asyncpg.PostgresError) as error:
+        logging.exception("Exception occurred")
+        return {"error": str(error)}
+    finally:
+        if conn is not None:
+            await release_async_connection(conn)
+
+
+def sale_to_json(sale):
+    return {
+        "delivery_time": sale[1],
+        "client": {
+            "id": sale[2],
+            "name": sale[3],
+            "entity": sale[4],
+            "address": sale[5],
+            "address_comments": sale[6],
+            "network": sale[7],
+            "payment": sale[8],
+            "default_provider_id": sale[9],
+            "default_provider": {
+                "id": sale[10],
+                "name": sale[11],
+                "contacts": sale[12],
+                "comments": sale[13]
+            },
+            "recoil": sale[14],
+            "comments": sale[15],
+            "work_hours": {
+                "monday": sale[16],
+                "tuesday": sale[17],
+                "wednesday": sale[18],
+                "thursday": sale[19],
+                "friday": sale[20],
+                "saturday": sale[21],
+                "sunday": sale[22]
+            }
+        },
+        "provider": {
+            "id": sale[23],
+            "name": sale[24],
+            "contacts": sale[25],
+            "comments": sale[26]
+        },
+        "driver": {
+            "id": sale[27],
+            "name": sale[28],
+            "contacts": sale[29]
+        },
+        "paid": sale[30],
+        "debt": sale[31],
+        "comments": sale[32],
+        "status": sale[33]
+    }
+
+
+# header of format=columns, row position -> dotted path of the same value in sale_to_json
+SALE_COLUMNS = column_names(sale_to_json)
+
+# the rows sale_to_json reads, the list endpoint adds its filters and pages, PATCH the updated id
+SALES_SELECT_SQL = "select cs.id,\
                                     cs.delivery_time,\
                                     s_client.id,\
                                     s_client.name,\
@@ -966,124 +1506,187 @@ def get_all_sales(driver_id: Optional[int] = None, client_id: Optional[int] = No
                                     left join providers s_provider on cs.provider = s_provider.id\
                                     left join users s_driver on cs.driver = s_driver.id\
                                     left join clients_work_hours cwh on cs.client = cwh.client_id\
-                                    left join providers def_prov on s_client.default_provider = def_prov.id" + filter_str + ";"
-
-        cur.itersize = 200
-
-        parametrs_to_cur = []
-
-        if driver_id is not None:
-            parametrs_to_cur.append(driver_id)
-        
-        if client_id is not None:
-            parametrs_to_cur.append(client_id)
-        
-        if status is not None:
-            parametrs_to_cur.append(status)
-
-        cur.execute(get_all_sales_sql, tuple(parametrs_to_cur))
-        
-
-        sales_json = {sale[0]: { 
-            "delivery_time": sale[1],
-            "client": {
-                "id": sale[2],
-                "name": sale[3],
-                "entity": sale[4],
-                "address": sale[5],
-                "address_comments": sale[6],
-                "network": sale[7],
-                "payment": sale[8],
-                "default_provider_id": sale[9],
-                "default_provider": {
-                    "id": sale[10],
-                    "name": sale[11],
-                    "contacts": sale[12],
-                    "comments": sale[13]
-                },
-                "recoil": sale[14],
-                "comments": sale[15],
-                "work_hours": {
-                    "monday": sale[16],
-                    "tuesday": sale[17],
-                    "wednesday": sale[18],
-                    "thursday": sale[19],
-                    "friday": sale[20],
-                    "saturday": sale[21],
-                    "sunday": sale[22]
-                }
-            },
-            "provider": {
-                "id": sale[23],
-                "name": sale[24],
-                "contacts": sale[25],
-                "comments": sale[26]
-            },
-            "driver": {
-                "id": sale[27],
-                "name": sale[28],
-                "contacts": sale[29]
-            },
-            "paid": sale[30],
-            "debt": sale[31],
-            "comments": sale[32],
-            "status": sale[33]
-        } for sale in cur}
-
-        cur.close()
-
-        conn.commit()
-
-        current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
-        logging.info(f"{current_time}---GOT SALES successfully")
-
-        return {
-            "sales": sales_json
-        }
-
-    except (Exception, psycopg2.DatabaseError) as error:
-        logging.exception("Exception occurred")
-        return {"error": str(error)}
-    finally:
-        if conn is not None:
-            conn.close()
+                                    left join providers def_prov on s_client.default_provider = def_prov.id"
 
 
-@app.get("/get_all_shares/")
-def get_all_shares(driver_id: Optional[int] = None, purchase_id: Optional[int] = None, status: Optional[str] = None):
+@app.get("/get_all_sales/")
+async def get_all_sales(driver_id: Optional[int] = None, client_id: Optional[int] = None, status: Optional[str] = None,
+                        limit: Optional[int] = None, cursor: Optional[str] = None,
+                        stream: Optional[str] = None, accept: Optional[str] = Header(None),
+                        format: Optional[str] = None, fields: Optional[str] = None, expand: Optional[str] = None,
+                        if_none_match: Optional[str] = Header(None)):
     conn = None
     try:
-        params = config_database()
-
-        conn = psycopg2.connect(**params)
-        cur = conn.cursor()
+        check_format(format, COLUMNS_FORMAT, NORMALIZED_FORMAT)
 
         filter_str = ""
 
         is_already_one_filter = False
 
-        if (driver_id is not None) or (purchase_id is not None) or (status is not None):
+        parametrs_to_cur = []
+
+        if (driver_id is not None) or (client_id is not None) or (status is not None):
             filter_str = " where "
         
             if driver_id is not None:
                 is_already_one_filter = True
-                filter_str += r"dr.id = %s"
+                parametrs_to_cur.append(driver_id)
+                filter_str += f"cs.driver = ${len(parametrs_to_cur)}"
             
-            if purchase_id is not None:
+            if client_id is not None:
                 if is_already_one_filter:
                     filter_str += " and "
                 
                 is_already_one_filter = True
-                filter_str += r"pp.id = %s"
+                parametrs_to_cur.append(client_id)
+                filter_str += f"cs.client = ${len(parametrs_to_cur)}"
             
             if status is not None:
                 if is_already_one_filter:
                     filter_str += " and "
                 
                 is_already_one_filter = True
-                filter_str += r"ds.status = %s"
+                parametrs_to_cur.append(status)
+                filter_str += f"cs.status = ${len(parametrs_to_cur)}"
+
+        is_paginated = (limit is not None) or (cursor is not None)
+
+        page_str = ""
+
+        if cursor is not None:
+            filter_str += page_filter(SALES_PAGE_KEY, cursor, parametrs_to_cur, is_already_one_filter)
+
+        if is_paginated:
+            page_str = page_order(SALES_PAGE_KEY, limit, parametrs_to_cur)
+
+        get_all_sales_sql = SALES_SELECT_SQL + filter_str + page_str + ";"
+
+        sale_fields_to_json = None
+
+        if (fields is not None) or (expand is not None):
+            if format is not None:
+                raise Exception("fields and expand can't be combined with format")
+
+            # e.g. a status board with fields=delivery_time,status,debt,client.name joins clients only
+            select_sql, sale_fields_to_json = select_fields(SALE_FIELDSET, fields, expand)
+            get_all_sales_sql = select_sql + filter_str + page_str + ";"
+
+        if format == NORMALIZED_FORMAT:
+            # only the sale's own columns, the client, provider and driver go to "included"
+            get_all_sales_sql = "select cs.id, cs.delivery_time, cs.client, cs.provider, cs.driver, cs.paid, cs.debt, cs.comments, cs.status\
+                                     from clients_sales cs" + filter_str + page_str + ";"
 
-        get_all_share_sql = "select ds.id,\
+        if format is None and wants_ndjson(stream, accept):
+            if sale_fields_to_json is not None:
+                return ndjson_response(get_all_sales_sql, parametrs_to_cur, sale_fields_to_json, "SALES",
+                                       limit=limit, cursor_positions=(1, 0) if is_paginated else None)
+
+            return ndjson_response(get_all_sales_sql, parametrs_to_cur, sale_to_json, "SALES",
+                                   limit=limit, cursor_positions=(1, 0) if is_paginated else None)
+
+        conn = await get_async_connection(read_only=True)
+
+        etag = await table_etag(conn, SALES_TABLES, get_all_sales_sql, [*parametrs_to_cur, format, fields, expand])
+        if etag_matches(if_none_match, etag):
+            current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
+            logging.info(f"{current_time}---SALES NOT MODIFIED")
+            return Response(status_code=304, headers={"ETag": etag})
+
+        if format == COLUMNS_FORMAT:
+            rows = [tuple(sale) async for sale in iterate_rows(conn, get_all_sales_sql, *parametrs_to_cur)]
+
+            response = {
+                "columns": SALE_COLUMNS,
+                "rows": rows
+            }
+
+            if is_paginated:
+                response["next_cursor"] = next_page_cursor_from_rows(rows, limit, 1, 0)
+        elif sale_fields_to_json is not None:
+            rows = [sale async for sale in iterate_rows(conn, get_all_sales_sql, *parametrs_to_cur)]
+
+            sales_json = {sale[0]: sale_fields_to_json(sale) for sale in rows}
+
+            response = {
+                "sales": sales_json
+            }
+
+            if is_paginated:
+                response["next_cursor"] = next_page_cursor_from_rows(rows, limit, 1, 0)
+        elif format == NORMALIZED_FORMAT:
+            sales_json = {sale[0]: normalized_sale_to_json(sale) async for sale in iterate_rows(conn, get_all_sales_sql, *parametrs_to_cur)}
+
+            response = {
+                "sales": sales_json,
+                "included": await load_included(conn,
+                                                clients=[sale["client_id"] for sale in sales_json.values()],
+                                                providers=[sale["provider_id"] for sale in sales_json.values()],
+                                                users=[sale["driver_id"] for sale in sales_json.values()])
+            }
+
+            if is_paginated:
+                response["next_cursor"] = next_page_cursor(sales_json, limit, "delivery_time")
+        else:
+            sales_json = {sale[0]: sale_to_json(sale) async for sale in iterate_rows(conn, get_all_sales_sql, *parametrs_to_cur)}
+
+            response = {
+                "sales": sales_json
+            }
+
+            if is_paginated:
+                response["next_cursor"] = next_page_cursor(sales_json, limit, "delivery_time")
+
+        current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
+        logging.info(f"{current_time}---GOT SALES successfully")
+
+        return FastJSONResponse(response, headers={"ETag": etag})
+
+    except (Exception, asyncpg.PostgresError) as error:
+        logging.exception("Exception occurred")
+        return {"error": str(error)}
+    finally:
+        if conn is not None:
+            await release_async_connection(conn)
+
+
+def share_to_json(share):
+    return {
+        "driver": {
+            "id": share[1],
+            "name": share[2],
+            "contacts": share[3]
+        },
+        "purchase": {
+            "id": share[4],
+            "delivery_time": share[5],
+            "provider": {
+                "id": share[6],
+                "name": share[7],
+                "contacts": share[8],
+                "comments": share[9]
+            },
+            "product": share[10],
+            "amount": share[11],
+            "weight": share[12],
+            "price_per_kilo": share[13],
+            "total_price": share[14],
+            "paid": share[15],
+            "debt": share[16],
+            "comments": share[17],
+            "status": share[18]
+        },
+        "amount": share[19],
+        "weight": share[20],
+        "price_per_kilo": share[21],
+        "status": share[22]
+    }
+
+
+# header of format=columns, row position -> dotted path of the same value in share_to_json
+SHARE_COLUMNS = column_names(share_to_json)
+
+# the rows share_to_json reads, the list endpoint adds its filters and pages, PATCH the updated id
+SHARES_SELECT_SQL = "select ds.id,\
                                     dr.id,\
                                     dr.name,\
                                     dr.contacts,\
@@ -1108,108 +1711,192 @@ def get_all_shares(driver_id: Optional[int] = None, purchase_id: Optional[int] =
                                     ds.status from drivers_share ds\
                                     left join users dr on ds.driver_id = dr.id\
                                     left join providers_purchases pp on ds.purchase_id = pp.id\
-                                    left join providers pr on pp.provider = pr.id" + filter_str + ";"
-
-        cur.itersize = 200
+                                    left join providers pr on pp.provider = pr.id"
 
-        parametrs_to_cur = []
-
-        if driver_id is not None:
-            parametrs_to_cur.append(driver_id)
-        
-        if purchase_id is not None:
-            parametrs_to_cur.append(purchase_id)
-        
-        if status is not None:
-            parametrs_to_cur.append(status)
 
-        cur.execute(get_all_share_sql, tuple(parametrs_to_cur))
-
-        shares_json = {share[0]: { 
-            "driver": {
-                "id": share[1],
-                "name": share[2],
-                "contacts": share[3]
-            },
-            "purchase": {
-                "id": share[4],
-                "delivery_time": share[5],
-                "provider": {
-                    "id": share[6],
-                    "name": share[7],
-                    "contacts": share[8],
-                    "comments": share[9]
-                },
-                "product": share[10],
-                "amount": share[11],
-                "weight": share[12],
-                "price_per_kilo": share[13],
-                "total_price": share[14],
-                "paid": share[15],
-                "debt": share[16],
-                "comments": share[17],
-                "status": share[18]
-            },
-            "amount": share[19],
-            "weight": share[20],
-            "price_per_kilo": share[21],
-            "status": share[22]
-        } for share in cur}
-
-        cur.close()
-
-        conn.commit()
-
-        current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
-        logging.info(f"{current_time}---GOT DRIVERS SHARES successfully")
-
-        return {
-            "shares": shares_json
-        }
-
-    except (Exception, psycopg2.DatabaseError) as error:
-        logging.exception("Exception occurred")
-        return {"error": str(error)}
-    finally:
-        if conn is not None:
-            conn.close()
-
-
-@app.get("/get_all_history/")
-def get_all_history(client_id: Optional[int] = None, driver_id: Optional[int] = None, provider_id: Optional[int] = None):
+@app.get("/get_all_shares/")
+async def get_all_shares(driver_id: Optional[int] = None, purchase_id: Optional[int] = None, status: Optional[str] = None,
+                         limit: Optional[int] = None, cursor: Optional[str] = None,
+                         stream: Optional[str] = None, accept: Optional[str] = Header(None),
+                         format: Optional[str] = None):
     conn = None
     try:
-        params = config_database()
-
-        conn = psycopg2.connect(**params)
-        cur = conn.cursor()
+        check_format(format, COLUMNS_FORMAT)
 
         filter_str = ""
 
         is_already_one_filter = False
 
-        if (client_id is not None) or (driver_id is not None) or (provider_id is not None):
+        parametrs_to_cur = []
+
+        if (driver_id is not None) or (purchase_id is not None) or (status is not None):
             filter_str = " where "
         
-            if client_id is not None:
+            if driver_id is not None:
                 is_already_one_filter = True
-                filter_str += r"s_client.id = %s"
+                parametrs_to_cur.append(driver_id)
+                filter_str += f"dr.id = ${len(parametrs_to_cur)}"
             
-            if driver_id is not None:
+            if purchase_id is not None:
                 if is_already_one_filter:
                     filter_str += " and "
                 
                 is_already_one_filter = True
-                filter_str += r"dr.id = %s"
+                parametrs_to_cur.append(purchase_id)
+                filter_str += f"pp.id = ${len(parametrs_to_cur)}"
             
-            if provider_id is not None:
+            if status is not None:
                 if is_already_one_filter:
                     filter_str += " and "
                 
                 is_already_one_filter = True
-                filter_str += r"pr.id = %s"
+                parametrs_to_cur.append(status)
+                filter_str += f"ds.status = ${len(parametrs_to_cur)}"
+
+        is_paginated = (limit is not None) or (cursor is not None)
+
+        page_str = ""
+
+        if cursor is not None:
+            filter_str += page_filter(SHARES_PAGE_KEY, cursor, parametrs_to_cur, is_already_one_filter)
+
+        if is_paginated:
+            page_str = page_order(SHARES_PAGE_KEY, limit, parametrs_to_cur)
+
+        get_all_share_sql = SHARES_SELECT_SQL + filter_str + page_str + ";"
+
+        if format is None and wants_ndjson(stream, accept):
+            return ndjson_response(get_all_share_sql, parametrs_to_cur, share_to_json, "DRIVERS SHARES",
+                                   limit=limit, cursor_positions=(0,) if is_paginated else None)
+
+        conn = await get_async_connection(read_only=True)
+
+        rows = await conn.fetch(get_all_share_sql, *parametrs_to_cur)
+
+        if format == COLUMNS_FORMAT:
+            rows = [tuple(share) for share in rows]
+
+            response = {
+                "columns": SHARE_COLUMNS,
+                "rows": rows
+            }
+
+            if is_paginated:
+                response["next_cursor"] = next_page_cursor_from_rows(rows, limit, 0)
+        else:
+            shares_json = {share[0]: share_to_json(share) for share in rows}
+
+            response = {
+                "shares": shares_json
+            }
+
+            if is_paginated:
+                response["next_cursor"] = next_page_cursor(shares_json, limit)
+
+        current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
+        logging.info(f"{current_time}---GOT DRIVERS SHARES successfully")
+
+        return FastJSONResponse(response)
+
+    except (Exception, asyncpg.PostgresError) as error:
+        logging.exception("Exception occurred")
+        return {"error": str(error)}
+    finally:
+        if conn is not None:
+            await release_async_connection(conn)
+
 
-        get_all_history_sql = "select h.id,\
+def story_to_json(story):
+    return {
+        "sale": {
+            "id": story[1],
+            "delivery_time": story[2],
+            "client": {
+                "id": story[3],
+                "name": story[4],
+                "entity": story[5],
+                "address": story[6],
+                "address_comments": story[7],
+                "network": story[8],
+                "payment": story[9],
+                "default_provider_id": story[10],
+                "default_provider": {
+                    "id": story[11],
+                    "name": story[12],
+                    "contacts": story[13],
+                    "comments": story[14]
+                },
+                "recoil": story[15],
+                "comments": story[16],
+                "work_hours": {
+                    "monday": story[17],
+                    "tuesday": story[18],
+                    "wednesday": story[19],
+                    "thursday": story[20],
+                    "friday": story[21],
+                    "saturday": story[22],
+                    "sunday": story[23]
+                }
+            },
+            "provider": {
+                "id": story[24],
+                "name": story[25],
+                "contacts": story[26],
+                "comments": story[27]
+            },
+            "driver": {
+                "id": story[28],
+                "name": story[29],
+                "contacts": story[30]
+            },
+            "paid": story[31],
+            "debt": story[32],
+            "comments": story[33],
+            "status": story[34]
+        },
+        "share": {
+            "id": story[35], 
+            "driver": {
+                "id": story[36],
+                "name": story[37],
+                "contacts": story[38]
+            },
+            "purchase": {
+                "id": story[39],
+                "delivery_time": story[40],
+                "provider": {
+                    "id": story[41],
+                    "name": story[42],
+                    "contacts": story[43],
+                    "comments": story[44]
+                },
+                "product": story[45],
+                "amount": story[46],
+                "weight": story[47],
+                "price_per_kilo": story[48],
+                "total_price": story[49],
+                "paid": story[50],
+                "debt": story[51],
+                "comments": story[52],
+                "status": story[53]
+            },
+            "amount": story[54],
+            "weight": story[55],
+            "price_per_kilo": story[56],
+            "status": story[57]
+        },
+        "amount": story[58],
+        "weight": story[59],
+        "price_per_kilo": story[60],
+        "total_price": story[61]
+    }
+
+
+# header of format=columns, row position -> dotted path of the same value in story_to_json
+STORY_COLUMNS = column_names(story_to_json)
+
+# the rows story_to_json reads, the list endpoint adds its filters and pages, PATCH the updated id
+HISTORY_SELECT_SQL = "select h.id,\
                                     cs.id,\
                                     cs.delivery_time,\
                                     s_client.id,\
@@ -1280,384 +1967,340 @@ def get_all_history(client_id: Optional[int] = None, driver_id: Optional[int] =
                                     left join drivers_share ds on h.share_id = ds.id\
                                     left join users dr on ds.driver_id = dr.id\
                                     left join providers_purchases pp on ds.purchase_id = pp.id\
-                                    left join providers pr on pp.provider = pr.id" + filter_str + ";"
+                                    left join providers pr on pp.provider = pr.id"
 
-        cur.itersize = 200
+
+@app.get("/get_all_history/")
+async def get_all_history(client_id: Optional[int] = None, driver_id: Optional[int] = None, provider_id: Optional[int] = None,
+                          limit: Optional[int] = None, cursor: Optional[str] = None,
+                          stream: Optional[str] = None, accept: Optional[str] = Header(None),
+                          format: Optional[str] = None):
+    conn = None
+    try:
+        check_format(format, COLUMNS_FORMAT, NORMALIZED_FORMAT)
+
+        filter_str = ""
+
+        is_already_one_filter = False
 
         parametrs_to_cur = []
 
-        if client_id is not None:
-            parametrs_to_cur.append(client_id)
-        
-        if driver_id is not None:
-            parametrs_to_cur.append(driver_id)
-        
-        if provider_id is not None:
-            parametrs_to_cur.append(provider_id)
-
-        cur.execute(get_all_history_sql, tuple(parametrs_to_cur))
-
-        history_json = {story[0]: { 
-            "sale": {
-                "id": story[1],
-                "delivery_time": story[2],
-                "client": {
-                    "id": story[3],
-                    "name": story[4],
-                    "entity": story[5],
-                    "address": story[6],
-                    "address_comments": story[7],
-                    "network": story[8],
-                    "payment": story[9],
-                    "default_provider_id": story[10],
-                    "default_provider": {
-                        "id": story[11],
-                        "name": story[12],
-                        "contacts": story[13],
-                        "comments": story[14]
-                    },
-                    "recoil": story[15],
-                    "comments": story[16],
-                    "work_hours": {
-                        "monday": story[17],
-                        "tuesday": story[18],
-                        "wednesday": story[19],
-                        "thursday": story[20],
-                        "friday": story[21],
-                        "saturday": story[22],
-                        "sunday": story[23]
-                    }
-                },
-                "provider": {
-                    "id": story[24],
-                    "name": story[25],
-                    "contacts": story[26],
-                    "comments": story[27]
-                },
-                "driver": {
-                    "id": story[28],
-                    "name": story[29],
-                    "contacts": story[30]
-                },
-                "paid": story[31],
-                "debt": story[32],
-                "comments": story[33],
-                "status": story[34]
-            },
-            "share": {
-                "id": story[35], 
-                "driver": {
-                    "id": story[36],
-                    "name": story[37],
-                    "contacts": story[38]
-                },
-                "purchase": {
-                    "id": story[39],
-                    "delivery_time": story[40],
-                    "provider": {
-                        "id": story[41],
-                        "name": story[42],
-                        "contacts": story[43],
-                        "comments": story[44]
-                    },
-                    "product": story[45],
-                    "amount": story[46],
-                    "weight": story[47],
-                    "price_per_kilo": story[48],
-                    "total_price": story[49],
-                    "paid": story[50],
-                    "debt": story[51],
-                    "comments": story[52],
-                    "status": story[53]
-                },
-                "amount": story[54],
-                "weight": story[55],
-                "price_per_kilo": story[56],
-                "status": story[57]
-            },
-            "amount": story[58],
-            "weight": story[59],
-            "price_per_kilo": story[60],
-            "total_price": story[61]
-        } for story in cur}
+        if (client_id is not None) or (driver_id is not None) or (provider_id is not None):
+            filter_str = " where "
+        
+            if client_id is not None:
+                is_already_one_filter = True
+                parametrs_to_cur.append(client_id)
+                filter_str += f"cs.client = ${len(parametrs_to_cur)}"
+            
+            if driver_id is not None:
+                if is_already_one_filter:
+                    filter_str += " and "
+                
+                is_already_one_filter = True
+                parametrs_to_cur.append(driver_id)
+                filter_str += f"ds.driver_id = ${len(parametrs_to_cur)}"
+            
+            if provider_id is not None:
+                if is_already_one_filter:
+                    filter_str += " and "
+                
+                is_already_one_filter = True
+                parametrs_to_cur.append(provider_id)
+                filter_str += f"pp.provider = ${len(parametrs_to_cur)}"
+
+        is_paginated = (limit is not None) or (cursor is not None)
+
+        page_str = ""
+
+        if cursor is not None:
+            filter_str += page_filter(HISTORY_PAGE_KEY, cursor, parametrs_to_cur, is_already_one_filter)
+
+        if is_paginated:
+            page_str = page_order(HISTORY_PAGE_KEY, limit, parametrs_to_cur)
+
+        get_all_history_sql = HISTORY_SELECT_SQL + filter_str + page_str + ";"
+
+        if format == NORMALIZED_FORMAT:
+            # the sale, share and purchase joins are only there for the filters,
+            # the planner drops the ones no filter uses since they join on primary keys
+            get_all_history_sql = "select h.id, h.sale_id, h.share_id, h.amount, h.weight, h.price_per_kilo, h.total_price from history h\
+                                       left join clients_sales cs on h.sale_id = cs.id\
+                                       left join drivers_share ds on h.share_id = ds.id\
+                                       left join providers_purchases pp on ds.purchase_id = pp.id" + filter_str + page_str + ";"
+
+        if format is None and wants_ndjson(stream, accept):
+            return ndjson_response(get_all_history_sql, parametrs_to_cur, story_to_json, "HISTORY",
+                                   limit=limit, cursor_positions=(0,) if is_paginated else None)
+
+        conn = await get_async_connection(read_only=True)
+
+        if format == COLUMNS_FORMAT:
+            rows = [tuple(story) async for story in iterate_rows(conn, get_all_history_sql, *parametrs_to_cur)]
+
+            response = {
+                "columns": STORY_COLUMNS,
+                "rows": rows
+            }
+
+            if is_paginated:
+                response["next_cursor"] = next_page_cursor_from_rows(rows, limit, 0)
+        elif format == NORMALIZED_FORMAT:
+            history_json = {story[0]: normalized_story_to_json(story) async for story in iterate_rows(conn, get_all_history_sql, *parametrs_to_cur)}
+
+            response = {
+                "history": history_json,
+                "included": await load_included(conn,
+                                                sales=[story["sale_id"] for story in history_json.values()],
+                                                shares=[story["share_id"] for story in history_json.values()])
+            }
 
-        cur.close()
+            if is_paginated:
+                response["next_cursor"] = next_page_cursor(history_json, limit)
+        else:
+            history_json = {story[0]: story_to_json(story) async for story in iterate_rows(conn, get_all_history_sql, *parametrs_to_cur)}
 
-        conn.commit()
+            response = {
+                "history": history_json
+            }
+
+            if is_paginated:
+                response["next_cursor"] = next_page_cursor(history_json, limit)
 
         current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
         logging.info(f"{current_time}---GOT HISTORY successfully")
 
-        return {
-            "history": history_json
-        }
+        return FastJSONResponse(response)
 
-    except (Exception, psycopg2.DatabaseError) as error:
+    except (Exception, asyncpg.PostgresError) as error:
         logging.exception("Exception occurred")
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
+            await release_async_connection(conn)
 
 
 @app.get("/get_all_drivers_users/")
-def get_all_drivers_users():
+@cached("users", "users_roles")
+async def get_all_drivers_users():
     conn = None
     try:
-        params = config_database()
-        
-        conn = psycopg2.connect(**params)
-        cur = conn.cursor()
+        conn = await get_async_connection(read_only=True)
         
         get_all_drivers_sql = "select id,\
                                       name from users\
                                       left join users_roles on\
                                       users.id = users_roles.user_id where is_driver='t';"
 
-        cur.itersize = 200
-                                                
-        cur.execute(get_all_drivers_sql)
+        rows = await conn.fetch(get_all_drivers_sql)
 
-        drivers_json = {driver[0]: { "name": driver[1] } for driver in cur}
-        
-        cur.close()
-        
-        conn.commit()
+        drivers_json = {driver[0]: { "name": driver[1] } for driver in rows}
 
         current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
         logging.info(f"{current_time}---GOT ALL DRIVERS successfully")
         
-        return {
+        return FastJSONResponse({
             "drivers": drivers_json
-        }
+        })
 
-    except (Exception, psycopg2.DatabaseError) as error:
+    except (Exception, asyncpg.PostgresError) as error:
         logging.exception("Exception occurred")
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
+            await release_async_connection(conn)
 
 
 @app.get("/get_all_admin_users/")
-def get_all_admin_users():
+@cached("users", "users_roles")
+async def get_all_admin_users():
     conn = None
     try:
-        params = config_database()
-        
-        conn = psycopg2.connect(**params)
-        cur = conn.cursor()
+        conn = await get_async_connection(read_only=True)
         
         get_all_admins_sql = "select id,\
                                      name from users\
                                      left join users_roles on\
                                      users.id = users_roles.user_id where is_admin='t';"
 
-        cur.itersize = 200
-                                                
-        cur.execute(get_all_admins_sql)
+        rows = await conn.fetch(get_all_admins_sql)
 
-        admins_json = {admin[0]: { "name": admin[1] } for admin in cur}
-        
-        cur.close()
-        
-        conn.commit()
+        admins_json = {admin[0]: { "name": admin[1] } for admin in rows}
 
         current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
         logging.info(f"{current_time}---GOT ALL ADMINS successfully")
         
-        return {
+        return FastJSONResponse({
             "admins": admins_json
-        }
+        })
 
-    except (Exception, psycopg2.DatabaseError) as error:
+    except (Exception, asyncpg.PostgresError) as error:
         logging.exception("Exception occurred")
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
+            await release_async_connection(conn)
 
 
 @app.get("/get_all_operator_users/")
-def get_all_operator_users():
+@cached("users", "users_roles")
+async def get_all_operator_users():
     conn = None
     try:
-        params = config_database()
-        
-        conn = psycopg2.connect(**params)
-        cur = conn.cursor()
+        conn = await get_async_connection(read_only=True)
         
         get_all_operators_sql = "select id,\
                                         name from users\
                                         left join users_roles on\
                                         users.id = users_roles.user_id where is_operator='t';"
 
-        cur.itersize = 200
-                                                
-        cur.execute(get_all_operators_sql)
+        rows = await conn.fetch(get_all_operators_sql)
 
-        operators_json = {operator[0]: { "name": operator[1] } for operator in cur}
-        
-        cur.close()
-        
-        conn.commit()
+        operators_json = {operator[0]: { "name": operator[1] } for operator in rows}
 
         current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
         logging.info(f"{current_time}---GOT ALL OPERATORS successfully")
         
-        return {
+        return FastJSONResponse({
             "operators": operators_json
-        }
+        })
 
-    except (Exception, psycopg2.DatabaseError) as error:
+    except (Exception, asyncpg.PostgresError) as error:
         logging.exception("Exception occurred")
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
+            await release_async_connection(conn)
 
 
 @app.get("/get_all_super_users/")
-def get_all_super_users():
+@cached("users", "users_roles")
+async def get_all_super_users():
     conn = None
     try:
-        params = config_database()
-        
-        conn = psycopg2.connect(**params)
-        cur = conn.cursor()
+        conn = await get_async_connection(read_only=True)
         
         get_all_superusers_sql = "select id,\
                                          name from users\
                                          left join users_roles on\
                                          users.id = users_roles.user_id where is_operator='t';"
 
-        cur.itersize = 200
-                                                
-        cur.execute(get_all_superusers_sql)
+        rows = await conn.fetch(get_all_superusers_sql)
 
-        superusers_json = {superuser[0]: { "name": superuser[1] } for superuser in cur}
-        
-        cur.close()
-        
-        conn.commit()
+        superusers_json = {superuser[0]: { "name": superuser[1] } for superuser in rows}
 
         current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
         logging.info(f"{current_time}---GOT ALL SUPERUSERS successfully")
         
-        return {
+        return FastJSONResponse({
             "superusers": superusers_json
-        }
+        })
 
-    except (Exception, psycopg2.DatabaseError) as error:
+    except (Exception, asyncpg.PostgresError) as error:
         logging.exception("Exception occurred")
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
+            await release_async_connection(conn)
 
 
 @app.get("/get_all_clients_names/")
-def get_all_clients_names():
+@cached("clients")
+async def get_all_clients_names():
     conn = None
     try:
-        params = config_database()
-        
-        conn = psycopg2.connect(**params)
-        cur = conn.cursor()
+        conn = await get_async_connection(read_only=True)
         
         get_all_clients_names_sql = "select id,\
                                             name from clients;"
 
-        cur.itersize = 200
-                                                
-        cur.execute(get_all_clients_names_sql)
+        rows = await conn.fetch(get_all_clients_names_sql)
 
-        clients_json = {client[0]: { "name": client[1] } for client in cur}
-        
-        cur.close()
-        
-        conn.commit()
+        clients_json = {client[0]: { "name": client[1] } for client in rows}
 
         current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
         logging.info(f"{current_time}---GOT ALL CLIENTS NAMES successfully")
         
-        return {
+        return FastJSONResponse({
             "clients": clients_json
-        }
+        })
 
-    except (Exception, psycopg2.DatabaseError) as error:
+    except (Exception, asyncpg.PostgresError) as error:
         logging.exception("Exception occurred")
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
+            await release_async_connection(conn)
 
 
 @app.get("/get_all_providers_names/")
-def get_all_providers_names():
+@cached("providers")
+async def get_all_providers_names():
     conn = None
     try:
-        params = config_database()
-        
-        conn = psycopg2.connect(**params)
-        cur = conn.cursor()
+        conn = await get_async_connection(read_only=True)
         
         get_all_providers_names_sql = "select id,\
                                               name from providers;"
 
-        cur.itersize = 200
-                                                
-        cur.execute(get_all_providers_names_sql)
+        rows = await conn.fetch(get_all_providers_names_sql)
 
-        providers_json = {provider[0]: { "name": provider[1] } for provider in cur}
-        
-        cur.close()
-        
-        conn.commit()
+        providers_json = {provider[0]: { "name": provider[1] } for provider in rows}
 
         current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
         logging.info(f"{current_time}---GOT ALL PROVIDERS NAMES successfully")
         
-        return {
+        return FastJSONResponse({
             "providers": providers_json
-        }
+        })
 
-    except (Exception, psycopg2.DatabaseError) as error:
+    except (Exception, asyncpg.PostgresError) as error:
         logging.exception("Exception occurred")
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
-
-
-@app.get("/get_all_future_sales/")
-def get_all_future_sales(client_id: Optional[int] = None, status: Optional[str] = None):
-    conn = None
-    try:
-        params = config_database()
-        
-        conn = psycopg2.connect(**params)
-        cur = conn.cursor()
-
-        filter_str = ""
-
-        is_already_one_filter = False
-
-        if (client_id is not None) or (status is not None):
-            filter_str = " where "
-            
-            if client_id is not None:
-                is_already_one_filter = True
-                filter_str += r"c.id = %s"
-            
-            if status is not None:
-                if is_already_one_filter:
-                    filter_str += " and "
-                
-                is_already_one_filter = True
-                filter_str += r"cfs.status = %s"
-        
-        get_all_cfuture_sales_sql = "select cfs.id,\
+            await release_async_connection(conn)
+
+
+def future_sale_to_json(sale):
+    return {
+        "client": {
+            "id": sale[1],
+            "name": sale[2],
+            "entity": sale[3],
+            "address": sale[4],
+            "address_comments": sale[5],
+            "network": sale[6],
+            "payment": sale[7],
+            "default_provider": {
+                "id": sale[8],
+                "name": sale[9],
+                "contacts": sale[10],
+                "comments": sale[11]
+            },
+            "recoil": sale[12],
+            "comments": sale[13],
+            "work_hours": {
+                "monday": sale[14],
+                "tuesday": sale[15],
+                "wednesday": sale[16],
+                "thursday": sale[17],
+                "friday": sale[18],
+                "saturday": sale[19],
+                "sunday": sale[20]
+            }
+        },
+        "product": sale[21],
+        "amount": sale[22],
+        "order_time": sale[23],
+        "delivery_time": sale[24],
+        "status": sale[25],
+        "comments": sale[26]
+    }
+
+
+# the rows future_sale_to_json reads, the list endpoint adds its filters and pages, PATCH the updated id
+FUTURE_SALES_SELECT_SQL = "select cfs.id,\
                                             c.id,\
                                             c.name,\
                                             c.entity,\
@@ -1686,136 +2329,141 @@ def get_all_future_sales(client_id: Optional[int] = None, status: Optional[str]
                                             cfs.comments from clients_future_sales cfs\
                                             left join clients c on cfs.client = c.id\
                                             left join clients_work_hours cwh on cfs.client = cwh.client_id\
-                                            left join providers def_prov on c.default_provider = def_prov.id" + filter_str + ";"
+                                            left join providers def_prov on c.default_provider = def_prov.id"
+
+
+@app.get("/get_all_future_sales/")
+async def get_all_future_sales(client_id: Optional[int] = None, status: Optional[str] = None,
+                               limit: Optional[int] = None, cursor: Optional[str] = None,
+                               stream: Optional[str] = None, accept: Optional[str] = Header(None),
+                               if_none_match: Optional[str] = Header(None)):
+    conn = None
+    try:
+        filter_str = ""
+
+        is_already_one_filter = False
 
-        cur.itersize = 200
-                                                
         parametrs_to_cur = []
-    
-        if client_id is not None:
-            parametrs_to_cur.append(client_id)
-        
-        if status is not None:
-            parametrs_to_cur.append(status)
 
-        cur.execute(get_all_cfuture_sales_sql, tuple(parametrs_to_cur))
+        if (client_id is not None) or (status is not None):
+            filter_str = " where "
+            
+            if client_id is not None:
+                is_already_one_filter = True
+                parametrs_to_cur.append(client_id)
+                filter_str += f"c.id = ${len(parametrs_to_cur)}"
+            
+            if status is not None:
+                if is_already_one_filter:
+                    filter_str += " and "
+                
+                is_already_one_filter = True
+                parametrs_to_cur.append(status)
+                filter_str += f"cfs.status = ${len(parametrs_to_cur)}"
+
+        is_paginated = (limit is not None) or (cursor is not None)
 
-        sales_json = {sale[0]: { 
-            "client": {
-                "id": sale[1],
-                "name": sale[2],
-                "entity": sale[3],
-                "address": sale[4],
-                "address_comments": sale[5],
-                "network": sale[6],
-                "payment": sale[7],
-                "default_provider": {
-                    "id": sale[8],
-                    "name": sale[9],
-                    "contacts": sale[10],
-                    "comments": sale[11]
-                },
-                "recoil": sale[12],
-                "comments": sale[13],
-                "work_hours": {
-                    "monday": sale[14],
-                    "tuesday": sale[15],
-                    "wednesday": sale[16],
-                    "thursday": sale[17],
-                    "friday": sale[18],
-                    "saturday": sale[19],
-                    "sunday": sale[20]
-                }
-            },
-            "product": sale[21],
-            "amount": sale[22],
-            "order_time": sale[23],
-            "delivery_time": sale[24],
-            "status": sale[25],
-            "comments": sale[26]
-        } for sale in cur}
-        
-        cur.close()
-        
-        conn.commit()
+        page_str = ""
+
+        if cursor is not None:
+            filter_str += page_filter(FUTURE_SALES_PAGE_KEY, cursor, parametrs_to_cur, is_already_one_filter)
+
+        if is_paginated:
+            page_str = page_order(FUTURE_SALES_PAGE_KEY, limit, parametrs_to_cur)
+
+        get_all_cfuture_sales_sql = FUTURE_SALES_SELECT_SQL + filter_str + page_str + ";"
+
+        if wants_ndjson(stream, accept):
+            return ndjson_response(get_all_cfuture_sales_sql, parametrs_to_cur, future_sale_to_json, "FUTURE SALES",
+                                   limit=limit, cursor_positions=(24, 0) if is_paginated else None)
+
+        conn = await get_async_connection(read_only=True)
+
+        etag = await table_etag(conn, FUTURE_SALES_TABLES, get_all_cfuture_sales_sql, parametrs_to_cur)
+        if etag_matches(if_none_match, etag):
+            current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
+            logging.info(f"{current_time}---FUTURE SALES NOT MODIFIED")
+            return Response(status_code=304, headers={"ETag": etag})
+
+        rows = await conn.fetch(get_all_cfuture_sales_sql, *parametrs_to_cur)
+
+        sales_json = {sale[0]: future_sale_to_json(sale) for sale in rows}
 
         current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
         logging.info(f"{current_time}---GOT FUTURE SALES successfully")
         
-        return {
+        response = {
             "future_sales": sales_json
         }
 
-    except (Exception, psycopg2.DatabaseError) as error:
+        if is_paginated:
+            response["next_cursor"] = next_page_cursor(sales_json, limit, "delivery_time")
+
+        return FastJSONResponse(response, headers={"ETag": etag})
+
+    except (Exception, asyncpg.PostgresError) as error:
         logging.exception("Exception occurred")
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
+            await release_async_connection(conn)
 
 
 @app.get("/get_all_products/")
-def get_all_products():
+@cached("products")
+async def get_all_products():
     conn = None
     try:
-        params = config_database()
-        
-        conn = psycopg2.connect(**params)
-        cur = conn.cursor()
+        conn = await get_async_connection(read_only=True)
         
         get_all_products_sql = "select id, product_name from products;"
 
-        cur.itersize = 200
-                                                
-        cur.execute(get_all_products_sql)
+        rows = await conn.fetch(get_all_products_sql)
 
-        products_json = {product[0]: { "product_name": product[1] } for product in cur}
-        
-        cur.close()
-        
-        conn.commit()
+        products_json = {product[0]: { "product_name": product[1] } for product in rows}
 
         current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
         logging.info(f"{current_time}---GOT ALL PRODUCTS successfully")
         
-        return {
+        return FastJSONResponse({
             "products": products_json
-        }
+        })
 
-    except (Exception, psycopg2.DatabaseError) as error:
+    except (Exception, asyncpg.PostgresError) as error:
         logging.exception("Exception occurred")
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
+            await release_async_connection(conn)
 
 
 @app.get("/get_all_clients_prices/")
-def get_all_clients_prices(client_id: Optional[int] = None, product_name: Optional[str] = None):
+async def get_all_clients_prices(client_id: Optional[int] = None, product_name: Optional[str] = None):
     conn = None
     try:
-        params = config_database()
-        
-        conn = psycopg2.connect(**params)
-        cur = conn.cursor()
+        conn = await get_async_connection(read_only=True)
 
         filter_str = ""
 
         is_already_one_filter = False
 
+        parametrs_to_cur = []
+
         if (client_id is not None) or (product_name is not None):
             filter_str = " where "
             
             if client_id is not None:
                 is_already_one_filter = True
-                filter_str += r"s_client.id = %s"
+                parametrs_to_cur.append(client_id)
+                filter_str += f"s_client.id = ${len(parametrs_to_cur)}"
             
             if product_name is not None:
                 if is_already_one_filter:
                     filter_str += " and "
                 
                 is_already_one_filter = True
-                filter_str += r"cp.product_name = %s"
+                parametrs_to_cur.append(product_name)
+                filter_str += f"cp.product_name = ${len(parametrs_to_cur)}"
         
         get_all_clients_prices_sql = "select cp.id, \
                                              cp.product_name,\
@@ -1845,17 +2493,7 @@ def get_all_clients_prices(client_id: Optional[int] = None, product_name: Option
                                              left join clients_work_hours cwh on cp.client_id = cwh.client_id\
                                              left join providers def_prov on s_client.default_provider = def_prov.id" + filter_str + ";"
 
-        cur.itersize = 200
-
-        parametrs_to_cur = []
-    
-        if client_id is not None:
-            parametrs_to_cur.append(client_id)
-        
-        if product_name is not None:
-            parametrs_to_cur.append(product_name)
-
-        cur.execute(get_all_clients_prices_sql, tuple(parametrs_to_cur))
+        rows = await conn.fetch(get_all_clients_prices_sql, *parametrs_to_cur)
 
         clients_prices_json = {client_price[0]: { "product_name": client_price[1],
                                                   "client": {
@@ -1885,25 +2523,21 @@ def get_all_clients_prices(client_id: Optional[int] = None, product_name: Option
                                                             "sunday": client_price[22]
                                                         }
                                                   },
-                                                  "price": client_price[23] } for client_price in cur}
-        
-        cur.close()
-        
-        conn.commit()
+                                                  "price": client_price[23] } for client_price in rows}
 
         current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
         logging.info(f"{current_time}---GOT CLIENTS PRICES successfully")
         
-        return {
+        return FastJSONResponse({
             "clients_prices": clients_prices_json
-        }
+        })
 
-    except (Exception, psycopg2.DatabaseError) as error:
+    except (Exception, asyncpg.PostgresError) as error:
         logging.exception("Exception occurred")
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
+            await release_async_connection(conn)
 
 
 # ========================================================================== UPDATE
@@ -1918,9 +2552,7 @@ def update_users_cell(user_id: int,
                 "error": "You cannot modify 'id' column"
             }
         
-        params = config_database()
-        
-        conn = psycopg2.connect(**params)
+        conn = get_connection()
         cur = conn.cursor()
         
         update_user_cell_sql = \
@@ -1933,6 +2565,7 @@ def update_users_cell(user_id: int,
         cur.close()
         
         conn.commit()
+        reference_cache.invalidate("users")
 
         current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
         logging.info(f"{current_time}---UPDATED USER {user_id} | column {column} | new value {new_value}")
@@ -1953,7 +2586,7 @@ def update_users_cell(user_id: int,
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
+            release_connection(conn)
 
 
 @app.put("/update_users_roles_cell/")
@@ -1967,9 +2600,7 @@ def update_users_roles_cell(user_id: int,
                 "error": "You cannot modify 'user_id' column"
             }
 
-        params = config_database()
-        
-        conn = psycopg2.connect(**params)
+        conn = get_connection()
         cur = conn.cursor()
         
         update_user_role_cell_sql = \
@@ -1982,6 +2613,7 @@ def update_users_roles_cell(user_id: int,
         cur.close()
         
         conn.commit()
+        reference_cache.invalidate("users_roles")
 
         current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
         logging.info(f"{current_time}---UPDATED USER ROLES {user_id} | column {role} | new value {new_value}")
@@ -2002,7 +2634,7 @@ def update_users_roles_cell(user_id: int,
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
+            release_connection(conn)
 
 
 @app.put("/update_providers_cell/")
@@ -2016,9 +2648,7 @@ def update_providers_cell(provider_id: int,
                 "error": "You cannot modify 'id' column"
             }
 
-        params = config_database()
-        
-        conn = psycopg2.connect(**params)
+        conn = get_connection()
         cur = conn.cursor()
         
         update_provider_cell_sql = \
@@ -2031,6 +2661,7 @@ def update_providers_cell(provider_id: int,
         cur.close()
         
         conn.commit()
+        reference_cache.invalidate("providers")
 
         current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
         logging.info(f"{current_time}---UPDATED PROVIDER {provider_id} | column {column} | new value {new_value}")
@@ -2050,7 +2681,7 @@ def update_providers_cell(provider_id: int,
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
+            release_connection(conn)
 
 
 @app.put("/update_clients_cell/")
@@ -2064,9 +2695,7 @@ def update_clients_cell(client_id: int,
                 "error": "You cannot modify 'id' column"
             }
 
-        params = config_database()
-        
-        conn = psycopg2.connect(**params)
+        conn = get_connection()
         cur = conn.cursor()
         
         update_client_cell_sql = \
@@ -2079,6 +2708,7 @@ def update_clients_cell(client_id: int,
         cur.close()
         
         conn.commit()
+        reference_cache.invalidate("clients")
 
         current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
         logging.info(f"{current_time}---UPDATED CLIENT {client_id} | column {column} | new value {new_value}")
@@ -2104,7 +2734,7 @@ def update_clients_cell(client_id: int,
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
+            release_connection(conn)
 
 
 @app.put("/update_clients_work_hours_cell/")
@@ -2118,9 +2748,7 @@ def update_clients_work_hours_cell(client_id: int,
                 "error": "You cannot modify 'id' or 'client_id' column"
             }
 
-        params = config_database()
-        
-        conn = psycopg2.connect(**params)
+        conn = get_connection()
         cur = conn.cursor()
         
         update_client_wh_cell_sql = \
@@ -2156,7 +2784,7 @@ def update_clients_work_hours_cell(client_id: int,
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
+            release_connection(conn)
     
 
 @app.put("/update_providers_purchases_cell/")
@@ -2170,9 +2798,7 @@ def update_providers_purchases_cell(purchase_id: int,
                 "error": "You cannot modify 'id' column"
             }
 
-        params = config_database()
-        
-        conn = psycopg2.connect(**params)
+        conn = get_connection()
         cur = conn.cursor()
         
         update_pp_cell_sql = \
@@ -2212,7 +2838,7 @@ def update_providers_purchases_cell(purchase_id: int,
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
+            release_connection(conn)
 
 
 @app.put("/update_clients_sales_cell/")
@@ -2226,9 +2852,7 @@ def update_clients_sales_cell(sale_id: int,
                 "error": "You cannot modify 'id' column"
             }
 
-        params = config_database()
-        
-        conn = psycopg2.connect(**params)
+        conn = get_connection()
         cur = conn.cursor()
         
         update_sale_cell_sql = \
@@ -2265,7 +2889,7 @@ def update_clients_sales_cell(sale_id: int,
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
+            release_connection(conn)
 
 
 @app.put("/update_drivers_share_cell/")
@@ -2279,9 +2903,7 @@ def update_drivers_share_cell(share_id: int,
                 "error": "You cannot modify 'id' column"
             }
 
-        params = config_database()
-        
-        conn = psycopg2.connect(**params)
+        conn = get_connection()
         cur = conn.cursor()
         
         update_share_cell_sql = \
@@ -2316,7 +2938,7 @@ def update_drivers_share_cell(share_id: int,
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
+            release_connection(conn)
 
 
 @app.put("/update_history_cell/")
@@ -2330,9 +2952,7 @@ def update_history_cell(story_id: int,
                 "error": "You cannot modify 'id' column"
             }
 
-        params = config_database()
-        
-        conn = psycopg2.connect(**params)
+        conn = get_connection()
         cur = conn.cursor()
         
         update_story_cell_sql = \
@@ -2367,7 +2987,7 @@ def update_history_cell(story_id: int,
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
+            release_connection(conn)
 
 
 @app.put("/update_clients_future_sales_cell/")
@@ -2381,9 +3001,7 @@ def update_clients_future_sales_cell(sale_id: int,
                 "error": "You cannot modify 'id' column"
             }
 
-        params = config_database()
-        
-        conn = psycopg2.connect(**params)
+        conn = get_connection()
         cur = conn.cursor()
         
         update_clients_future_sales_cell_sql = \
@@ -2419,7 +3037,7 @@ def update_clients_future_sales_cell(sale_id: int,
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
+            release_connection(conn)
 
 
 @app.put("/update_products_cell/")
@@ -2433,9 +3051,7 @@ def update_products_cell( product_id: int,
                 "error": "You cannot modify 'id' column"
             }
 
-        params = config_database()
-        
-        conn = psycopg2.connect(**params)
+        conn = get_connection()
         cur = conn.cursor()
         
         update_product_cell_sql = \
@@ -2448,6 +3064,7 @@ def update_products_cell( product_id: int,
         cur.close()
         
         conn.commit()
+        reference_cache.invalidate("products")
 
         current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
         logging.info(f"{current_time}---UPDATED PRODUCT {product_id} | column {column} | new value {new_value}")
@@ -2465,7 +3082,7 @@ def update_products_cell( product_id: int,
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
+            release_connection(conn)
 
 
 @app.put("/update_clients_prices_cell/")
@@ -2479,9 +3096,7 @@ def update_clients_prices_cell( client_price_id: int,
                 "error": "You cannot modify 'id' column"
             }
 
-        params = config_database()
-        
-        conn = psycopg2.connect(**params)
+        conn = get_connection()
         cur = conn.cursor()
         
         update_client_price_cell_sql = \
@@ -2513,7 +3128,7 @@ def update_clients_prices_cell( client_price_id: int,
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
+            release_connection(conn)
 
 
 # ========================================================================== UPDATE CELL USERS
@@ -2803,15 +3418,224 @@ def update_clients_prices_price(client_price_id: int, price: float):
     return update_clients_prices_cell(client_price_id, 'price', price)
 
 
+# ========================================================================== PATCH
+# columns that can be changed, the same ones the UPDATE CELL endpoints above write
+# (table, key column, editable columns, response key of the matching *_cell function[, (select, its id column, row mapper)]),
+# with a select the updated row is read back in the shape its get_all_* endpoint returns
+USER_PATCH = [("users", "id", ("name", "contacts", "login", "password"), "updated_user"),
+              ("users_roles", "user_id", ("is_admin", "is_driver", "is_operator", "is_superuser"), "updated_user_roles")]
+PROVIDER_PATCH = [("providers", "id", ("name", "contacts", "comments"), "updated_provider")]
+CLIENT_PATCH = [("clients", "id", ("name", "entity", "address", "address_comments", "network", "payment",
+                                   "default_provider", "recoil", "comments"), "updated_client"),
+                ("clients_work_hours", "client_id", ("monday", "tuesday", "wednesday", "thursday", "friday",
+                                                     "saturday", "sunday"), "updated_client_work_hours")]
+PURCHASE_PATCH = [("providers_purchases", "id", ("delivery_time", "provider", "product", "amount", "weight",
+                                                 "price_per_kilo", "total_price", "paid", "debt", "comments",
+                                                 "status"), "updated_provider_purchase",
+                   (PURCHASES_SELECT_SQL, "providers_purchases.id", purchase_to_json))]
+SALE_PATCH = [("clients_sales", "id", ("delivery_time", "client", "provider", "driver", "paid", "debt", "comments",
+                                       "status"), "updated_client_sale",
+               (SALES_SELECT_SQL, "cs.id", sale_to_json))]
+SHARE_PATCH = [("drivers_share", "id", ("driver_id", "purchase_id", "amount", "weight", "price_per_kilo", "status"),
+                "updated_driver_share", (SHARES_SELECT_SQL, "ds.id", share_to_json))]
+STORY_PATCH = [("history", "id", ("sale_id", "share_id", "amount", "weight", "price_per_kilo", "total_price"),
+                "updated_story", (HISTORY_SELECT_SQL, "h.id", story_to_json))]
+FUTURE_SALE_PATCH = [("clients_future_sales", "id", ("client", "product", "amount", "order_time", "delivery_time",
+                                                     "status", "comments"), "updated_future_client_sale",
+                      (FUTURE_SALES_SELECT_SQL, "cfs.id", future_sale_to_json))]
+PRODUCT_PATCH = [("products", "id", ("product_name",), "updated_product")]
+CLIENT_PRICE_PATCH = [("clients_prices", "id", ("product_name", "client_id", "price"), "updated_client_price")]
+
+
+def update_row(cur, table, key_column, key, columns, changes, reread=None):
+    # all changed columns of one row in a single "update ... set a = %s, b = %s",
+    # answered like the *_cell function does, or read back through reread
+    changed_columns = [column for column in columns if column in changes]
+
+    update_row_sql = SQL("update {} set {} where {} = %s returning {}, {};").format(
+        Identifier(table),
+        SQL(", ").join(SQL("{} = %s").format(Identifier(column)) for column in changed_columns),
+        Identifier(key_column),
+        Identifier(key_column),
+        SQL(", ").join(Identifier(column) for column in columns))
+
+    cur.execute(update_row_sql, [changes[column] for column in changed_columns] + [key])
+
+    updated_tuple = cur.fetchone()
+    if updated_tuple is None:
+        raise Exception(f"There is no {table} row with {key_column} {key}")
+
+    if reread is None:
+        return {updated_tuple[0]: dict(zip(columns, updated_tuple[1:]))}
+
+    select_sql, id_column, row_to_json = reread
+    cur.execute(f"{select_sql} where {id_column} = %s;", (updated_tuple[0],))
+    row = cur.fetchone()
+
+    return {row[0]: row_to_json(row)}
+
+
+def patch_rows(key, changes, tables, log_name):
+    conn = None
+    try:
+        allowed_columns = [column for _, _, columns, *_ in tables for column in columns]
+        unknown_columns = [column for column in changes if column not in allowed_columns]
+
+        if not changes:
+            return {
+                "error": "Nothing to update"
+            }
+        if unknown_columns:
+            return {
+                "error": f"You cannot modify {', '.join(unknown_columns)}, allowed columns are {', '.join(allowed_columns)}"
+            }
+
+        conn = get_connection()
+        cur = conn.cursor()
+
+        response = {}
+        for table, key_column, columns, response_key, *reread in tables:
+            if set(columns) & set(changes):
+                response[response_key] = update_row(cur, table, key_column, key, columns, changes, *reread)
+
+        cur.close()
+
+        conn.commit()
+        reference_cache.invalidate(*[table for table, _, columns, *_ in tables if set(columns) & set(changes)])
+
+        current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
+        logging.info(f"{current_time}---UPDATED {log_name} {key} | columns {', '.join(changes)}")
+
+        return response
+
+    except (Exception, psycopg2.DatabaseError) as error:
+        logging.exception("Exception occurred")
+        return {"error": str(error)}
+    finally:
+        if conn is not None:
+            release_connection(conn)
+
+
+# curl -X PATCH "http://127.0.0.1:8000/update_client/?client_id=1" -H "Content-Type: application/json" -d '{"name": "Shop", "monday": "9-18"}'
+@app.patch("/update_user/")
+def update_user(user_id: int, changes: Dict[str, Any] = Body(...)):
+    return patch_rows(user_id, changes, USER_PATCH, "USER")
+
+@app.patch("/update_provider/")
+def update_provider(provider_id: int, changes: Dict[str, Any] = Body(...)):
+    return patch_rows(provider_id, changes, PROVIDER_PATCH, "PROVIDER")
+
+@app.patch("/update_client/")
+def update_client(client_id: int, changes: Dict[str, Any] = Body(...)):
+    return patch_rows(client_id, changes, CLIENT_PATCH, "CLIENT")
+
+@app.patch("/update_purchase/")
+def update_purchase(purchase_id: int, changes: Dict[str, Any] = Body(...)):
+    return patch_rows(purchase_id, changes, PURCHASE_PATCH, "PROVIDER PURCHASE")
+
+@app.patch("/update_sale/")
+def update_sale(sale_id: int, changes: Dict[str, Any] = Body(...)):
+    return patch_rows(sale_id, changes, SALE_PATCH, "CLIENT SALE")
+
+@app.patch("/update_share/")
+def update_share(share_id: int, changes: Dict[str, Any] = Body(...)):
+    return patch_rows(share_id, changes, SHARE_PATCH, "DRIVER SHARE")
+
+@app.patch("/update_story/")
+def update_story(story_id: int, changes: Dict[str, Any] = Body(...)):
+    return patch_rows(story_id, changes, STORY_PATCH, "STORY")
+
+@app.patch("/update_future_sale/")
+def update_future_sale(f_sale_id: int, changes: Dict[str, Any] = Body(...)):
+    return patch_rows(f_sale_id, changes, FUTURE_SALE_PATCH, "FUTURE CLIENT SALE")
+
+@app.patch("/update_product/")
+def update_product(product_id: int, changes: Dict[str, Any] = Body(...)):
+    return patch_rows(product_id, changes, PRODUCT_PATCH, "PRODUCT")
+
+@app.patch("/update_client_price/")
+def update_client_price(client_price_id: int, changes: Dict[str, Any] = Body(...)):
+    return patch_rows(client_price_id, changes, CLIENT_PRICE_PATCH, "CLIENT PRICE")
+
+
+# ========================================================================== SYNC
+# curl "http://127.0.0.1:8000/sync/?since=0&tables=sales,history", then again with since=<token of the answer>
+@app.get("/sync/")
+async def sync(since: Optional[int] = 0, tables: Optional[str] = None):
+    conn = None
+    try:
+        kinds = list(SYNC_TABLES) if tables is None else [kind.strip() for kind in tables.split(",")]
+        unknown_kinds = [kind for kind in kinds if kind not in SYNC_TABLES]
+        if unknown_kinds:
+            return {
+                "error": f"Unknown tables {', '.join(unknown_kinds)}, expected {', '.join(SYNC_TABLES)}"
+            }
+
+        # the token is a transaction id of the primary, so are the row versions it is compared with
+        conn = await get_async_connection()
+
+        async with conn.transaction(isolation="repeatable_read", readonly=True):
+            # every transaction older than the snapshot's xmin is finished and visible in it, the ones after
+            # may still commit, so the next sync starts from there (rows can come twice, none are missed)
+            token = await conn.fetchval("select txid_snapshot_xmin(txid_current_snapshot());")
+
+            changes_json = {}
+            for kind in kinds:
+                rows = await conn.fetch(f"select * from {SYNC_TABLES[kind]} where row_version >= $1 order by id;", since)
+                changes_json[kind] = {row["id"]: {column: value for column, value in row.items()
+                                                  if column not in ("id", "row_version")} for row in rows}
+
+            tombstones = await conn.fetch("select table_name,\
+                                                  row_id from sync_tombstones\
+                                                  where row_version >= $1 and table_name = any($2::text[])\
+                                                  order by row_id;", since, [SYNC_TABLES[kind] for kind in kinds])
+
+        deleted_json = {kind: [] for kind in kinds}
+        kind_of_table = {table: kind for kind, table in SYNC_TABLES.items()}
+        for tombstone in tombstones:
+            deleted_json[kind_of_table[tombstone[0]]].append(tombstone[1])
+
+        current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
+        logging.info(f"{current_time}---SYNCED {', '.join(kinds)} since {since} | token {token}")
+
+        return FastJSONResponse({
+            "token": token,
+            "changes": changes_json,
+            "deleted": deleted_json
+        })
+
+    except (Exception, asyncpg.PostgresError) as error:
+        logging.exception("Exception occurred")
+        return {"error": str(error)}
+    finally:
+        if conn is not None:
+            await release_async_connection(conn)
+
+
+# ========================================================================== EVENTS
+# curl -N "http://127.0.0.1:8000/get_sales_events/?driver_id=3"
+@app.get("/get_sales_events/")
+async def get_sales_events(kind: Optional[str] = None, driver_id: Optional[int] = None,
+                           client_id: Optional[int] = None, status: Optional[str] = None):
+    # sale and future sale changes as they commit, from any worker, an event passes when every given filter matches,
+    # status by the new or the old one
+    filters = {field: value for field, value in (("kind", kind),
+                                                 ("driver_id", driver_id),
+                                                 ("client_id", client_id),
+                                                 ("status", status)) if value is not None}
+
+    current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
+    logging.info(f"{current_time}---SALES EVENTS subscribed | {filters}")
+
+    return event_stream_response(sale_events, filters)
+
+
 # ========================================================================== CHECK USER PW AND ROLE
 @app.get("/check_users_pw_and_role/")
-def check_users_pw_and_role(login: str, password: str, role: str):
+async def check_users_pw_and_role(login: str, password: str, role: str):
     conn = None
     try:
-        params = config_database()
-        
-        conn = psycopg2.connect(**params)
-        cur = conn.cursor()
+        conn = await get_async_connection()
         
         get_users_info_by_login_sql = "select users.id,\
                                               users.name,\
@@ -2823,13 +3647,9 @@ def check_users_pw_and_role(login: str, password: str, role: str):
                                               users_roles.is_operator,\
                                               users_roles.is_superuser from users\
                                               left join users_roles on\
-                                              users.id = users_roles.user_id where users.login=%s limit 1;"
-
-        cur.itersize = 200
-                                                
-        cur.execute(get_users_info_by_login_sql, (login,))
+                                              users.id = users_roles.user_id where users.login=$1 limit 1;"
 
-        is_exist = cur.fetchone()
+        is_exist = await conn.fetchrow(get_users_info_by_login_sql, login)
 
         if not is_exist:
             return {
@@ -2866,10 +3686,6 @@ def check_users_pw_and_role(login: str, password: str, role: str):
                        },
                        "is_correct_user": is_correct_user }
 
-        cur.close()
-        
-        conn.commit()
-
         current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
         logging.info(f"{current_time}---GOT USER BY LOGIN successfully")
         
@@ -2877,41 +3693,40 @@ def check_users_pw_and_role(login: str, password: str, role: str):
             "user": users_json
         }
 
-    except (Exception, psycopg2.DatabaseError) as error:
+    except (Exception, asyncpg.PostgresError) as error:
         logging.exception("Exception occurred")
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
+            await release_async_connection(conn)
 
 
 @app.get("/get_warehouse/")
-def get_warehouse():
+async def get_warehouse(if_none_match: Optional[str] = Header(None)):
     conn = None
     try:
-        params = config_database()
-
-        conn = psycopg2.connect(**params)
-        cur = conn.cursor()
+        conn = await get_async_connection(read_only=True)
 
+        # purchases_stock is kept by triggers on drivers_share and providers_purchases (migrations/0003)
         get_warehouse_sql_2 = "select pp.id,\
                                       p.id,\
                                       p.name,\
                                       p.contacts,\
                                       p.comments,\
                                       pp.product,\
-                                      coalesce((pp.amount - coalesce(share.amount, 0)), 0) as remainder_amount,\
-                                      coalesce((pp.weight - coalesce(share.weight, 0)), 0) as remainder_weight,\
+                                      ps.remaining_amount,\
+                                      ps.remaining_weight,\
                                       pp.price_per_kilo,\
-                                      pp.delivery_time from providers_purchases pp\
+                                      pp.delivery_time from purchases_stock ps\
+                                        join providers_purchases pp on pp.id = ps.purchase_id\
                                         left join providers p on pp.provider = p.id\
-                                        left join (select ds.purchase_id, coalesce(sum(ds.amount), 0) as amount,\
-                                                   coalesce(sum(ds.weight), 0) as weight from drivers_share ds group by purchase_id)\
-                                        share on pp.id = share.purchase_id where (pp.amount - coalesce(share.amount, 0)) > 0;"
+                                      where ps.remaining_amount > 0;"
 
-        cur.itersize = 200
-                                                
-        cur.execute(get_warehouse_sql_2)
+        etag = await table_etag(conn, WAREHOUSE_TABLES, get_warehouse_sql_2, ())
+        if etag_matches(if_none_match, etag):
+            current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
+            logging.info(f"{current_time}---WAREHOUSE NOT MODIFIED")
+            return Response(status_code=304, headers={"ETag": etag})
 
         warehouse_json = {product[0]: { "provider": {
                                             "id": product[1],
@@ -2923,22 +3738,18 @@ def get_warehouse():
                                         "amount": product[6],
                                         "weight": product[7],
                                         "price_per_kilo": product[8],
-                                        "delivery_time": product[9] } for product in cur}
-
-        cur.close()
-
-        conn.commit()
+                                        "delivery_time": product[9] } async for product in iterate_rows(conn, get_warehouse_sql_2)}
 
         current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
         logging.info(f"{current_time}---GOT WAREHOUSE successfully")
 
-        return {
+        return FastJSONResponse({
             "warehouse": warehouse_json
-        }
+        }, headers={"ETag": etag})
 
-    except (Exception, psycopg2.DatabaseError) as error:
+    except (Exception, asyncpg.PostgresError) as error:
         logging.exception("Exception occurred")
         return {"error": str(error)}
     finally:
         if conn is not None:
-            conn.close()
\ No newline at end of file
+            await release_async_connection(conn)
\ No newline at end of file
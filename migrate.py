@@ -0,0 +1,173 @@
+import argparse
+import logging
+import os
+import re
+import sys
+from time import localtime, strftime
+
+import psycopg2
+
+from config_db import settings
+
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+# first line of scripts that can't run inside a transaction, e.g. CREATE INDEX CONCURRENTLY
+NO_TRANSACTION_HEADER = "-- migrate: no-transaction"
+
+INDEX_NAME_RE = re.compile(r'create\s+(?:unique\s+)?index\s+(?:concurrently\s+)?(?:if\s+not\s+exists\s+)?"?(\w+)"?',
+                           re.IGNORECASE)
+
+CREATE_SCHEMA_MIGRATIONS_SQL = "create table if not exists schema_migrations ( version varchar(255) primary key,\
+                                                                               applied_at timestamp not null default now() );"
+
+
+def migrations():
+    # [(version, path)] in order, version is the file name without .sql, e.g. "0002_foreign_key_indexes"
+    return [(filename[:-len(".sql")], os.path.join(MIGRATIONS_DIR, filename))
+            for filename in sorted(os.listdir(MIGRATIONS_DIR)) if filename.endswith(".sql")]
+
+
+def read_migration(path):
+    with open(path, encoding="utf-8") as file:
+        return file.read()
+
+
+def split_statements(script):
+    # the scripts are plain DDL, every statement ends with ";" at the end of a line
+    statements = []
+    for statement in re.split(r";\s*$", script, flags=re.MULTILINE):
+        lines = [line for line in statement.splitlines() if line.strip() and not line.strip().startswith("--")]
+        if lines:
+            statements.append("\n".join(lines) + ";")
+    return statements
+
+
+def applied_versions(conn):
+    cur = conn.cursor()
+    cur.execute("select to_regclass('schema_migrations') is not null;")
+    if not cur.fetchone()[0]:
+        cur.close()
+        conn.rollback()
+        return set()
+
+    cur.execute("select version from schema_migrations;")
+    versions = {version for (version,) in cur.fetchall()}
+    cur.close()
+    # no transaction left open, a no-transaction script switches the connection to autocommit
+    conn.rollback()
+    return versions
+
+
+def pending_migrations(conn):
+    applied = applied_versions(conn)
+    return [(version, path) for version, path in migrations() if version not in applied]
+
+
+def expected_indexes():
+    return [name for _, path in migrations() for name in INDEX_NAME_RE.findall(read_migration(path))]
+
+
+def missing_indexes(conn):
+    # an index left invalid by a failed CONCURRENTLY build counts as missing, IF NOT EXISTS would skip it
+    cur = conn.cursor()
+    cur.execute("select c.relname from pg_index i join pg_class c on c.oid = i.indexrelid \
+                     where i.indisvalid and c.relname = any(%s);", (expected_indexes(),))
+    present = {name for (name,) in cur.fetchall()}
+    cur.close()
+    conn.rollback()
+    return [name for name in expected_indexes() if name not in present]
+
+
+def check_schema(conn):
+    # startup check, only reports, the migrations are run with "python migrate.py"
+    pending = [version for version, _ in pending_migrations(conn)]
+    missing = missing_indexes(conn)
+
+    if pending:
+        logging.warning(f"SCHEMA has pending migrations: {', '.join(pending)}, run python migrate.py")
+    if missing:
+        logging.warning(f"SCHEMA is missing indexes: {', '.join(missing)}")
+
+    return pending, missing
+
+
+def apply_migration(conn, version, path):
+    script = read_migration(path)
+
+    if script.startswith(NO_TRANSACTION_HEADER):
+        # one statement at a time in autocommit, so a failure only loses the statement it happened in
+        conn.autocommit = True
+        try:
+            cur = conn.cursor()
+            for statement in split_statements(script):
+                cur.execute(statement)
+            cur.execute("insert into schema_migrations (version) values (%s);", (version,))
+            cur.close()
+        finally:
+            conn.autocommit = False
+    else:
+        cur = conn.cursor()
+        cur.execute(script)
+        cur.execute("insert into schema_migrations (version) values (%s);", (version,))
+        cur.close()
+        conn.commit()
+
+    current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
+    logging.info(f"{current_time}---MIGRATION {version} applied successfully")
+
+
+def migrate(conn, baseline=None):
+    cur = conn.cursor()
+    cur.execute(CREATE_SCHEMA_MIGRATIONS_SQL)
+    cur.close()
+    conn.commit()
+
+    for version, path in pending_migrations(conn):
+        if baseline is not None and version.split("_")[0] <= baseline.split("_")[0]:
+            # database set up by hand before migrations/ existed, the script already ran
+            cur = conn.cursor()
+            cur.execute("insert into schema_migrations (version) values (%s);", (version,))
+            cur.close()
+            conn.commit()
+            logging.info(f"MIGRATION {version} marked as applied (baseline)")
+            continue
+
+        apply_migration(conn, version, path)
+
+
+# python migrate.py                  apply every pending script
+# python migrate.py --baseline 0001  existing database, mark 0001_* as applied without running it
+# python migrate.py --status
+def main():
+    parser = argparse.ArgumentParser(description="Apply the versioned scripts in migrations/")
+    parser.add_argument("--baseline", help="mark versions up to this one as applied without running them")
+    parser.add_argument("--status", action="store_true", help="list pending migrations and missing indexes")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
+
+    conn = None
+    try:
+        conn = psycopg2.connect(**settings.database())
+
+        if args.status:
+            pending, missing = check_schema(conn)
+            if not pending and not missing:
+                print("Schema is up to date")
+            return 0
+
+        migrate(conn, args.baseline)
+        return 0
+
+    except (Exception, psycopg2.DatabaseError) as error:
+        logging.exception("Migration failed")
+        print(error, file=sys.stderr)
+        return 1
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,22 @@
+-- migrate: no-transaction
+-- indexes for the foreign keys and filters of 0001, built without locking writes out of the tables
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "history_sale_id_idx" ON "history" ("sale_id");
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "history_share_id_idx" ON "history" ("share_id");
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "drivers_share_purchase_id_idx" ON "drivers_share" ("purchase_id");
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "drivers_share_driver_id_idx" ON "drivers_share" ("driver_id");
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "clients_sales_client_idx" ON "clients_sales" ("client");
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "clients_sales_driver_idx" ON "clients_sales" ("driver");
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "clients_sales_provider_idx" ON "clients_sales" ("provider");
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "providers_purchases_provider_idx" ON "providers_purchases" ("provider");
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "providers_purchases_product_idx" ON "providers_purchases" ("product");
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "clients_work_hours_client_id_idx" ON "clients_work_hours" ("client_id");
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "clients_prices_client_id_idx" ON "clients_prices" ("client_id");
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "clients_future_sales_client_idx" ON "clients_future_sales" ("client");
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "users_login_idx" ON "users" ("login");
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "users_roles_user_id_idx" ON "users_roles" ("user_id");
@@ -0,0 +1,67 @@
+-- what is left of every purchase after the drivers' shares, kept current by triggers for get_warehouse
+
+CREATE TABLE "purchases_stock" (
+	"purchase_id" integer NOT NULL,
+	"remaining_amount" integer NOT NULL,
+	"remaining_weight" float(2) NOT NULL,
+	CONSTRAINT "purchases_stock_pk" PRIMARY KEY ("purchase_id")
+) WITH (
+  OIDS=FALSE
+);
+
+ALTER TABLE "purchases_stock" ADD CONSTRAINT "purchases_stock_fk0" FOREIGN KEY ("purchase_id") REFERENCES "providers_purchases"("id") ON DELETE CASCADE;
+
+CREATE INDEX "purchases_stock_in_stock_idx" ON "purchases_stock" ("purchase_id") WHERE "remaining_amount" > 0;
+
+
+-- recounted from the purchase's own shares (drivers_share_purchase_id_idx), so it can't drift.
+-- the row lock comes first, the recount statement after it then sees shares committed while waiting
+CREATE FUNCTION refresh_purchase_stock(changed_purchase_id integer) RETURNS void AS $$
+BEGIN
+	PERFORM 1 FROM purchases_stock WHERE purchase_id = changed_purchase_id FOR UPDATE;
+
+	INSERT INTO purchases_stock (purchase_id, remaining_amount, remaining_weight)
+		SELECT pp.id,
+		       pp.amount - coalesce((SELECT sum(ds.amount) FROM drivers_share ds WHERE ds.purchase_id = pp.id), 0),
+		       pp.weight - coalesce((SELECT sum(ds.weight) FROM drivers_share ds WHERE ds.purchase_id = pp.id), 0)
+		FROM providers_purchases pp WHERE pp.id = changed_purchase_id
+	ON CONFLICT (purchase_id) DO UPDATE SET remaining_amount = excluded.remaining_amount,
+	                                        remaining_weight = excluded.remaining_weight;
+END;
+$$ LANGUAGE plpgsql;
+
+
+CREATE FUNCTION drivers_share_stock_trigger() RETURNS trigger AS $$
+BEGIN
+	IF TG_OP IN ('UPDATE', 'DELETE') THEN
+		PERFORM refresh_purchase_stock(OLD.purchase_id);
+	END IF;
+	IF TG_OP IN ('INSERT', 'UPDATE') AND (TG_OP = 'INSERT' OR NEW.purchase_id <> OLD.purchase_id) THEN
+		PERFORM refresh_purchase_stock(NEW.purchase_id);
+	END IF;
+	RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER "drivers_share_stock" AFTER INSERT OR UPDATE OF "purchase_id", "amount", "weight" OR DELETE ON "drivers_share"
+	FOR EACH ROW EXECUTE FUNCTION drivers_share_stock_trigger();
+
+
+CREATE FUNCTION providers_purchases_stock_trigger() RETURNS trigger AS $$
+BEGIN
+	PERFORM refresh_purchase_stock(NEW.id);
+	RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER "providers_purchases_stock" AFTER INSERT OR UPDATE OF "amount", "weight" ON "providers_purchases"
+	FOR EACH ROW EXECUTE FUNCTION providers_purchases_stock_trigger();
+
+
+INSERT INTO purchases_stock (purchase_id, remaining_amount, remaining_weight)
+	SELECT pp.id,
+	       pp.amount - coalesce(share.amount, 0),
+	       pp.weight - coalesce(share.weight, 0)
+	FROM providers_purchases pp
+		LEFT JOIN (SELECT purchase_id, sum(amount) AS amount, sum(weight) AS weight FROM drivers_share GROUP BY purchase_id) share
+		ON pp.id = share.purchase_id;
@@ -0,0 +1,35 @@
+-- a change counter per table, bumped once per writing statement, list endpoints build their ETag from it
+
+CREATE TABLE "table_versions" (
+	"table_name" character varying(255) NOT NULL,
+	"version" bigint NOT NULL DEFAULT 0,
+	CONSTRAINT "table_versions_pk" PRIMARY KEY ("table_name")
+) WITH (
+  OIDS=FALSE
+);
+
+
+CREATE FUNCTION bump_table_version() RETURNS trigger AS $$
+BEGIN
+	INSERT INTO table_versions (table_name, version) VALUES (TG_TABLE_NAME, 1)
+	ON CONFLICT (table_name) DO UPDATE SET version = table_versions.version + 1;
+	RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+DO $$
+DECLARE
+	versioned_table text;
+BEGIN
+	FOREACH versioned_table IN ARRAY ARRAY['users', 'users_roles', 'clients', 'providers', 'clients_sales',
+	                                       'providers_purchases', 'drivers_share', 'history', 'clients_work_hours',
+	                                       'clients_future_sales', 'products', 'clients_prices', 'purchases_stock']
+	LOOP
+		INSERT INTO table_versions (table_name) VALUES (versioned_table);
+		EXECUTE format('CREATE TRIGGER %I AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON %I '
+		               'FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()',
+		               versioned_table || '_version', versioned_table);
+	END LOOP;
+END;
+$$;
@@ -0,0 +1,11 @@
+-- every worker LISTENs on table_changed to drop its cached copies, postgres sends it on commit
+-- and folds repeats of the same table within one transaction into one
+
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+BEGIN
+	INSERT INTO table_versions (table_name, version) VALUES (TG_TABLE_NAME, 1)
+	ON CONFLICT (table_name) DO UPDATE SET version = table_versions.version + 1;
+	PERFORM pg_notify('table_changed', TG_TABLE_NAME);
+	RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,51 @@
+-- change tracking for /sync/: every row carries the id of the transaction that last wrote it,
+-- deleted rows leave a tombstone with the id of the deleting transaction
+
+CREATE FUNCTION set_row_version() RETURNS trigger AS $$
+BEGIN
+	NEW.row_version := txid_current();
+	RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+
+CREATE TABLE "sync_tombstones" (
+	"table_name" character varying(255) NOT NULL,
+	"row_id" integer NOT NULL,
+	"row_version" bigint NOT NULL
+) WITH (
+  OIDS=FALSE
+);
+
+CREATE INDEX "sync_tombstones_table_name_row_version_idx" ON "sync_tombstones" ("table_name", "row_version");
+
+
+CREATE FUNCTION add_sync_tombstone() RETURNS trigger AS $$
+BEGIN
+	INSERT INTO sync_tombstones (table_name, row_id, row_version) VALUES (TG_TABLE_NAME, OLD.id, txid_current());
+	RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- rows written before this migration keep version 0, a sync from 0 still returns them
+ALTER TABLE "clients_sales" ADD COLUMN "row_version" bigint NOT NULL DEFAULT 0;
+ALTER TABLE "providers_purchases" ADD COLUMN "row_version" bigint NOT NULL DEFAULT 0;
+ALTER TABLE "drivers_share" ADD COLUMN "row_version" bigint NOT NULL DEFAULT 0;
+ALTER TABLE "history" ADD COLUMN "row_version" bigint NOT NULL DEFAULT 0;
+ALTER TABLE "clients_future_sales" ADD COLUMN "row_version" bigint NOT NULL DEFAULT 0;
+ALTER TABLE "clients_prices" ADD COLUMN "row_version" bigint NOT NULL DEFAULT 0;
+
+CREATE TRIGGER "clients_sales_row_version" BEFORE INSERT OR UPDATE ON "clients_sales" FOR EACH ROW EXECUTE FUNCTION set_row_version();
+CREATE TRIGGER "providers_purchases_row_version" BEFORE INSERT OR UPDATE ON "providers_purchases" FOR EACH ROW EXECUTE FUNCTION set_row_version();
+CREATE TRIGGER "drivers_share_row_version" BEFORE INSERT OR UPDATE ON "drivers_share" FOR EACH ROW EXECUTE FUNCTION set_row_version();
+CREATE TRIGGER "history_row_version" BEFORE INSERT OR UPDATE ON "history" FOR EACH ROW EXECUTE FUNCTION set_row_version();
+CREATE TRIGGER "clients_future_sales_row_version" BEFORE INSERT OR UPDATE ON "clients_future_sales" FOR EACH ROW EXECUTE FUNCTION set_row_version();
+CREATE TRIGGER "clients_prices_row_version" BEFORE INSERT OR UPDATE ON "clients_prices" FOR EACH ROW EXECUTE FUNCTION set_row_version();
+
+CREATE TRIGGER "clients_sales_tombstone" AFTER DELETE ON "clients_sales" FOR EACH ROW EXECUTE FUNCTION add_sync_tombstone();
+CREATE TRIGGER "providers_purchases_tombstone" AFTER DELETE ON "providers_purchases" FOR EACH ROW EXECUTE FUNCTION add_sync_tombstone();
+CREATE TRIGGER "drivers_share_tombstone" AFTER DELETE ON "drivers_share" FOR EACH ROW EXECUTE FUNCTION add_sync_tombstone();
+CREATE TRIGGER "history_tombstone" AFTER DELETE ON "history" FOR EACH ROW EXECUTE FUNCTION add_sync_tombstone();
+CREATE TRIGGER "clients_future_sales_tombstone" AFTER DELETE ON "clients_future_sales" FOR EACH ROW EXECUTE FUNCTION add_sync_tombstone();
+CREATE TRIGGER "clients_prices_tombstone" AFTER DELETE ON "clients_prices" FOR EACH ROW EXECUTE FUNCTION add_sync_tombstone();
@@ -0,0 +1,31 @@
+-- sale and future sale changes for /get_sales_events/, only ids and filter fields so a long comment
+-- can't push the payload over the 8000 byte NOTIFY limit
+
+CREATE FUNCTION notify_sale_event() RETURNS trigger AS $$
+DECLARE
+	changed record;
+	event json;
+BEGIN
+	IF TG_OP = 'DELETE' THEN
+		changed := OLD;
+	ELSE
+		changed := NEW;
+	END IF;
+
+	IF TG_TABLE_NAME = 'clients_sales' THEN
+		event := json_build_object('kind', 'sale', 'op', lower(TG_OP), 'id', changed.id,
+		                           'driver_id', changed.driver, 'client_id', changed.client, 'status', changed.status);
+	ELSE
+		event := json_build_object('kind', 'future_sale', 'op', lower(TG_OP), 'id', changed.id,
+		                           'client_id', changed.client, 'status', changed.status);
+	END IF;
+
+	PERFORM pg_notify('sale_events', event::text);
+	RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER "clients_sales_event" AFTER INSERT OR UPDATE OR DELETE ON "clients_sales"
+	FOR EACH ROW EXECUTE FUNCTION notify_sale_event();
+CREATE TRIGGER "clients_future_sales_event" AFTER INSERT OR UPDATE OR DELETE ON "clients_future_sales"
+	FOR EACH ROW EXECUTE FUNCTION notify_sale_event();
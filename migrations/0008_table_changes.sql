@@ -0,0 +1,40 @@
+-- table_versions had one counter row per table, every writing statement updated it and kept the row locked
+-- until commit, so all writers of a table waited for each other. table_changes is insert-only instead,
+-- a table's version is the sum of its rows. Nothing waits on it, and the sum grows with every commit
+-- whatever order the writers commit in (a sequence's last_value would not, a writer that took the
+-- lower number may commit after a read of the higher one, and that change would never show in the ETag)
+
+CREATE TABLE "table_changes" (
+	"table_name" character varying(255) NOT NULL,
+	"changes" bigint NOT NULL DEFAULT 1
+) WITH (
+  OIDS=FALSE
+);
+
+CREATE INDEX "table_changes_table_name_idx" ON "table_changes" ("table_name");
+
+INSERT INTO table_changes (table_name, changes) SELECT table_name, version FROM table_versions;
+
+
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+BEGIN
+	INSERT INTO table_changes (table_name) VALUES (TG_TABLE_NAME);
+
+	-- now and then the table's rows are folded into one, the ones another writer has locked are skipped
+	IF random() < 0.01 THEN
+		WITH folded AS (
+			DELETE FROM table_changes WHERE ctid = ANY (ARRAY(
+				SELECT ctid FROM table_changes WHERE table_name = TG_TABLE_NAME FOR UPDATE SKIP LOCKED))
+			RETURNING changes
+		)
+		INSERT INTO table_changes (table_name, changes)
+			SELECT TG_TABLE_NAME, sum(changes) FROM folded HAVING count(*) > 0;
+	END IF;
+
+	PERFORM pg_notify('table_changed', TG_TABLE_NAME);
+	RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+DROP TABLE table_versions;
@@ -0,0 +1,43 @@
+-- NOTIFY takes a cluster-wide lock at commit, so table_changed is sent only for the tables
+-- behind the workers' reference cache (cache.py), not on every write to sales or history
+
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+BEGIN
+	INSERT INTO table_changes (table_name) VALUES (TG_TABLE_NAME);
+
+	-- now and then the table's rows are folded into one, the ones another writer has locked are skipped
+	IF random() < 0.01 THEN
+		WITH folded AS (
+			DELETE FROM table_changes WHERE ctid = ANY (ARRAY(
+				SELECT ctid FROM table_changes WHERE table_name = TG_TABLE_NAME FOR UPDATE SKIP LOCKED))
+			RETURNING changes
+		)
+		INSERT INTO table_changes (table_name, changes)
+			SELECT TG_TABLE_NAME, sum(changes) FROM folded HAVING count(*) > 0;
+	END IF;
+
+	RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+CREATE FUNCTION notify_table_changed() RETURNS trigger AS $$
+BEGIN
+	PERFORM pg_notify('table_changed', TG_TABLE_NAME);
+	RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+DO $$
+DECLARE
+	cached_table text;
+BEGIN
+	FOREACH cached_table IN ARRAY ARRAY['users', 'users_roles', 'providers', 'clients', 'products']
+	LOOP
+		EXECUTE format('CREATE TRIGGER %I AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON %I '
+		               'FOR EACH STATEMENT EXECUTE FUNCTION notify_table_changed()',
+		               cached_table || '_changed', cached_table);
+	END LOOP;
+END;
+$$;
@@ -0,0 +1,7 @@
+-- migrate: no-transaction
+-- keyset pagination order of the sales, purchases and future sales lists (pagination.py), these were
+-- at the end of 0001, which "migrate.py --baseline" marks as applied without running it
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "clients_sales_delivery_time_id_idx" ON "clients_sales" ("delivery_time", "id");
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "providers_purchases_delivery_time_id_idx" ON "providers_purchases" ("delivery_time", "id");
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "clients_future_sales_delivery_time_id_idx" ON "clients_future_sales" ("delivery_time", "id");
@@ -0,0 +1,9 @@
+-- migrate: no-transaction
+-- /sync/ reads rows by row_version (0006), the indexes are built without locking writes out of history and sales
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "clients_sales_row_version_idx" ON "clients_sales" ("row_version");
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "providers_purchases_row_version_idx" ON "providers_purchases" ("row_version");
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "drivers_share_row_version_idx" ON "drivers_share" ("row_version");
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "history_row_version_idx" ON "history" ("row_version");
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "clients_future_sales_row_version_idx" ON "clients_future_sales" ("row_version");
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "clients_prices_row_version_idx" ON "clients_prices" ("row_version");
@@ -0,0 +1,32 @@
+-- a status change also carries the status the row had before, so a subscriber filtering on
+-- status=... hears about the rows that leave that status and not only the ones that enter it
+
+CREATE OR REPLACE FUNCTION notify_sale_event() RETURNS trigger AS $$
+DECLARE
+	changed record;
+	old_status text;
+	event json;
+BEGIN
+	IF TG_OP = 'DELETE' THEN
+		changed := OLD;
+	ELSE
+		changed := NEW;
+	END IF;
+
+	IF TG_OP <> 'INSERT' THEN
+		old_status := OLD.status;
+	END IF;
+
+	IF TG_TABLE_NAME = 'clients_sales' THEN
+		event := json_build_object('kind', 'sale', 'op', lower(TG_OP), 'id', changed.id,
+		                           'driver_id', changed.driver, 'client_id', changed.client,
+		                           'status', changed.status, 'old_status', old_status);
+	ELSE
+		event := json_build_object('kind', 'future_sale', 'op', lower(TG_OP), 'id', changed.id,
+		                           'client_id', changed.client, 'status', changed.status, 'old_status', old_status);
+	END IF;
+
+	PERFORM pg_notify('sale_events', event::text);
+	RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
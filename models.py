@@ -0,0 +1,62 @@
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+
+# request bodies, fields and defaults follow the query parameters of the matching single-row endpoints
+class NewPurchase(BaseModel):
+    delivery_time: str
+    provider_id: str
+    product: str
+    amount: int
+    weight: float
+    price_per_kilo: float
+    status: str
+    total_price: Optional[float] = None
+    paid: Optional[float] = None
+    debt: Optional[float] = None
+    comments: Optional[str] = ""
+
+
+class NewSale(BaseModel):
+    delivery_time: str
+    client_id: str
+    provider_id: str
+    driver_id: str
+    status: str
+    paid: float
+    debt: float
+    comments: Optional[str] = ""
+
+
+class NewShare(BaseModel):
+    driver_id: int
+    purchase_id: int
+    amount: int
+    weight: float
+    price_per_kilo: float
+    status: str
+
+
+class NewStory(BaseModel):
+    sale_id: int
+    share_id: int
+    amount: int
+    weight: float
+    price_per_kilo: float
+    total_price: Optional[float] = 0
+
+
+class DeliveryLine(BaseModel):
+    # sold from an existing share, or from a new share of purchase_id for the sale's driver
+    share_id: Optional[int] = None
+    purchase_id: Optional[int] = None
+    amount: int
+    weight: float
+    price_per_kilo: float
+    total_price: Optional[float] = 0
+    share_status: Optional[str] = None
+
+
+class NewDelivery(NewSale):
+    lines: List[DeliveryLine]
@@ -0,0 +1,57 @@
+import base64
+import json
+from datetime import datetime
+
+
+DEFAULT_PAGE_SIZE = 100
+
+
+def encode_cursor(*key):
+    # the sort key of the last row on the page, e.g. (delivery_time, id) or (id,)
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in key]
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(",", ":")).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return [datetime.fromisoformat(value) if isinstance(value, str) else int(value) for value in values]
+    except (ValueError, TypeError):
+        raise Exception("Invalid pagination cursor")
+
+
+def page_filter(columns, cursor, params, has_filter):
+    # keyset condition "(delivery_time, id) > (...)", it walks the index instead of skipping rows like offset
+    values = decode_cursor(cursor)
+    if len(values) != len(columns):
+        raise Exception("Invalid pagination cursor")
+
+    placeholders = []
+    for value in values:
+        params.append(value)
+        placeholders.append(f"${len(params)}")
+
+    return (" and " if has_filter else " where ") + \
+        f"({', '.join(columns)}) > ({', '.join(placeholders)})"
+
+
+def page_order(columns, limit, params):
+    params.append(DEFAULT_PAGE_SIZE if limit is None else limit)
+    return f" order by {', '.join(columns)} limit ${len(params)}"
+
+
+def next_page_cursor(rows_json, limit, *fields):
+    # a full page means there may be more rows after it
+    if not rows_json or len(rows_json) < (DEFAULT_PAGE_SIZE if limit is None else limit):
+        return None
+
+    last_id = next(reversed(rows_json))
+    return encode_cursor(*[rows_json[last_id][field] for field in fields], last_id)
+
+
+def next_page_cursor_from_row(row_count, last_row, limit, *positions):
+    # same cursor as next_page_cursor, taken from the last row tuple, for callers that don't keep the rows
+    if not row_count or row_count < (DEFAULT_PAGE_SIZE if limit is None else limit):
+        return None
+
+    return encode_cursor(*[last_row[position] for position in positions])
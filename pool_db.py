@@ -0,0 +1,238 @@
+import logging
+import threading
+import time
+
+import psycopg2
+from psycopg2 import extensions
+
+from config_db import settings
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, params, min_size=1, max_size=10, max_lifetime=3600.0,
+                 checkout_timeout=5.0, health_check_interval=30.0):
+        if min_size > max_size:
+            raise Exception('Pool min_size {0} is bigger than max_size {1}'.format(min_size, max_size))
+
+        self.params = params
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+
+        self._cond = threading.Condition()
+        # idle connections as (conn, last_used), the newest one is at the end
+        self._idle = []
+        # (created_at, generation) of every open connection, idle or checked out
+        self._info = {}
+        self._size = 0
+        # bumped when the connection params change, older connections are drained
+        self._generation = 0
+        self._closed = False
+
+    def open(self):
+        # fill the pool up to min_size so the first requests don't pay for connecting
+        conns = []
+        with self._cond:
+            missing = max(self.min_size - self._size, 0)
+            self._size += missing
+
+        try:
+            for _ in range(missing):
+                conns.append(self._connect())
+        finally:
+            with self._cond:
+                self._size -= missing - len(conns)
+                now = time.monotonic()
+                self._idle.extend((conn, now) for conn in conns)
+                self._cond.notify_all()
+
+    def reconfigure(self, params, min_size=None, max_size=None, max_lifetime=None,
+                    checkout_timeout=None, health_check_interval=None):
+        with self._cond:
+            if params != self.params:
+                self.params = params
+                self._generation += 1
+
+            self.min_size = self.min_size if min_size is None else min_size
+            self.max_size = self.max_size if max_size is None else max_size
+            self.max_lifetime = self.max_lifetime if max_lifetime is None else max_lifetime
+            self.checkout_timeout = self.checkout_timeout if checkout_timeout is None else checkout_timeout
+            self.health_check_interval = self.health_check_interval if health_check_interval is None \
+                else health_check_interval
+
+            # idle connections on old params go now, checked out ones when they are returned
+            stale = [conn for conn, _ in self._idle if not self._is_current(conn)]
+            self._idle = [(conn, last_used) for conn, last_used in self._idle if self._is_current(conn)]
+            self._cond.notify_all()
+
+        for conn in stale:
+            self._discard(conn)
+
+    def getconn(self):
+        deadline = time.monotonic() + self.checkout_timeout
+
+        while True:
+            conn = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise Exception('Connection pool is closed')
+
+                    if self._idle:
+                        conn, last_used = self._idle.pop()
+                        break
+
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout('No free database connection in {0} seconds'.format(self.checkout_timeout))
+                    self._cond.wait(remaining)
+
+            if conn is None:
+                try:
+                    return self._connect()
+                except BaseException:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+
+            if self._is_healthy(conn, last_used):
+                return conn
+
+            self._discard(conn)
+
+    def putconn(self, conn):
+        if not conn.closed and conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                logging.exception("Could not roll back pooled connection")
+
+        now = time.monotonic()
+
+        with self._cond:
+            reusable = not self._closed \
+                and not conn.closed \
+                and conn.info.transaction_status == extensions.TRANSACTION_STATUS_IDLE \
+                and self._is_current(conn) \
+                and now - self._info.get(id(conn), (now, 0))[0] < self.max_lifetime
+
+            if reusable:
+                self._idle.append((conn, now))
+                self._cond.notify()
+                return
+
+        self._discard(conn)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle = []
+            self._cond.notify_all()
+
+        for conn in idle:
+            self._discard(conn)
+
+    def _connect(self):
+        with self._cond:
+            params, generation = self.params, self._generation
+
+        conn = psycopg2.connect(**params)
+        with self._cond:
+            self._info[id(conn)] = (time.monotonic(), generation)
+        return conn
+
+    def _is_current(self, conn):
+        return self._info.get(id(conn), (0, -1))[1] == self._generation
+
+    def _is_healthy(self, conn, last_used):
+        if conn.closed:
+            return False
+
+        now = time.monotonic()
+        with self._cond:
+            born, _ = self._info.get(id(conn), (now, 0))
+            if not self._is_current(conn) or now - born >= self.max_lifetime:
+                return False
+
+        # only ping connections that sat idle long enough to be cut by a firewall or a server restart
+        if now - last_used < self.health_check_interval:
+            return True
+
+        try:
+            cur = conn.cursor()
+            cur.execute("select 1;")
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            logging.warning("Pooled connection failed health check, reconnecting")
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+        with self._cond:
+            self._info.pop(id(conn), None)
+            self._size -= 1
+            self._cond.notify()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    # every gunicorn worker builds its own pool after fork
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(settings.database(), **settings.pool())
+    return _pool
+
+
+def _reconfigure_pool(new_settings):
+    if _pool is not None:
+        _pool.reconfigure(new_settings.database(), **new_settings.pool())
+
+
+settings.on_reload(_reconfigure_pool)
+
+
+def open_pool():
+    get_pool().open()
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def get_connection():
+    settings.maybe_reload()
+    return get_pool().getconn()
+
+
+def release_connection(conn):
+    if _pool is None:
+        conn.close()
+        return
+    _pool.putconn(conn)
@@ -0,0 +1,26 @@
+import re
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# a number orjson may write differently from json.dumps: with an exponent ("1e17" for "1e+17",
+# "-2.5e-7" for "-2.5e-07") or below 1e-4 without one ("0.00001" for "1e-05"),
+# a string that happens to look like one only costs the slower stdlib path
+_EXPONENT_FLOAT = re.compile(rb'[:,\[]-?(?:\d+(?:\.\d+)?e|0\.0000)')
+
+
+class FastJSONResponse(JSONResponse):
+    # the same bytes as FastAPI's JSONResponse (compact, utf-8, int keys as strings, datetimes as isoformat).
+    # endpoints return it directly with the raw dict, so FastAPI's jsonable_encoder pass is skipped as well
+    def render(self, content):
+        if orjson is not None:
+            body = orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+            if not _EXPONENT_FLOAT.search(body):
+                return body
+        return super().render(jsonable_encoder(content))
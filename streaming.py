@@ -0,0 +1,78 @@
+import json
+import logging
+from contextlib import aclosing
+from datetime import date, datetime
+from time import localtime, strftime
+
+import asyncpg
+from fastapi.responses import StreamingResponse
+
+from async_db import get_async_connection, release_async_connection, iterate_rows
+from pagination import next_page_cursor_from_row
+
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# rows are sent in chunks of about this many bytes, not one write per row
+CHUNK_SIZE = 16 * 1024
+
+
+def wants_ndjson(stream, accept):
+    return stream == "ndjson" or NDJSON_MEDIA_TYPE in (accept or "")
+
+
+def _json_default(value):
+    # same text as jsonable_encoder gives for the non-streaming responses
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps_line(obj):
+    return json.dumps(obj, default=_json_default, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def ndjson_response(sql, args, row_to_json, log_name, limit=None, cursor_positions=None):
+    # one {"id": ..., ...} object per line, written while the cursor is still being read.
+    # a paginated list (cursor_positions are the row positions of its sort key) ends with a {"next_cursor": ...} line
+    async def lines():
+        conn = None
+        chunk = []
+        chunk_size = 0
+        row_count = 0
+        row = None
+        try:
+            conn = await get_async_connection(read_only=True)
+
+            # closed before the connection is released, also when the client goes away halfway,
+            # otherwise its transaction and cursor would be finalized later on a connection back in the pool
+            async with aclosing(iterate_rows(conn, sql, *args)) as rows:
+                async for row in rows:
+                    line = dumps_line({"id": row[0], **row_to_json(row)})
+                    chunk.append(line)
+                    chunk_size += len(line)
+                    row_count += 1
+
+                    if chunk_size >= CHUNK_SIZE:
+                        yield "".join(chunk)
+                        chunk = []
+                        chunk_size = 0
+
+            if cursor_positions is not None:
+                chunk.append(dumps_line({"next_cursor": next_page_cursor_from_row(row_count, row, limit, *cursor_positions)}))
+
+            if chunk:
+                yield "".join(chunk)
+
+            current_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
+            logging.info(f"{current_time}---STREAMED {log_name} successfully")
+
+        except (Exception, asyncpg.PostgresError) as error:
+            # the status line is already sent, so the error goes out as the last line
+            logging.exception("Exception occurred")
+            yield "".join(chunk) + dumps_line({"error": str(error)})
+        finally:
+            if conn is not None:
+                await release_async_connection(conn)
+
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE)
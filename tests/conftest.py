@@ -0,0 +1,35 @@
+import os
+import sys
+
+import psycopg2
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config_db import settings
+
+
+# the database tests run against the [postgresql] server of database.ini in the working directory,
+# with the migrations applied, and are skipped when there is none
+@pytest.fixture
+def db_conn():
+    try:
+        conn = psycopg2.connect(**settings.database())
+    except Exception as error:
+        pytest.skip(f"no test database: {error}")
+
+    yield conn
+
+    conn.rollback()
+    conn.close()
+
+
+# the app with its startup run, pools and listener included, against the same database
+@pytest.fixture
+def api(db_conn):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as client:
+        yield client
@@ -0,0 +1,44 @@
+import pytest
+
+from main import create_new_share
+
+
+def stocked_purchase(cur):
+    cur.execute("select purchase_id from purchases_stock order by purchase_id limit 1;")
+    row = cur.fetchone()
+    if row is None:
+        pytest.skip("no purchases in the test database")
+    return row[0]
+
+
+def allocate(purchase_id, lock, amount=1):
+    return create_new_share(driver_id=1, purchase_id=purchase_id, amount=amount, weight=0.0, price_per_kilo=0.0,
+                            status="new", allocate=True, lock=lock)
+
+
+@pytest.mark.parametrize("lock", ["wait", "nowait", "skip_locked"])
+def test_missing_purchase_is_reported_as_missing(db_conn, lock):
+    assert allocate(-1, lock) == {"error": "There is no purchase -1"}
+
+
+@pytest.mark.parametrize("lock", ["nowait", "skip_locked"])
+def test_purchase_locked_by_another_allocation_is_retried(db_conn, lock):
+    with db_conn.cursor() as cur:
+        purchase_id = stocked_purchase(cur)
+        # held until the fixture rolls back
+        cur.execute("select 1 from purchases_stock where purchase_id = %s for update;", (purchase_id,))
+
+        assert allocate(purchase_id, lock) == {
+            "error": f"Purchase {purchase_id} is being allocated by someone else, try again"
+        }
+
+
+def test_allocation_past_the_stock_is_refused(db_conn):
+    with db_conn.cursor() as cur:
+        purchase_id = stocked_purchase(cur)
+
+    assert allocate(purchase_id, "wait", amount=10 ** 9)["error"].startswith(f"Not enough left of purchase {purchase_id}")
+
+
+def test_unknown_lock(db_conn):
+    assert allocate(1, "later")["error"] == "Unknown lock 'later', expected one of wait, nowait, skip_locked"
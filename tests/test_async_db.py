@@ -0,0 +1,147 @@
+import asyncio
+
+import pytest
+
+import async_db
+from async_db import REPLICA_LAG_SQL, ReadRoutingMiddleware, read_primary, wants_primary
+
+
+@pytest.mark.parametrize("read_from, expected", [
+    ("primary", True),
+    ("Primary", True),
+    (" PRIMARY ", True),
+    ("replica", False),
+    ("", False),
+    (None, False)
+])
+def test_wants_primary(read_from, expected):
+    assert wants_primary(read_from) is expected
+
+
+def run_middleware(headers):
+    seen = []
+
+    async def app(scope, receive, send):
+        seen.append(read_primary.get())
+
+    scope = {"type": "http", "headers": headers}
+    asyncio.run(ReadRoutingMiddleware(app)(scope, None, None))
+    return seen[0]
+
+
+def test_middleware_reads_header_case_insensitively():
+    assert run_middleware([(b"x-read-from", b" Primary")]) is True
+    assert run_middleware([(b"x-read-from", b"replica")]) is False
+    assert run_middleware([]) is False
+    assert read_primary.get() is False
+
+
+def test_replica_lag_is_zero_on_the_primary(db_conn):
+    with db_conn.cursor() as cur:
+        cur.execute(REPLICA_LAG_SQL)
+        assert cur.fetchone()[0] == 0
+
+
+class FakePool:
+    def __init__(self, min_size=1, max_size=10):
+        self.min_size, self.max_size = min_size, max_size
+        self.closed = False
+        self.checked = asyncio.Event()
+        self.answer = asyncio.Event()
+
+    def acquire(self, timeout=None):
+        pool = self
+
+        class Checkout:
+            async def __aenter__(self):
+                pool.checked.set()
+                await pool.answer.wait()
+                return pool
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return Checkout()
+
+    async def fetchval(self, sql):
+        return 0
+
+    async def close(self):
+        self.closed = True
+
+    def get_min_size(self):
+        return self.min_size
+
+    def get_max_size(self):
+        return self.max_size
+
+
+class FakeSettings:
+    def __init__(self, pool_settings, replicas):
+        self._pool, self._replicas = pool_settings, replicas
+
+    def pool(self):
+        return self._pool
+
+    def database(self):
+        return {}
+
+    def replicas(self):
+        return self._replicas
+
+
+def test_lag_check_running_across_a_reload_keeps_the_closed_pool_out(monkeypatch):
+    async def scenario():
+        old_replica = FakePool()
+        monkeypatch.setitem(async_db._replicas, "postgresql_replica", old_replica)
+
+        async def watcher_check():
+            # one round of _watch_replica_lag
+            async with async_db._replicas_lock:
+                await async_db._check_replica_lag()
+
+        check = asyncio.create_task(watcher_check())
+        await old_replica.checked.wait()
+
+        # the reload drops every replica while the check still waits for the old one's answer
+        reload = asyncio.create_task(async_db._reopen_replica_pools({}))
+        await asyncio.sleep(0)
+        old_replica.answer.set()
+        await reload
+        await check
+
+        return old_replica
+
+    monkeypatch.setattr(async_db, "_replicas_lock", asyncio.Lock())
+    old_replica = asyncio.run(scenario())
+
+    assert old_replica.closed
+    assert async_db._replicas == {}
+    assert async_db._healthy_replicas == []
+
+
+def test_reload_with_new_pool_sizes_rebuilds_the_primary_pool(monkeypatch):
+    created = []
+
+    async def create_pool(params, pool_settings=None):
+        created.append(FakePool(pool_settings["min_size"], pool_settings["max_size"]))
+        return created[-1]
+
+    async def scenario():
+        old_pool = FakePool(1, 10)
+        monkeypatch.setattr(async_db, "_pool", old_pool)
+        monkeypatch.setattr(async_db, "_loop", asyncio.get_running_loop())
+
+        async_db._reconfigure_async_pool(FakeSettings({"min_size": 2, "max_size": 20}, {}))
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+        return old_pool
+
+    monkeypatch.setattr(async_db, "_create_pool", create_pool)
+    monkeypatch.setattr(async_db, "_replicas_lock", asyncio.Lock())
+    old_pool = asyncio.run(scenario())
+
+    assert old_pool.closed
+    assert async_db._pool is created[0]
+    assert (async_db._pool.get_min_size(), async_db._pool.get_max_size()) == (2, 20)
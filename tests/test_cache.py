@@ -0,0 +1,55 @@
+import asyncio
+import select
+
+from async_db import read_primary
+from cache import cached, reference_cache
+
+
+def test_cached_refills_from_the_primary_and_keeps_only_responses():
+    calls = []
+
+    @cached("test_cache_table")
+    async def endpoint():
+        calls.append(read_primary.get())
+        return "rendered"
+
+    @cached("test_cache_table")
+    async def failing_endpoint():
+        return {"error": "boom"}
+
+    reference_cache.clear()
+
+    assert asyncio.run(endpoint()) == "rendered"
+    assert asyncio.run(endpoint()) == "rendered"
+    assert calls == [True]
+    assert not read_primary.get()
+
+    reference_cache.invalidate("test_cache_table")
+    asyncio.run(endpoint())
+    assert calls == [True, True]
+
+    asyncio.run(failing_endpoint())
+    hit, _ = reference_cache.get("failing_endpoint")
+    assert not hit
+
+
+def notified_tables(conn):
+    conn.poll()
+    tables = {notify.payload for notify in conn.notifies}
+    conn.notifies.clear()
+    return tables
+
+
+def test_table_changed_is_sent_for_cached_tables_only(db_conn):
+    db_conn.autocommit = True
+    cur = db_conn.cursor()
+    cur.execute("listen table_changed;")
+    try:
+        cur.execute("update providers set name = name where false;")
+        cur.execute("update clients_sales set comments = comments where false;")
+
+        select.select([db_conn], [], [], 1)
+        assert notified_tables(db_conn) == {"providers"}
+    finally:
+        cur.execute("unlisten table_changed;")
+        db_conn.autocommit = False
@@ -0,0 +1,61 @@
+import pytest
+
+from columns import check_format, column_names, next_page_cursor_from_rows
+from pagination import encode_cursor
+
+
+def nested_to_json(row):
+    return {"name": row[1], "owner": {"id": row[2], "address": {"city": row[3]}}, "total": row[4]}
+
+
+def flatten(value, path=()):
+    if isinstance(value, dict):
+        return {name: nested for key, item in value.items() for name, nested in flatten(item, path + (key,)).items()}
+    return {".".join(path): value}
+
+
+def test_column_names_follow_the_row_mapper():
+    assert column_names(nested_to_json) == ["id", "name", "owner.id", "owner.address.city", "total"]
+
+
+def test_check_format():
+    check_format(None, "columns")
+    check_format("columns", "columns", "normalized")
+
+    with pytest.raises(Exception, match="Unknown format 'csv', expected one of: columns, normalized"):
+        check_format("csv", "columns", "normalized")
+
+
+def test_next_page_cursor_from_rows():
+    rows = [(1, "2021-02-01"), (2, "2021-02-02")]
+
+    assert next_page_cursor_from_rows(rows, 2, 1, 0) == encode_cursor("2021-02-02", 2)
+    assert next_page_cursor_from_rows(rows, 3, 1, 0) is None
+    assert next_page_cursor_from_rows([], 2, 1, 0) is None
+
+
+@pytest.mark.parametrize("endpoint, key", [
+    ("/get_all_sales/", "sales"),
+    ("/get_all_purchases/", "purchases"),
+    ("/get_all_shares/", "shares"),
+    ("/get_all_history/", "history")
+])
+def test_columns_format_carries_the_values_of_the_nested_format(api, endpoint, key):
+    nested = api.get(endpoint).json()[key]
+    columnar = api.get(endpoint, params={"format": "columns"}).json()
+
+    assert columnar["columns"][0] == "id"
+    assert len(columnar["rows"]) == len(nested)
+
+    for row in columnar["rows"]:
+        values = dict(zip(columnar["columns"], row))
+        assert flatten(nested[str(values.pop("id"))]) == values
+
+
+def test_columns_format_pages_like_the_nested_format(api):
+    page = api.get("/get_all_sales/", params={"format": "columns", "limit": 1}).json()
+    if not page["rows"]:
+        pytest.skip("no sales in the test database")
+
+    nested_page = api.get("/get_all_sales/", params={"limit": 1}).json()
+    assert page["next_cursor"] == nested_page["next_cursor"]
@@ -0,0 +1,102 @@
+import asyncio
+import zlib
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from compression import CompressionMiddleware, choose_encoding
+
+
+app = FastAPI()
+app.add_middleware(CompressionMiddleware)
+
+
+@app.get("/big")
+def big():
+    return {"rows": ["cheese" * 10] * 500}
+
+
+@app.get("/small")
+def small():
+    return {"rows": []}
+
+
+def ndjson_lines():
+    for id in range(50):
+        yield ('{"id":%d,"name":"cheese"}\n' % id) * 20
+
+
+@app.get("/stream")
+def stream():
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+
+@app.get("/events")
+def events():
+    return StreamingResponse(iter(["data: x\n\n" * 300]), media_type="text/event-stream")
+
+
+client = TestClient(app)
+
+
+def test_choose_encoding():
+    assert choose_encoding("gzip, deflate") == "gzip"
+    assert choose_encoding("gzip;q=0, deflate") is None
+    assert choose_encoding("*;q=1, gzip;q=0") is None
+    assert choose_encoding("*") is not None
+    assert choose_encoding("identity") is None
+    assert choose_encoding("") is None
+
+
+def test_big_response_is_compressed():
+    response = client.get("/big", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert int(response.headers["content-length"]) < len(response.content)
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.json() == big()
+
+
+def test_small_and_unaccepted_responses_still_vary():
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+
+    response = client.get("/big", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.json() == big()
+
+
+def test_event_stream_is_not_compressed():
+    response = client.get("/events", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+
+
+def test_stream_chunks_decode_as_they_arrive():
+    messages = []
+
+    async def receive():
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/stream", "raw_path": b"/stream", "query_string": b"",
+             "root_path": "", "scheme": "http", "server": ("test", 80), "client": ("test", 1), "http_version": "1.1",
+             "asgi": {"version": "3.0"}, "headers": [(b"accept-encoding", b"gzip")]}
+    asyncio.run(asyncio.wait_for(app(scope, receive, send), 10))
+
+    start = dict(messages[0]["headers"])
+    assert start[b"content-encoding"] == b"gzip"
+    assert b"content-length" not in start
+
+    decompressor = zlib.decompressobj(31)
+    decoded = [decompressor.decompress(message["body"]) for message in messages[1:]]
+
+    # every chunk holds whole lines as soon as it is sent, not only once the stream ends
+    assert len(decoded) > 2
+    assert all(chunk.endswith(b"\n") for chunk in decoded[:-1] if chunk)
+    assert b"".join(decoded) == "".join(ndjson_lines()).encode()
+    assert decompressor.eof
@@ -0,0 +1,41 @@
+import psycopg2
+
+from config_db import settings
+from etag import etag_matches
+
+
+def test_etag_matches_weak_and_strong_forms():
+    assert etag_matches('W/"abc"', 'W/"abc"')
+    assert etag_matches('"abc"', 'W/"abc"')
+    assert etag_matches('"x", W/"abc"', 'W/"abc"')
+    assert etag_matches("*", 'W/"abc"')
+    assert not etag_matches('W/"abd"', 'W/"abc"')
+    assert not etag_matches(None, 'W/"abc"')
+
+
+def table_version(cur, table):
+    cur.execute("select coalesce(sum(changes), 0) from table_changes where table_name = %s;", (table,))
+    return cur.fetchone()[0]
+
+
+def test_concurrent_writers_do_not_wait_for_the_version_counter(db_conn):
+    other = psycopg2.connect(**settings.database())
+    cur = db_conn.cursor()
+    other_cur = other.cursor()
+    try:
+        before = table_version(cur, "products")
+        db_conn.rollback()
+
+        cur.execute("insert into products (product_name) values ('etag test a');")
+        # the first transaction is still open, with a row counter this insert would wait for it
+        other_cur.execute("set lock_timeout = '1s';")
+        other_cur.execute("insert into products (product_name) values ('etag test b');")
+        other.commit()
+        db_conn.commit()
+
+        assert table_version(cur, "products") == before + 2
+    finally:
+        db_conn.rollback()
+        cur.execute("delete from products where product_name in ('etag test a', 'etag test b');")
+        db_conn.commit()
+        other.close()
@@ -0,0 +1,39 @@
+import json
+
+from events import EventHub, RESYNC_EVENT, SUBSCRIBER_QUEUE_SIZE, event_matches
+
+
+SALE_DELIVERED = {"kind": "sale", "op": "update", "id": 7, "driver_id": 3, "client_id": 2,
+                  "status": "delivered", "old_status": "in_delivery"}
+
+
+def test_event_matches_status_before_or_after_the_change():
+    assert event_matches(SALE_DELIVERED, {})
+    assert event_matches(SALE_DELIVERED, {"status": "delivered"})
+    assert event_matches(SALE_DELIVERED, {"status": "in_delivery", "driver_id": 3})
+    assert not event_matches(SALE_DELIVERED, {"status": "in_delivery", "driver_id": 4})
+    assert not event_matches(SALE_DELIVERED, {"status": "cancelled"})
+    # old_status only widens the status filter
+    assert not event_matches(SALE_DELIVERED, {"kind": "in_delivery"})
+
+
+def test_publish_fans_out_to_matching_subscribers():
+    hub = EventHub()
+    leaving = hub.subscribe({"status": "in_delivery"})
+    other_driver = hub.subscribe({"driver_id": 4})
+
+    hub.publish(json.dumps(SALE_DELIVERED))
+
+    assert leaving.get_nowait() == SALE_DELIVERED
+    assert other_driver.empty()
+
+
+def test_slow_subscriber_is_asked_to_resync():
+    hub = EventHub()
+    queue = hub.subscribe({})
+
+    for _ in range(SUBSCRIBER_QUEUE_SIZE + 1):
+        hub.publish(json.dumps(SALE_DELIVERED))
+
+    assert queue.qsize() == 1
+    assert queue.get_nowait() is RESYNC_EVENT
@@ -0,0 +1,64 @@
+import pytest
+
+from fieldsets import SALE_FIELDSET, select_fields, split_names
+
+
+def test_split_names():
+    assert split_names("a, b,,c ") == ["a", "b", "c"]
+    assert split_names(None) == []
+
+
+def test_listed_fields_only_select_their_columns_and_joins():
+    sql, row_to_json = select_fields(SALE_FIELDSET, "delivery_time,status,client.name")
+
+    assert sql == "select cs.id, cs.delivery_time, cs.delivery_time, cs.status, s_client.name from clients_sales cs" \
+                  " left join clients s_client on cs.client = s_client.id"
+    assert row_to_json((1, "t", "t", "new", "Shop")) == {"delivery_time": "t", "status": "new", "client": {"name": "Shop"}}
+
+
+def test_without_fields_every_column_and_the_expanded_objects():
+    sql, row_to_json = select_fields(SALE_FIELDSET, expand="driver")
+
+    assert sql.endswith(" from clients_sales cs left join users s_driver on cs.driver = s_driver.id")
+    row = (1, "t") + tuple(range(len(SALE_FIELDSET["fields"]))) + (3, "Driver", "phone")
+    assert row_to_json(row) == {**dict(zip(SALE_FIELDSET["fields"], range(len(SALE_FIELDSET["fields"])))),
+                                "driver": {"id": 3, "name": "Driver", "contacts": "phone"}}
+
+
+def test_nested_expansion_brings_its_parent_first():
+    sql, row_to_json = select_fields(SALE_FIELDSET, "status", "client.default_provider")
+
+    assert sql.index("join clients s_client") < sql.index("join providers def_prov")
+
+    client_fields = SALE_FIELDSET["expansions"]["client"][2]
+    row = (1, "t", "new") + tuple(range(len(client_fields))) + (2, "Prov", "phone", "")
+    assert row_to_json(row) == {"status": "new",
+                                "client": {**dict(zip(client_fields, range(len(client_fields)))),
+                                           "default_provider": {"id": 2, "name": "Prov", "contacts": "phone",
+                                                                "comments": ""}}}
+
+
+def test_a_field_of_a_nested_expansion_joins_without_expanding_the_parent():
+    sql, row_to_json = select_fields(SALE_FIELDSET, "client.default_provider.name")
+
+    assert sql == "select cs.id, cs.delivery_time, def_prov.name from clients_sales cs" \
+                  " left join clients s_client on cs.client = s_client.id" \
+                  " left join providers def_prov on s_client.default_provider = def_prov.id"
+    assert row_to_json((1, "t", "Prov")) == {"client": {"default_provider": {"name": "Prov"}}}
+
+
+def test_a_field_selected_twice_is_read_once():
+    sql, _ = select_fields(SALE_FIELDSET, "client.name,client.name", "client")
+
+    assert sql.count("s_client.name") == 1
+    assert sql.count("left join clients s_client") == 1
+
+
+@pytest.mark.parametrize("fields, expand, message", [
+    ("weight", None, "Unknown field 'weight'"),
+    ("client.weight", None, "Unknown field 'client.weight'"),
+    (None, "history", "Unknown expansion 'history'")
+])
+def test_unknown_names(fields, expand, message):
+    with pytest.raises(Exception, match=message):
+        select_fields(SALE_FIELDSET, fields, expand)
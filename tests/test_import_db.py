@@ -0,0 +1,95 @@
+import io
+
+import pytest
+
+from import_db import import_file, ImportValidationError
+
+
+MARKER = "import_db test"
+
+
+@pytest.fixture
+def sale_refs(db_conn):
+    cur = db_conn.cursor()
+    cur.execute("select (select min(id) from clients), (select min(id) from providers), (select min(id) from users);")
+    refs = cur.fetchone()
+    db_conn.rollback()
+    if None in refs:
+        pytest.skip("the test database needs a client, a provider and a user")
+
+    yield refs
+
+    cur.execute("delete from clients_sales where comments = %s;", (MARKER,))
+    db_conn.commit()
+    cur.close()
+
+
+def imported_sales(db_conn):
+    cur = db_conn.cursor()
+    cur.execute("select client, provider, driver, paid, debt, status from clients_sales where comments = %s order by id;",
+                (MARKER,))
+    rows = cur.fetchall()
+    cur.close()
+    db_conn.rollback()
+    return rows
+
+
+def test_csv_columns_follow_the_header_order(db_conn, sale_refs):
+    client, provider, driver = sale_refs
+    file = io.BytesIO(("status,comments,debt,paid,driver,provider,client,delivery_time\n"
+                       f"new,{MARKER},2.5,1.5,{driver},{provider},{client},2021-03-01 10:00:00\n").encode())
+
+    assert import_file(db_conn, "sales", file) == 1
+    assert imported_sales(db_conn) == [(client, provider, driver, 1.5, 2.5, "new")]
+
+
+def test_csv_rejects_unknown_and_duplicated_columns(db_conn):
+    with pytest.raises(ImportValidationError, match="Unknown columns colour"):
+        import_file(db_conn, "sales", io.BytesIO(b"colour,status\nred,new\n"))
+
+    with pytest.raises(ImportValidationError, match="Duplicated columns paid"):
+        import_file(db_conn, "sales", io.BytesIO(b"paid,paid\n1,2\n"))
+
+
+def test_csv_reports_file_line_numbers(db_conn, sale_refs):
+    client, provider, driver = sale_refs
+    file = io.BytesIO(("delivery_time,client,provider,driver,paid,debt,status,comments\n"
+                       f"2021-03-01 10:00:00,{client},{provider},{driver},0,0,new,{MARKER}\n"
+                       f"2021-03-01 10:00:00,{client},{provider},{driver},0,0,,{MARKER}\n").encode())
+
+    with pytest.raises(ImportValidationError) as error:
+        import_file(db_conn, "sales", file)
+
+    assert error.value.lines == [{"line": 3, "error": "status is empty"}]
+    assert imported_sales(db_conn) == []
+
+
+def test_ndjson_line_numbers_count_blank_lines(db_conn, sale_refs):
+    client, provider, driver = sale_refs
+    sale = (f'"delivery_time": "2021-03-01T10:00:00", "client": {client}, "provider": {provider}, "driver": {driver}, '
+            f'"paid": 0, "debt": 0, "comments": "{MARKER}"')
+    file = io.BytesIO(("{" + sale + ', "status": "new"}\n\n{' + sale + "}\n").encode())
+
+    with pytest.raises(ImportValidationError) as error:
+        import_file(db_conn, "sales", file, "ndjson")
+
+    assert error.value.lines == [{"line": 3, "error": "status is empty"}]
+
+
+def test_ndjson_keys_of_later_lines_are_kept(db_conn, sale_refs):
+    client, provider, driver = sale_refs
+    sale = (f'"delivery_time": "2021-03-01T10:00:00", "client": {client}, "provider": {provider}, "driver": {driver}, '
+            f'"paid": 0, "debt": 0, "status": "new"')
+    file = io.BytesIO(("{" + sale + "}\n{" + sale + f', "comments": "{MARKER}"' + "}\n").encode())
+
+    assert import_file(db_conn, "sales", file, "ndjson") == 2
+
+    cur = db_conn.cursor()
+    cur.execute("select comments from clients_sales where comments in ('', %s) and delivery_time = '2021-03-01 10:00:00' \
+                     order by id desc limit 2;", (MARKER,))
+    comments = [comment for (comment,) in cur.fetchall()]
+    cur.execute("delete from clients_sales where comments = '' and delivery_time = '2021-03-01 10:00:00';")
+    db_conn.commit()
+    cur.close()
+
+    assert comments == [MARKER, ""]
@@ -0,0 +1,68 @@
+import asyncio
+
+from included import INCLUDED, load_included
+
+
+class FakeConnection:
+    # answers the INCLUDED queries from in-memory rows and records the ids asked for
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    async def fetch(self, sql, ids):
+        kind = next(kind for kind, (kind_sql, _, _) in INCLUDED.items() if kind_sql == sql)
+        self.queries.append((kind, ids))
+        return [row for row in self.rows[kind] if row[0] in ids]
+
+
+def test_load_included_follows_references_and_loads_each_entity_once():
+    conn = FakeConnection({
+        "clients": [(1, "Shop", "e", "a", "", "", "cash", 7, 1.5, "", "9-18", "9-18", "9-18", "9-18", "9-18", "-", "-"),
+                    (2, "Cafe", "e", "b", "", "", "card", None, 0, "", None, None, None, None, None, None, None)],
+        "users": [(3, "Driver", "phone")],
+        "providers": [(5, "Dairy", "phone", ""), (7, "Farm", "phone", "")]
+    })
+
+    included = asyncio.run(load_included(conn, clients=[1, 2, 1], users=[3, None], providers=[5]))
+
+    # the client's default provider 7 is loaded with the provider 5 of the rows, in one query
+    assert conn.queries == [("clients", [1, 2]), ("users", [3]), ("providers", [5, 7])]
+    assert included["clients"][1]["default_provider_id"] == 7
+    assert included["clients"][2]["work_hours"]["monday"] is None
+    assert included["users"] == {3: {"name": "Driver", "contacts": "phone"}}
+    assert set(included["providers"]) == {5, 7}
+
+
+def test_load_included_skips_kinds_without_ids():
+    conn = FakeConnection({})
+
+    assert asyncio.run(load_included(conn, clients=[None])) == {}
+    assert conn.queries == []
+
+
+def test_normalized_sales_point_at_the_same_entities_as_the_nested_format(api):
+    nested = api.get("/get_all_sales/").json()["sales"]
+    normalized = api.get("/get_all_sales/", params={"format": "normalized"}).json()
+
+    assert set(normalized["sales"]) == set(nested)
+
+    for sale_id, sale in normalized["sales"].items():
+        expected = nested[sale_id]
+        client = normalized["included"]["clients"][str(sale["client_id"])]
+
+        assert sale["status"] == expected["status"]
+        assert client["name"] == expected["client"]["name"]
+        assert client["work_hours"] == expected["client"]["work_hours"]
+        assert normalized["included"]["providers"][str(sale["provider_id"])]["name"] == expected["provider"]["name"]
+        assert normalized["included"]["users"][str(sale["driver_id"])]["name"] == expected["driver"]["name"]
+
+
+def test_normalized_history_includes_its_sales_and_shares(api):
+    normalized = api.get("/get_all_history/", params={"format": "normalized"}).json()
+
+    for story in normalized["history"].values():
+        assert str(story["sale_id"]) in normalized["included"]["sales"]
+        assert str(story["share_id"]) in normalized["included"]["shares"]
+
+    for share in normalized["included"].get("shares", {}).values():
+        assert str(share["purchase_id"]) in normalized["included"]["purchases"]
@@ -0,0 +1,38 @@
+import re
+
+from migrate import NO_TRANSACTION_HEADER, expected_indexes, migrations, read_migration, split_statements
+
+
+CREATE_TABLE_RE = re.compile(r'create\s+table\s+"?(\w+)"?', re.IGNORECASE)
+INDEX_TABLE_RE = re.compile(r'create\s+(?:unique\s+)?index\s+"?\w+"?\s+on\s+"?(\w+)"?', re.IGNORECASE)
+
+
+def test_split_statements_drops_comments_and_blank_lines():
+    script = f"{NO_TRANSACTION_HEADER}\n-- a comment\n\nCREATE INDEX a ON t (x);\nCREATE INDEX b\n    ON t (y);\n"
+    assert split_statements(script) == ["CREATE INDEX a ON t (x);", "CREATE INDEX b\n    ON t (y);"]
+
+
+def test_indexes_on_existing_tables_are_built_concurrently():
+    # a plain CREATE INDEX in a transaction locks writes out of the table for the whole build,
+    # only tables the same script creates (and that are still empty) may get one
+    for version, path in migrations():
+        script = read_migration(path)
+        if script.startswith(NO_TRANSACTION_HEADER):
+            continue
+
+        created = set(CREATE_TABLE_RE.findall(script))
+        for table in INDEX_TABLE_RE.findall(script):
+            assert table in created, f"{version} indexes {table} outside a no-transaction migration"
+
+
+def test_baseline_script_has_no_later_indexes():
+    # "migrate.py --baseline 0001" skips 0001, anything added to it never reaches existing databases
+    version, path = migrations()[0]
+    assert version == "0001_initial"
+    assert not INDEX_TABLE_RE.findall(read_migration(path))
+
+
+def test_expected_indexes_include_pagination_and_row_version_indexes():
+    indexes = expected_indexes()
+    assert "clients_sales_delivery_time_id_idx" in indexes
+    assert "history_row_version_idx" in indexes
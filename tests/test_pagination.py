@@ -0,0 +1,62 @@
+from datetime import datetime
+
+import pytest
+
+from pagination import (DEFAULT_PAGE_SIZE, decode_cursor, encode_cursor, next_page_cursor, next_page_cursor_from_row,
+                        page_filter, page_order)
+
+
+def test_cursor_round_trip():
+    key = (datetime(2021, 2, 1, 10, 30, 15), 42)
+    assert decode_cursor(encode_cursor(*key)) == list(key)
+    assert decode_cursor(encode_cursor(7)) == [7]
+
+
+@pytest.mark.parametrize("cursor", ["not a cursor", encode_cursor("yesterday"), "W3t9XQ=="])
+def test_invalid_cursor(cursor):
+    with pytest.raises(Exception, match="Invalid pagination cursor"):
+        decode_cursor(cursor)
+
+
+def test_page_filter_and_order_number_their_params_after_the_filters():
+    params = [3]
+    cursor = encode_cursor(datetime(2021, 2, 1), 5)
+
+    where = page_filter(["cs.delivery_time", "cs.id"], cursor, params, True)
+    order = page_order(["cs.delivery_time", "cs.id"], 20, params)
+
+    assert where == " and (cs.delivery_time, cs.id) > ($2, $3)"
+    assert order == " order by cs.delivery_time, cs.id limit $4"
+    assert params == [3, datetime(2021, 2, 1), 5, 20]
+
+
+def test_page_filter_starts_the_where_and_checks_the_key_length():
+    params = []
+    assert page_filter(["h.id"], encode_cursor(9), params, False) == " where (h.id) > ($1)"
+
+    with pytest.raises(Exception, match="Invalid pagination cursor"):
+        page_filter(["h.id"], encode_cursor(datetime(2021, 2, 1), 9), [], False)
+
+
+def test_page_order_defaults_the_page_size():
+    params = []
+    page_order(["id"], None, params)
+    assert params == [DEFAULT_PAGE_SIZE]
+
+
+def test_next_page_cursor_only_after_a_full_page():
+    rows_json = {1: {"delivery_time": datetime(2021, 2, 1)}, 2: {"delivery_time": datetime(2021, 2, 2)}}
+
+    assert next_page_cursor(rows_json, 3, "delivery_time") is None
+    assert next_page_cursor({}, 2, "delivery_time") is None
+    assert decode_cursor(next_page_cursor(rows_json, 2, "delivery_time")) == [datetime(2021, 2, 2), 2]
+
+
+def test_next_page_cursor_from_row_matches_next_page_cursor():
+    last_row = (2, datetime(2021, 2, 2))
+
+    rows_json = {1: {"delivery_time": datetime(2021, 2, 1)}, 2: {"delivery_time": datetime(2021, 2, 2)}}
+
+    assert next_page_cursor_from_row(2, last_row, 2, 1, 0) == next_page_cursor(rows_json, 2, "delivery_time")
+    assert next_page_cursor_from_row(1, last_row, 2, 1, 0) is None
+    assert next_page_cursor_from_row(0, None, None, 0) is None
@@ -0,0 +1,48 @@
+import pytest
+
+from main import PROVIDER_PATCH, SALE_PATCH, patch_rows, update_row
+
+
+def first_id(cur, table):
+    cur.execute(f"select min(id) from {table};")
+    row_id = cur.fetchone()[0]
+    if row_id is None:
+        pytest.skip(f"no {table} rows in the test database")
+    return row_id
+
+
+def test_patch_rejects_unknown_and_empty_changes():
+    assert patch_rows(1, {}, SALE_PATCH, "CLIENT SALE") == {"error": "Nothing to update"}
+    assert patch_rows(1, {"row_version": 1}, SALE_PATCH, "CLIENT SALE")["error"].startswith(
+        "You cannot modify row_version")
+
+
+def test_update_row_reads_the_row_back_like_get_all_sales(db_conn):
+    table, key_column, columns, _, reread = SALE_PATCH[0]
+    with db_conn.cursor() as cur:
+        sale_id = first_id(cur, table)
+        updated = update_row(cur, table, key_column, sale_id, columns, {"comments": "patched", "paid": 5}, reread)
+
+        select_sql, id_column, sale_to_json = reread
+        cur.execute(f"{select_sql} where {id_column} = %s;", (sale_id,))
+        assert updated == {sale_id: sale_to_json(cur.fetchone())}
+
+    assert updated[sale_id]["comments"] == "patched"
+    assert updated[sale_id]["paid"] == 5
+    assert "row_version" not in updated[sale_id]
+
+
+def test_update_row_without_reread_answers_like_the_cell_function(db_conn):
+    table, key_column, columns, _ = PROVIDER_PATCH[0]
+    with db_conn.cursor() as cur:
+        provider_id = first_id(cur, table)
+        updated = update_row(cur, table, key_column, provider_id, columns, {"comments": "patched"})
+
+    assert list(updated[provider_id]) == ["name", "contacts", "comments"]
+    assert updated[provider_id]["comments"] == "patched"
+
+
+def test_update_row_of_a_missing_row(db_conn):
+    table, key_column, columns, _, reread = SALE_PATCH[0]
+    with db_conn.cursor() as cur, pytest.raises(Exception, match="There is no clients_sales row with id -1"):
+        update_row(cur, table, key_column, -1, columns, {"comments": "patched"}, reread)
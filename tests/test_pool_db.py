@@ -0,0 +1,85 @@
+import threading
+
+import pytest
+from psycopg2 import extensions
+
+from config_db import settings
+from pool_db import ConnectionPool, PoolTimeout
+
+
+@pytest.fixture
+def pool(db_conn):
+    pool = ConnectionPool(settings.database(), min_size=1, max_size=2, checkout_timeout=0.2)
+    pool.open()
+    yield pool
+    pool.close()
+
+
+def test_min_size_is_ready_and_a_returned_connection_is_reused(pool):
+    assert pool._size == 1 and len(pool._idle) == 1
+
+    conn = pool.getconn()
+    pool.putconn(conn)
+
+    assert pool.getconn() is conn
+
+
+def test_checkout_waits_for_a_free_connection_and_times_out(pool):
+    first, second = pool.getconn(), pool.getconn()
+
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+
+    # a connection returned while another thread waits goes to that thread
+    threading.Timer(0.05, pool.putconn, (first,)).start()
+    assert pool.getconn() is first
+
+    pool.putconn(first)
+    pool.putconn(second)
+    assert pool._size == 2
+
+
+def test_connection_left_in_a_transaction_is_rolled_back(pool):
+    conn = pool.getconn()
+    conn.cursor().execute("select 1;")
+    assert conn.info.transaction_status == extensions.TRANSACTION_STATUS_INTRANS
+
+    pool.putconn(conn)
+
+    assert conn.info.transaction_status == extensions.TRANSACTION_STATUS_IDLE
+    assert pool.getconn() is conn
+
+
+def test_closed_and_expired_connections_are_replaced(pool):
+    conn = pool.getconn()
+    conn.close()
+    pool.putconn(conn)
+    assert pool._size == 0
+
+    pool.reconfigure(pool.params, max_lifetime=0)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert pool._size == 0 and conn.closed
+
+
+def test_reconfigure_drains_connections_on_the_old_params(pool):
+    idle = pool.getconn()
+    checked_out = pool.getconn()
+    pool.putconn(idle)
+
+    pool.reconfigure(dict(pool.params, application_name="pool test"))
+    assert idle.closed
+
+    pool.putconn(checked_out)
+    assert checked_out.closed
+
+    conn = pool.getconn()
+    assert conn.get_dsn_parameters().get("application_name") == "pool test"
+    pool.putconn(conn)
+
+
+def test_closed_pool_refuses_checkouts(pool):
+    pool.close()
+
+    with pytest.raises(Exception, match="Connection pool is closed"):
+        pool.getconn()
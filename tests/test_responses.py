@@ -0,0 +1,18 @@
+from datetime import datetime
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from responses import FastJSONResponse
+
+
+@pytest.mark.parametrize("content", [
+    {"tiny": 1e-05, "huge": 1e17},
+    {"negative": -2.5e-07, "edge": 1e16, "below": 1e15, "smallest plain": 0.0001},
+    {1: {"price": 3.3, "weight": 12.125, "when": datetime(2021, 2, 1, 10, 30)}, 2: [0.00012, 123456789.5]},
+    {"text": "a:0.00001, [1e5", "amount": 7},
+    {"none": None, "list": [1e-300, -1e300]}
+])
+def test_same_bytes_as_json_response(content):
+    assert FastJSONResponse(content).body == JSONResponse(jsonable_encoder(content)).body
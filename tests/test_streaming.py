@@ -0,0 +1,65 @@
+import asyncio
+import json
+
+import streaming
+from pagination import decode_cursor
+
+
+def fake_database(monkeypatch, rows, events):
+    async def get_async_connection(read_only=False):
+        return "conn"
+
+    async def release_async_connection(conn):
+        events.append("released")
+
+    async def iterate_rows(conn, sql, *args):
+        try:
+            for row in rows:
+                yield row
+        finally:
+            events.append("cursor closed")
+
+    monkeypatch.setattr(streaming, "get_async_connection", get_async_connection)
+    monkeypatch.setattr(streaming, "release_async_connection", release_async_connection)
+    monkeypatch.setattr(streaming, "iterate_rows", iterate_rows)
+
+
+def body_lines(response):
+    async def read():
+        return "".join([chunk async for chunk in response.body_iterator])
+
+    return [json.loads(line) for line in asyncio.run(read()).splitlines()]
+
+
+def test_rows_are_closed_before_the_connection_goes_back_when_the_client_leaves(monkeypatch):
+    events = []
+    fake_database(monkeypatch, [(id, "x") for id in range(10)], events)
+    monkeypatch.setattr(streaming, "CHUNK_SIZE", 1)
+
+    response = streaming.ndjson_response("sql", [], lambda row: {"name": row[1]}, "TEST")
+
+    async def read_first_chunk_and_leave():
+        first = await response.body_iterator.__anext__()
+        await response.body_iterator.aclose()
+        return first
+
+    assert asyncio.run(read_first_chunk_and_leave()) == '{"id":0,"name":"x"}\n'
+    assert events == ["cursor closed", "released"]
+
+
+def test_paginated_stream_ends_with_the_next_cursor(monkeypatch):
+    events = []
+    fake_database(monkeypatch, [(1, "2021-01-01"), (2, "2021-01-02")], events)
+
+    lines = body_lines(streaming.ndjson_response("sql", [], lambda row: {}, "TEST", limit=2, cursor_positions=(0,)))
+
+    assert lines[:2] == [{"id": 1}, {"id": 2}]
+    assert decode_cursor(lines[2]["next_cursor"]) == [2]
+
+    # a page shorter than the limit is the last one
+    lines = body_lines(streaming.ndjson_response("sql", [], lambda row: {}, "TEST", limit=3, cursor_positions=(0,)))
+    assert lines[-1] == {"next_cursor": None}
+
+    # not paginated, no cursor line
+    lines = body_lines(streaming.ndjson_response("sql", [], lambda row: {}, "TEST"))
+    assert lines == [{"id": 1}, {"id": 2}]